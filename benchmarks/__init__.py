@@ -0,0 +1,57 @@
+"""
+Benchmarks for the MyVillage API.
+
+Run them against a database filled by `manage.py seed_village`, e.g.
+
+    python manage.py seed_village --users 10000
+    python -m benchmarks.endpoints --out bench/$(git rev-parse --short HEAD).json
+    python -m benchmarks.compare bench/old.json bench/new.json
+"""
+import math
+import os
+import subprocess
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_village.settings')
+    import django
+    django.setup()
+
+
+def lift_limits():
+    """
+    Put the rate limits and load shedding out of reach: a benchmark is
+    one client sending requests as fast as it can, which is what they
+    are there to stop. The token buckets are still drawn from, so what
+    they cost is part of the numbers.
+    """
+    from django.conf import settings
+    from rest_framework.settings import api_settings
+
+    rates = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+    settings.REST_FRAMEWORK = {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {scope: '1000000/s' for scope in rates},
+    }
+    api_settings.reload()
+    settings.SHED_MAX_IN_FLIGHT = None
+    settings.SHED_MAX_QUEUE_MS = None
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
@@ -0,0 +1,163 @@
+"""
+Throughput of the read endpoints at high concurrency: the sync DRF
+views behind Django's WSGI handler vs the native async views behind
+its ASGI handler.
+
+    python -m benchmarks.async_throughput --concurrency 64 --requests 500
+
+Each mode runs in its own interpreter, with MY_VILLAGE_ASYNC_VIEWS set
+the way wsgi.py/asgi.py would leave it. Sync mode drives the WSGI
+handler from a pool of `concurrency` threads, like a threaded worker;
+async mode keeps `concurrency` requests in flight on one event loop,
+like a single ASGI worker. No server or network is involved, so the
+numbers compare the request handling itself. FAST_LIST_SERIALIZATION
+is switched on in both, so the list endpoints build their JSON the
+same way and only the view machinery differs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import git_revision, lift_limits, percentile, setup_django
+
+ENDPOINTS = ['feed', 'notifications', 'post-detail', 'profile']
+
+
+def targets():
+    """(name, path, headers) for each endpoint, acting as a busy parent."""
+    from django.db.models import Count
+    from django.urls import reverse
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from posts.models import Post
+    from users.models import User
+
+    me = User.objects.filter(role=User.PARENT).annotate(n=Count('following')).order_by('-n').first()
+    therapist = User.objects.filter(role=User.THERAPIST).annotate(n=Count('followers')).order_by('-n').first()
+    if me is None or therapist is None:
+        raise SystemExit('Seed the database first: python manage.py seed_village')
+    post = Post.objects.annotate(n=Count('comments')).order_by('-n').first()
+    headers = {'Authorization': f'Bearer {RefreshToken.for_user(me).access_token}'}
+    return [
+        ('feed', reverse('feed'), headers),
+        ('notifications', reverse('notifications'), headers),
+        ('post-detail', reverse('post-detail', kwargs={'pk': post.pk}), headers),
+        ('profile', reverse('profile', kwargs={'username': therapist.username}), headers),
+    ]
+
+
+def summarize(latencies, elapsed, statuses):
+    return {
+        'requests': len(latencies),
+        'req_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'statuses': sorted(set(statuses)),
+    }
+
+
+def run_sync(path, headers, args):
+    from django.test import Client
+
+    def one(_):
+        # each pool thread is a worker thread with its own connection
+        client = Client()
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, range(args.warmup)))
+        start = time.perf_counter()
+        results = list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    return summarize([r[0] for r in results], elapsed, [r[1] for r in results])
+
+
+def run_async(path, headers, args):
+    from django.test import AsyncClient
+
+    async def main():
+        client = AsyncClient()
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def one():
+            async with limit:
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                return (time.perf_counter() - start) * 1000, response.status_code
+
+        await asyncio.gather(*[one() for _ in range(args.warmup)])
+        start = time.perf_counter()
+        results = await asyncio.gather(*[one() for _ in range(args.requests)])
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(main())
+    return summarize([r[0] for r in results], elapsed, [r[1] for r in results])
+
+
+def worker(args):
+    """Runs inside the per-mode subprocess and prints JSON results."""
+    setup_django()
+    lift_limits()
+    from django.conf import settings
+
+    settings.FAST_LIST_SERIALIZATION = True
+    # the test clients send Host: testserver
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    results = {}
+    for name, path, headers in targets():
+        if args.only and name not in args.only:
+            continue
+        run = run_async if settings.ASYNC_VIEWS else run_sync
+        results[name] = run(path, headers, args)
+    print(json.dumps(results))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--only', nargs='*', choices=ENDPOINTS, help='endpoints to run (default: all)')
+    parser.add_argument('--out', help='write JSON results here (default: stdout)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return worker(args)
+
+    command = [sys.executable, '-m', 'benchmarks.async_throughput', '--worker',
+               '--concurrency', str(args.concurrency), '--requests', str(args.requests),
+               '--warmup', str(args.warmup)]
+    if args.only:
+        command += ['--only', *args.only]
+
+    modes = {}
+    for mode, flag in (('wsgi-sync', '0'), ('asgi-async', '1')):
+        env = dict(os.environ, MY_VILLAGE_ASYNC_VIEWS=flag)
+        out = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        modes[mode] = json.loads(out)
+        for name, r in modes[mode].items():
+            print(f"{mode:10} {name:14} {r['req_per_s']:8.1f} req/s  p50 {r['p50_ms']:8.2f}ms  "
+                  f"p99 {r['p99_ms']:8.2f}ms  {r['statuses']}", file=sys.stderr)
+
+    text = json.dumps({
+        'meta': {'revision': git_revision(), 'concurrency': args.concurrency, 'requests': args.requests},
+        'modes': modes,
+    }, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Compare two benchmark result files written by benchmarks.endpoints.
+
+    python -m benchmarks.compare bench/before.json bench/after.json --threshold 15
+
+Exits with status 1 when any endpoint's p50 got slower by more than
+--threshold percent or now runs more queries.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='allowed p50 slowdown in percent')
+    args = parser.parse_args(argv)
+
+    before, after = load(args.before), load(args.after)
+    print(f"{'endpoint':40} {'p50 before':>11} {'p50 after':>10} {'change':>8} "
+          f"{'p99 before':>11} {'p99 after':>10} {'queries':>9}")
+
+    regressions = []
+    for key in sorted(set(before['endpoints']) | set(after['endpoints'])):
+        old = before['endpoints'].get(key, {})
+        new = after['endpoints'].get(key, {})
+        if 'p50_ms' not in old or 'p50_ms' not in new:
+            print(f"{key:40} {'(only in ' + ('before' if 'p50_ms' in old else 'after') + ')':>11}")
+            continue
+        change = (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+        queries = f"{old['queries']}->{new['queries']}"
+        print(f"{key:40} {old['p50_ms']:11.2f} {new['p50_ms']:10.2f} {change:+7.1f}% "
+              f"{old['p99_ms']:11.2f} {new['p99_ms']:10.2f} {queries:>9}")
+        if change > args.threshold or new['queries'] > old['queries']:
+            regressions.append(key)
+
+    if regressions:
+        print(f"\nregressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
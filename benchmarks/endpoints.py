@@ -0,0 +1,336 @@
+"""
+p50/p99 latency and query counts for every named route in the
+project's urls.py files, measured in process with Django's test client
+against the configured database.
+
+    python -m benchmarks.endpoints --iterations 50 --out bench/results.json
+
+Writes run inside a savepoint that is rolled back after every
+iteration, and the fixtures the run needs are rolled back at the end,
+so the database is left exactly as it was. A route without a case in
+CASES is reported as "skipped" so new endpoints don't go unmeasured
+silently.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import git_revision, lift_limits, percentile, setup_django
+
+# kwargs/data/query are callables taking the Fixtures object;
+# auth is True (the busy parent), 'staff' or False; label names the
+# case in the results when its query changes from run to run; status
+# is the one the case has to answer with (default: any below 400)
+Case = namedtuple('Case', 'method kwargs data query auth label status',
+                  defaults=(None, None, None, True, None, None))
+
+CASES = {
+    'metrics': [Case('GET', auth=False)],
+    'batch': [Case('POST', data=lambda fx: {'requests': [
+        {'path': f'/api/users/profile/{fx.me.username}/'},
+        {'path': '/api/social/feed/'},
+        {'path': '/api/notifications/'},
+        {'path': f'/api/users/{fx.me.username}/following/'},
+    ]})],
+    'register': [Case('POST', data=lambda fx: {
+        'username': 'bench-register', 'email': 'bench@example.com',
+        'password': 'Bench-pass-1234', 'password2': 'Bench-pass-1234', 'role': 'parent',
+    }, auth=False)],
+    'login': [Case('POST', data=lambda fx: {'username': fx.me.username, 'password': fx.password}, auth=False)],
+    'token_refresh': [Case('POST', data=lambda fx: {'refresh': fx.refresh_token}, auth=False)],
+    'profile': [
+        Case('GET', kwargs=lambda fx: {'username': fx.therapist.username}),
+        Case('PATCH', kwargs=lambda fx: {'username': fx.me.username}, data=lambda fx: {'bio': 'benchmarking'}),
+    ],
+    'follow': [Case('POST', kwargs=lambda fx: {'username': fx.therapist.username})],
+    'mute': [Case('POST', kwargs=lambda fx: {'username': fx.stranger.username})],
+    'block': [Case('POST', kwargs=lambda fx: {'username': fx.stranger.username})],
+    'muted': [Case('GET')],
+    'blocked': [Case('GET')],
+    'therapists': [Case('GET')],
+    'autocomplete': [Case('GET', query=lambda fx: {'q': fx.therapist.username[:-2]})],
+    'relationships': [Case('GET', query=lambda fx: {'ids': ','.join(
+        str(pk) for pk in [fx.therapist.pk, *fx.me.following.values_list('pk', flat=True)[:99]]
+    )})],
+    'export-my-data': [Case('GET')],
+    'my-stats': [Case('GET'), Case('GET', query=lambda fx: {'days': 365})],
+    'export-platform': [Case('GET', query=lambda fx: {'type': 'users'}, auth='staff')],
+    'followers': [Case('GET', kwargs=lambda fx: {'username': fx.therapist.username})],
+    'following': [Case('GET', kwargs=lambda fx: {'username': fx.me.username})],
+    'post-list-create': [
+        Case('GET'),
+        Case('GET', query=lambda fx: {'ids': ','.join(map(str, fx.recent_posts))}, label='?ids='),
+        Case('POST', data=lambda fx: {'content': 'Benchmark post about #sleep routines.'}),
+    ],
+    'tag-list': [Case('GET')],
+    'tag-posts': [Case('GET', kwargs=lambda fx: {'name': 'sleep'})],
+    'post-detail': [
+        Case('GET', kwargs=lambda fx: {'pk': fx.popular_post.pk}),
+        Case('PATCH', kwargs=lambda fx: {'pk': fx.my_post.pk}, data=lambda fx: {'content': 'edited'}),
+        Case('DELETE', kwargs=lambda fx: {'pk': fx.my_post.pk}),
+    ],
+    'comment-list-create': [
+        Case('GET', kwargs=lambda fx: {'post_id': fx.popular_post.pk}),
+        Case('GET', kwargs=lambda fx: {'post_id': fx.popular_post.pk}, query=lambda fx: {'top_level': '1'}),
+        Case('POST', kwargs=lambda fx: {'post_id': fx.popular_post.pk}, data=lambda fx: {'content': 'Thanks!'}),
+        Case('POST', kwargs=lambda fx: {'post_id': fx.popular_post.pk},
+             data=lambda fx: {'content': 'Thanks!', 'parent': fx.my_comment.pk}),
+    ],
+    'comment-thread': [Case('GET', kwargs=lambda fx: {'post_id': fx.popular_post.pk, 'pk': fx.my_comment.pk})],
+    'comment-detail': [
+        Case('GET', kwargs=lambda fx: {'post_id': fx.popular_post.pk, 'pk': fx.my_comment.pk}),
+        Case('DELETE', kwargs=lambda fx: {'post_id': fx.popular_post.pk, 'pk': fx.my_comment.pk}),
+    ],
+    'like-post': [Case('POST', kwargs=lambda fx: {'post_id': fx.popular_post.pk})],
+    'feed': [Case('GET'), Case('GET', query=lambda fx: {'since': fx.sync_cursor}, label='?since', status=200)],
+    'search': [Case('GET', query=lambda fx: {'q': 'sleep'})],
+    'trending': [Case('GET'), Case('GET', query=lambda fx: {'therapists': '1'})],
+    'notifications': [Case('GET'), Case('GET', query=lambda fx: {'since': fx.sync_cursor}, label='?since',
+                           status=200)],
+    'notification-read': [Case('POST', kwargs=lambda fx: {'pk': fx.my_notification.pk})],
+    'notifications-read-all': [Case('POST')],
+}
+
+
+def named_routes(patterns=None):
+    """Yield the name of every named route outside the admin site."""
+    from django.urls import URLResolver, get_resolver
+
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace == 'admin':
+                continue
+            yield from named_routes(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+class Fixtures:
+    """
+    The users and objects the cases act on. Busy accounts are picked so
+    the numbers reflect a heavy user rather than an empty one.
+    """
+
+    def __init__(self):
+        from django.db.models import Count
+        from django.utils import timezone as django_timezone
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        from notifications.models import Notification
+        from posts.models import Post, Comment
+        from posts.threads import place
+        from social.stats import roll_up_all
+        from social.trending import trending
+        from users.management.commands.seed_village import SEED_PASSWORD
+        from users.models import User
+
+        parents = User.objects.filter(role=User.PARENT, is_active=True)
+        therapists = User.objects.filter(role=User.THERAPIST, is_active=True)
+        self.me = parents.annotate(n=Count('following')).order_by('-n').first()
+        self.therapist = therapists.annotate(n=Count('followers')).order_by('-n').first()
+        if self.me is None or self.therapist is None:
+            raise SystemExit('Seed the database first: python manage.py seed_village')
+
+        # benchmark logins with a known password; rolled back afterwards
+        self.password = SEED_PASSWORD
+        self.me.set_password(self.password)
+        self.me.save(update_fields=['password'])
+        self.refresh_token = str(RefreshToken.for_user(self.me))
+        self.access_token = str(RefreshToken.for_user(self.me).access_token)
+        staff = User.objects.create_user(username='bench-staff', is_staff=True)
+        # someone to mute and block without changing anyone's feed
+        self.stranger = User.objects.create_user(username='bench-stranger', role=User.PARENT)
+        self.staff_token = str(RefreshToken.for_user(staff).access_token)
+
+        self.popular_post = (
+            Post.objects.exclude(author=self.me)
+            .annotate(n=Count('likes')).order_by('-n').first()
+        )
+        # a client catching up on 50 posts it holds by id
+        self.recent_posts = list(Post.objects.values_list('pk', flat=True)[:50])
+        self.my_post = Post.objects.create(author=self.me, content='Benchmark fixture post')
+        self.my_comment = Comment.objects.create(author=self.me, post=self.popular_post, content='Fixture comment')
+        place(self.my_comment)
+        self.my_notification = Notification.objects.create(
+            recipient=self.me, sender=self.therapist, notification_type=Notification.FOLLOW
+        )
+        self.followed = list(self.me.following.values_list('pk', flat=True))
+        # something to rank: the most liked posts' likes, as if they
+        # had just come in
+        for post_id, likes in (Post.objects.annotate(n=Count('likes')).filter(n__gt=0)
+                               .order_by('-n').values_list('pk', 'n')[:100]):
+            trending.record_like(post_id, likes)
+        trending.flush()
+        # the seeded activity, counted into the stats rollups
+        roll_up_all(django_timezone.now() + timedelta(hours=1))
+        self.reset_cache()
+
+    def reset_cache(self):
+        """
+        Empty the cache before a case. The database is rolled back after
+        each case but the cache isn't, so the delta-sync marks an earlier
+        follow or block case moved would turn the ?since cases into 410s.
+        """
+        from django.core.cache import cache
+        from django.utils import timezone as django_timezone
+
+        from my_village.delta import bump, encode_cursor
+
+        cache.clear()
+        # a delta-sync client that caught up after the fixture writes,
+        # whose feed and notifications haven't changed in the last hour
+        an_hour_ago = django_timezone.now() - timedelta(hours=1)
+        bump('follow', [self.me.pk], an_hour_ago)
+        bump('notification', [self.me.pk], an_hour_ago)
+        bump('post', self.followed, an_hour_ago)
+        self.sync_cursor = encode_cursor(django_timezone.now())
+
+
+class UnexpectedStatus(Exception):
+    pass
+
+
+def run_case(client, fx, name, case, iterations, warmup):
+    from django.db import transaction
+    from django.urls import reverse
+
+    from my_village.metrics import start_query_log, stop_query_log
+
+    path = reverse(name, kwargs=case.kwargs(fx) if case.kwargs else None)
+    data = case.data(fx) if case.data else None
+    query = case.query(fx) if case.query else None
+    token = fx.staff_token if case.auth == 'staff' else fx.access_token
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if case.auth else {}
+
+    latencies, query_counts, status = [], [], None
+    for i in range(warmup + iterations):
+        with transaction.atomic():
+            log, token = start_query_log()
+            start = time.perf_counter()
+            try:
+                if case.method == 'GET':
+                    response = client.get(path, query, **headers)
+                else:
+                    response = client.generic(
+                        case.method, path, json.dumps(data or {}),
+                        content_type='application/json', **headers
+                    )
+                if response.streaming:
+                    # streamed responses do their work as they're read
+                    b''.join(response.streaming_content)
+            finally:
+                elapsed = time.perf_counter() - start
+                stop_query_log(token)
+            transaction.set_rollback(True)
+        status = response.status_code
+        if status != case.status if case.status else status >= 400:
+            # timing an error page says nothing about the endpoint
+            raise UnexpectedStatus(f'{case.method} {path}: {status} {response.content[:200]!r}')
+        if i >= warmup:
+            latencies.append(elapsed * 1000)
+            query_counts.append(log.count)
+
+    return {
+        'method': case.method,
+        'path': path,
+        'status': status,
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'queries': max(query_counts),
+    }
+
+
+def table_counts():
+    from notifications.models import Notification
+    from posts.models import Post, Comment, Like
+    from users.models import User
+
+    return {
+        'users': User.objects.count(),
+        'follows': User.following.through.objects.count(),
+        'posts': Post.objects.count(),
+        'comments': Comment.objects.count(),
+        'likes': Like.objects.count(),
+        'notifications': Notification.objects.count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='URL names to run (default: all)')
+    parser.add_argument('--host', default='localhost', help='Host header, must be in ALLOWED_HOSTS')
+    parser.add_argument('--out', help='write JSON results here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    lift_limits()
+    import django
+    from django.db import connection, transaction
+    from rest_framework.test import APIClient
+
+    client = APIClient(SERVER_NAME=args.host)
+    results = {}
+    with transaction.atomic():
+        fx = Fixtures()
+        for name in named_routes():
+            if args.only and name not in args.only:
+                continue
+            cases = CASES.get(name)
+            if not cases:
+                results[name] = {'skipped': 'no benchmark case'}
+                print(f'{name}: skipped (no benchmark case)', file=sys.stderr)
+                continue
+            for case in cases:
+                key = f'{name} {case.method}'
+                # a second case with the same method (a comment and a
+                # reply, ?top_level=1) gets its own key; the first keeps
+                # the plain one so results stay comparable with old runs
+                if key in results and case.label:
+                    key += f' {case.label}'
+                elif key in results and case.query:
+                    key += ' ?' + '&'.join(f'{k}={v}' for k, v in case.query(fx).items())
+                if key in results:
+                    key += f' #{sum(k.startswith(key) for k in results) + 1}'
+                fx.reset_cache()
+                results[key] = run_case(client, fx, name, case, args.iterations, args.warmup)
+                r = results[key]
+                print(f"{key:40} {r['status']}  p50 {r['p50_ms']:8.2f}ms  p99 {r['p99_ms']:8.2f}ms  "
+                      f"{r['queries']:4} queries", file=sys.stderr)
+        counts = table_counts()
+        transaction.set_rollback(True)
+
+    output = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': args.iterations,
+            'rows': counts,
+        },
+        'endpoints': results,
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
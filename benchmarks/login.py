@@ -0,0 +1,163 @@
+"""
+Login throughput, and what a burst of logins does to the feed.
+
+    python -m benchmarks.login --workers 0 2 --profile pbkdf2 argon2
+
+For each hasher profile and PASSWORD_HASHING_WORKERS value, in one
+process through the WSGI handler, like the threaded workers in
+async_throughput.py:
+
+  * logins: `concurrency` threads log in as fast as they can; logins
+    per second, and per core the hashing can use (the pool's threads,
+    or every core when it hashes on the request threads, workers 0);
+  * feed: p50/p99 of feed reads by `--feed-concurrency` threads, first
+    on their own, then while the logins run.
+
+The argon2 profile needs argon2-cffi and is skipped without it.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+from benchmarks import git_revision, lift_limits, setup_django
+from benchmarks.async_throughput import summarize, targets
+
+USERNAME = 'bench-login'
+PASSWORD = 'bench-login-password'
+
+
+def login_user():
+    from users.models import User
+
+    user, created = User.objects.get_or_create(username=USERNAME)
+    if created:
+        user.set_password(PASSWORD)
+        user.save()
+    return user
+
+
+def timed(client, method, path, **kwargs):
+    start = time.perf_counter()
+    response = getattr(client, method)(path, **kwargs)
+    return (time.perf_counter() - start) * 1000, response.status_code
+
+
+def run_logins(args, stop=None):
+    """Logins by `concurrency` threads: args.logins of them, or until `stop` is set."""
+    from django.test import Client
+    from django.urls import reverse
+
+    path = reverse('login')
+    body = {'username': USERNAME, 'password': PASSWORD}
+
+    def one(_):
+        return timed(Client(), 'post', path, data=body, content_type='application/json')
+
+    def until_stopped(_):
+        results = []
+        while not stop.is_set():
+            results.append(one(None))
+        return results
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        start = time.perf_counter()
+        if stop is None:
+            results = list(pool.map(one, range(args.logins)))
+        else:
+            results = [r for batch in pool.map(until_stopped, range(args.concurrency)) for r in batch]
+        elapsed = time.perf_counter() - start
+    return summarize([r[0] for r in results], elapsed, [r[1] for r in results])
+
+
+def run_feed(path, headers, args):
+    from django.test import Client
+
+    def one(_):
+        return timed(Client(), 'get', path, headers=headers)
+
+    with ThreadPoolExecutor(args.feed_concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(one, range(args.feed_requests)))
+        elapsed = time.perf_counter() - start
+    return summarize([r[0] for r in results], elapsed, [r[1] for r in results])
+
+
+def measure(workers, args, feed):
+    """Logins alone, the feed alone and the feed during logins, at one pool size."""
+    hashing_cores = min(workers or args.concurrency, os.cpu_count() or 1)
+    logins = run_logins(args)
+    logins['per_core'] = round(logins['req_per_s'] / hashing_cores, 1)
+
+    path, headers = feed
+    alone = run_feed(path, headers, args)
+    stop = threading.Event()
+    with ThreadPoolExecutor(1) as background:
+        during = background.submit(run_logins, args, stop)
+        time.sleep(0.2)
+        busy = run_feed(path, headers, args)
+        stop.set()
+        during = during.result()
+    return {'hashing_cores': hashing_cores, 'logins': logins, 'feed': alone,
+            'feed_during_logins': busy, 'logins_during_feed': during}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--profile', nargs='*', default=['pbkdf2'], help='hasher profiles (PASSWORD_HASHER_PROFILES)')
+    parser.add_argument('--workers', nargs='*', type=int, default=[0, max(1, (os.cpu_count() or 2) // 2)],
+                        help='PASSWORD_HASHING_WORKERS values to compare; 0 hashes on the request threads')
+    parser.add_argument('--concurrency', type=int, default=16, help='threads logging in')
+    parser.add_argument('--logins', type=int, default=100, help='measured logins per run')
+    parser.add_argument('--feed-concurrency', type=int, default=8)
+    parser.add_argument('--feed-requests', type=int, default=200)
+    parser.add_argument('--out', help='write JSON results here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    lift_limits()
+    from django.conf import settings
+    from django.test import override_settings
+
+    settings.FAST_LIST_SERIALIZATION = True
+    # the test clients send Host: testserver
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    feed = next((path, headers) for name, path, headers in targets() if name == 'feed')
+    login_user()
+
+    runs = {}
+    for profile in args.profile:
+        if profile == 'argon2' and not find_spec('argon2'):
+            print('argon2: argon2-cffi is not installed, skipped', file=sys.stderr)
+            continue
+        for workers in args.workers:
+            with override_settings(PASSWORD_HASHERS=settings.PASSWORD_HASHER_PROFILES[profile],
+                                   PASSWORD_HASHING_WORKERS=workers):
+                # the first login stores the password the profile's way
+                run_logins(argparse.Namespace(**{**vars(args), 'logins': 1, 'concurrency': 1}))
+                name = f'{profile}/workers={workers}'
+                r = runs[name] = measure(workers, args, feed)
+            print(f"{name:20} {r['logins']['req_per_s']:7.1f} logins/s  {r['logins']['per_core']:6.1f}/core  "
+                  f"feed p50 {r['feed']['p50_ms']:7.2f} -> {r['feed_during_logins']['p50_ms']:7.2f}ms  "
+                  f"p99 {r['feed']['p99_ms']:7.2f} -> {r['feed_during_logins']['p99_ms']:7.2f}ms  "
+                  f"{r['logins']['statuses']}", file=sys.stderr)
+
+    text = json.dumps({
+        'meta': {'revision': git_revision(), 'cpus': os.cpu_count(), 'concurrency': args.concurrency,
+                 'feed_concurrency': args.feed_concurrency},
+        'runs': runs,
+    }, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+CPU time per page of posts: serializer work plus JSON rendering, with
+DRF's JSONRenderer vs the orjson renderer, for the full PostSerializer
+tree and for a sparse ?fields= request.
+
+    python -m benchmarks.render --page-size 10 --pages 20
+
+CPU time is process time, so it includes the Python side of running
+queries but not time spent waiting on the database server.
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks import percentile, setup_django
+
+VARIANTS = [
+    ('full', ''),
+    ('sparse', 'id,content,created_at,author.username,likes_count'),
+    ('ids+text', 'id,content'),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--out', help='write JSON results here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from my_village.metrics import start_query_log, stop_query_log
+    from my_village.renderers import ORJSONRenderer
+    from posts.models import Post
+    from posts.serializers import PostSerializer
+    from users.models import User
+
+    user = User.objects.filter(role=User.PARENT).first()
+    if user is None:
+        raise SystemExit('Seed the database first: python manage.py seed_village')
+    renderers = [('drf-json', JSONRenderer()), ('orjson', ORJSONRenderer())]
+    pages = [
+        list(Post.objects.all()[i * args.page_size:(i + 1) * args.page_size])
+        for i in range(args.pages)
+    ]
+
+    results = {}
+    for variant, fields in VARIANTS:
+        query = {'fields': fields} if fields else {}
+        request = Request(APIRequestFactory().get('/api/posts/', query))
+        request.user = user
+
+        serialize_ms, queries = [], []
+        payloads = []
+        for page in pages:
+            log, token = start_query_log()
+            start = time.process_time()
+            data = PostSerializer(page, many=True, context={'request': request}).data
+            serialize_ms.append((time.process_time() - start) * 1000)
+            stop_query_log(token)
+            queries.append(log.count)
+            payloads.append(data)
+
+        for renderer_name, renderer in renderers:
+            render_ms = []
+            for data in payloads:
+                start = time.process_time()
+                renderer.render(data)
+                render_ms.append((time.process_time() - start) * 1000)
+            total = [s + r for s, r in zip(serialize_ms, render_ms)]
+            key = f'{variant} {renderer_name}'
+            results[key] = {
+                'fields': fields or None,
+                'serialize_p50_ms': round(percentile(serialize_ms, 50), 3),
+                'render_p50_ms': round(percentile(render_ms, 50), 3),
+                'cpu_per_page_p50_ms': round(percentile(total, 50), 3),
+                'cpu_per_page_p99_ms': round(percentile(total, 99), 3),
+                'queries_per_page': max(queries),
+            }
+            r = results[key]
+            print(f"{key:20} serialize {r['serialize_p50_ms']:8.2f}ms  render {r['render_p50_ms']:7.3f}ms  "
+                  f"cpu/page {r['cpu_per_page_p50_ms']:8.2f}ms  {r['queries_per_page']:4} queries",
+                  file=sys.stderr)
+
+    text = json.dumps({'page_size': args.page_size, 'results': results}, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Admin changelists that stay fast on big tables.
+
+Django's changelist runs COUNT(*) twice per page (the filtered count
+for the paginator and the unfiltered "N total" next to the search
+box), and every column that follows a foreign key is a query per row
+unless it's joined in. LargeTableAdmin switches the second count off
+and pages with EstimatedCountPaginator; the per-app admin.py files add
+list_select_related and raw_id_fields for their own relations.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+def estimated_rows(model, using='default'):
+    """
+    The planner's row estimate for the model's table, or None when the
+    database has none (never analyzed, or a backend without one).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'sqlite':
+                # filled in by ANALYZE; the first number is the row count
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts exactly up to ADMIN_EXACT_COUNT_LIMIT rows and stops there.
+    An unfiltered changelist over a bigger table shows the planner's
+    estimate instead, so the page links still reach the end.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        # COUNT(*) over a LIMITed subquery: never reads more than limit rows
+        return queryset.order_by()[:limit].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
@@ -12,5 +12,15 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_village.settings')
+# serve the hot read endpoints with the native async views
+os.environ.setdefault('MY_VILLAGE_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# build what the first requests would otherwise build (my_village/warmup.py)
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_UP_WORKERS:
+    from my_village.warmup import warm_up
+
+    warm_up(connect=settings.WARM_UP_CONNECTIONS)
@@ -0,0 +1,308 @@
+"""
+Native async versions of the hottest read endpoints, for ASGI.
+
+Under ASGI a sync DRF view holds a thread-pool slot for as long as it
+waits on the database. The views built on AsyncReadView serve plain
+JSON GETs on the event loop instead: the rows come from the
+serializer's compiled fast-path plan (see fastpath.py) through the
+async ORM. Views whose sync view serves shared payloads from the read
+cache (a cached_read() method, see cache.py) answer through it
+instead, in a worker thread, since waiting for another request's build
+can't happen on the loop.
+
+Lookups that don't depend on each other (a page's count and its rows,
+a post and its comments) go through together(). The async ORM runs
+every query on the one sync thread, one after another, so awaiting its
+calls with asyncio.gather overlaps nothing; together() runs each
+lookup in a thread of its own, with its own connection, instead.
+
+Everything else is handed to the original DRF view in a worker thread,
+unchanged: writes, the browsable API, ?fields=/?expand= requests,
+?since= delta syncs, and anything that ends in an error response (bad
+tokens, 404s, pages out of range, rate limits), so errors look exactly
+as they always have.
+
+Which class serves a route is picked at import time by read_view():
+the async one when ASYNC_VIEWS is on (asgi.py turns it on), otherwise
+the sync DRF view, which is the cheaper choice under WSGI.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .cache import read_cache_enabled
+from .delta import CURSOR_HEADER, DeltaSyncMixin, cursor_for
+from .fastpath import plan_for
+from .fieldsets import requested_fieldset
+
+
+class Fallback(Exception):
+    """Raised by get_data() to let the sync DRF view answer instead."""
+
+
+def read_view(view_class):
+    """The view function for a route: async or sync, per ASYNC_VIEWS."""
+    if getattr(settings, 'ASYNC_VIEWS', False):
+        return view_class.as_view()
+    return view_class.sync_view.as_view()
+
+
+class AsyncReadView(View):
+    """
+    Subclasses set `sync_view` to the DRF view they speed up and
+    implement get_data(). `allow_anonymous` mirrors the sync view's
+    permission for GET.
+    """
+    sync_view = None
+    allow_anonymous = False
+    # set once allowed() has taken this request's tokens
+    charged = False
+    http_method_names = ['get', 'post', 'put', 'patch', 'delete', 'head', 'options']
+    # there are no per-method handlers for Django to inspect, only the
+    # async dispatch() below
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # like DRF's views: JWT auth only, so no CSRF checks
+        view = super().as_view(**initkwargs)
+        view.cls = cls
+        return csrf_exempt(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or requested_fieldset(request) or 'since' in request.GET:
+            return await self.fallback(request, *args, **kwargs)
+        renderer = self.negotiate(request)
+        if renderer is None:
+            return await self.fallback(request, *args, **kwargs)
+        user = await self.authenticate(request)
+        if user is None:
+            return await self.fallback(request, *args, **kwargs)
+        request.user = user
+        if not await sync_to_async(self.allowed)(request, *args, **kwargs):
+            return await self.fallback(request, *args, **kwargs)
+        self.charged = True
+
+        started = timezone.now()
+        try:
+            if hasattr(self.sync_view, 'cached_read') and read_cache_enabled(request):
+                data = await sync_to_async(self.cached_read)(request, *args, **kwargs)
+            else:
+                data = await self.get_data(request, *args, **kwargs)
+        except Fallback:
+            return await self.fallback(request, *args, **kwargs)
+        response = self.render(request, renderer, data)
+        if issubclass(self.sync_view, DeltaSyncMixin):
+            response[CURSOR_HEADER] = cursor_for(started)
+        return response
+
+    async def get_data(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def cached_read(self, request, *args, **kwargs):
+        """The sync view's answer from the read cache (cache.py)."""
+        # in a worker thread: waiting for another request's build
+        # mustn't hold up the event loop
+        try:
+            data = self.drf_view(request, *args, **kwargs).cached_read()
+        except APIException:
+            raise Fallback()
+        if data is None:
+            raise Fallback()
+        return data
+
+    async def fallback(self, request, *args, **kwargs):
+        # a request that got past allowed() has paid already: the sync
+        # view mustn't take a second token for it
+        initkwargs = {'throttle_classes': ()} if self.charged else {}
+        return await sync_to_async(self.sync_view.as_view(**initkwargs))(request, *args, **kwargs)
+
+    # -- the parts of APIView this needs ---------------------------------
+
+    def negotiate(self, request):
+        # same choice DRF would make; anything but a JSON renderer
+        # (browsable API, ?format=, 406s) goes to the sync view
+        renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+        try:
+            renderer, media_type = DefaultContentNegotiation().select_renderer(Request(request), renderers)
+        except NotAcceptable:
+            return None
+        if not isinstance(renderer, JSONRenderer):
+            return None
+        request.accepted_media_type = media_type
+        return renderer
+
+    async def authenticate(self, request):
+        """The JWT user, AnonymousUser, or None when DRF should answer."""
+        # JWTAuthentication.authenticate(), with only the user lookup
+        # leaving the event loop
+        auth = JWTAuthentication()
+        header = auth.get_header(request)
+        raw_token = auth.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return AnonymousUser() if self.allow_anonymous else None
+        try:
+            token = auth.get_validated_token(raw_token)
+            return await sync_to_async(auth.get_user)(token)
+        except AuthenticationFailed:
+            return None
+
+    def allowed(self, request, *args, **kwargs):
+        """Whether the sync view's throttles let the request through."""
+        # a throttled request falls back, and the sync view's own check
+        # answers the 429 (denials don't use up a token)
+        view = self.drf_view(request, *args, **kwargs)
+        return all(throttle.allow_request(view.request, view) for throttle in view.get_throttles())
+
+    def drf_view(self, request, *args, **kwargs):
+        """
+        An instance of the sync view bound to this request, for its
+        get_queryset() and get_serializer_context(). Building the view
+        doesn't touch the database, so this is safe on the event loop.
+        """
+        drf_request = Request(request)
+        drf_request.user = request.user
+        return self.sync_view(request=drf_request, args=args, kwargs=kwargs, format_kwarg=None)
+
+    def render(self, request, renderer, data):
+        renderer_context = {'view': self, 'request': request, 'response': None}
+        content = renderer.render(data, request.accepted_media_type, renderer_context)
+        response = HttpResponse(content, content_type=renderer.media_type)
+        view = self.sync_view()
+        view.setup(request)  # adds head(), as as_view() does
+        response['Allow'] = ', '.join(view.allowed_methods)
+        if len(api_settings.DEFAULT_RENDERER_CLASSES) > 1:
+            patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class AsyncListView(AsyncReadView):
+    """
+    Page of a sync ListAPIView's queryset, paginated exactly like
+    PageNumberPagination. The count and the page rows are independent
+    queries, so they run together.
+    """
+
+    async def get_data(self, request, *args, **kwargs):
+        view = self.drf_view(request, *args, **kwargs)
+        plan = plan_for(view.get_serializer_class())
+        if plan is None:
+            raise Fallback()
+        context = view.get_serializer_context()
+        # in a worker thread: get_queryset() may read the cache, or the
+        # database on a miss (the feed's exclusion set)
+        queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+        rows = plan.values_queryset(queryset, context)
+
+        paginator = view.paginator
+        if paginator is None:
+            return await plan.aassemble(await aslice(rows), context)
+        page_size = paginator.get_page_size(view.request)
+        if page_size is None:
+            return await plan.aassemble(await aslice(rows), context)
+        try:
+            number = int(request.GET.get(paginator.page_query_param, 1))
+        except ValueError:
+            raise Fallback()
+        if number < 1:
+            raise Fallback()
+
+        offset = (number - 1) * page_size
+        count, page = await together(
+            (queryset.count,),
+            (list, rows[offset:offset + page_size]),
+        )
+        # Django's Paginator: page 1 always exists, others must have rows
+        if number > 1 and not page:
+            raise Fallback()
+        results = await plan.aassemble(page, context)
+
+        url = request.build_absolute_uri()
+        next_url = None
+        if offset + page_size < count:
+            next_url = replace_query_param(url, paginator.page_query_param, number + 1)
+        previous_url = None
+        if number > 1:
+            previous_url = (
+                remove_query_param(url, paginator.page_query_param) if number == 2
+                else replace_query_param(url, paginator.page_query_param, number - 1)
+            )
+        return {'count': count, 'next': next_url, 'previous': previous_url, 'results': results}
+
+
+class AsyncDetailView(AsyncReadView):
+    """
+    One object of a sync RetrieveAPIView. When the object is looked
+    up by primary key, its nested lists (a post's comments) don't
+    depend on the object row and are fetched alongside it.
+    """
+
+    async def get_data(self, request, *args, **kwargs):
+        view = self.drf_view(request, *args, **kwargs)
+        plan = plan_for(view.get_serializer_class())
+        if plan is None:
+            raise Fallback()
+        context = view.get_serializer_context()
+        lookup = {view.lookup_field: kwargs[view.lookup_url_kwarg or view.lookup_field]}
+        rows = plan.values_queryset(view.filter_queryset(view.get_queryset()).filter(**lookup), context)
+
+        by_pk = view.lookup_field in ('pk', plan.model._meta.pk.name)
+        try:
+            if plan.many and by_pk:
+                ids = [lookup[view.lookup_field]]
+                row, *children = await together(
+                    (rows.get,),
+                    *[(child.grouped_by, fk, ids, context) for key, child, fk in plan.many],
+                )
+            else:
+                row, children = await rows.aget(), None
+        except plan.model.DoesNotExist:
+            # the sync view renders the 404
+            raise Fallback()
+        items = await plan.aassemble([row], context, children)
+        return items[0]
+
+
+async def together(*calls):
+    """
+    The results of independent lookups, each a (func, *args) of blocking
+    ORM code, run at the same time in threads of their own. Inside a
+    transaction (ATOMIC_REQUESTS, tests) the other connections couldn't
+    see its rows, so there they take turns on the sync thread, as a
+    batch's reads do (batch.py).
+    """
+    if len(calls) > 1 and not await sync_to_async(lambda: connection.in_atomic_block)():
+        return await asyncio.gather(*[
+            sync_to_async(_closing, thread_sensitive=False)(func, *args) for func, *args in calls
+        ])
+    return [await sync_to_async(func)(*args) for func, *args in calls]
+
+
+def _closing(func, *args):
+    try:
+        return func(*args)
+    finally:
+        # the thread opened a connection of its own
+        connections.close_all()
+
+
+async def aslice(queryset, start=None, stop=None):
+    if start is not None or stop is not None:
+        queryset = queryset[start:stop]
+    # see ValuesPlan.agrouped_by() for why this isn't aiterator()
+    return [row async for row in queryset]
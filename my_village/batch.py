@@ -0,0 +1,229 @@
+"""
+POST /api/batch/ — several API calls in one round trip.
+
+    {"requests": [
+        {"method": "GET", "path": "/api/users/profile/jane/"},
+        {"method": "GET", "path": "/api/social/feed/"},
+        {"method": "POST", "path": "/api/notifications/read-all/"},
+        {"method": "GET", "path": "/api/notifications/?page=2"}
+    ]}
+
+The answer lists one {"status", "headers", "body"} per sub-request, in
+order. The JWT is checked once for the whole batch and each sub-request
+is handed the user directly.
+
+Sub-requests go straight to their view: they don't pass through the
+middleware stack again, and they show up in /metrics as part of the
+batch. Within a batch:
+
+  * runs of consecutive GETs are served concurrently, in up to
+    BATCH_MAX_CONCURRENCY threads, unless the batch runs inside a
+    transaction whose data other connections couldn't see;
+  * any other method is a barrier: it runs alone, after everything
+    before it and before everything after it;
+  * sub-requests are rate limited as if they came on their own, and
+    turned away with a 503 while the worker sheds load (shedding.py);
+  * memoized() lookups are shared by all sub-requests, so the same user
+    (get_user_or_404, profile_payload) or exclusion set (excluded_ids)
+    isn't fetched once per call. Writes clear the memo.
+
+There is no general query cache: only the lookups routed through
+memoized() are shared. Post payloads are shared through the read cache
+(cache.py) anyway, and the feed's follow list is a subquery of its page
+query, so sharing it would cost an extra query rather than save one.
+"""
+import contextvars
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.db import connection, connections
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .renderers import orjson
+from .shedding import shed_response, sheds
+
+# the current batch's lookups, shared by its sub-requests
+_batch_memo = contextvars.ContextVar('batch_memo', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+ALLOWED_METHODS = ('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE')
+# sub-response headers worth passing back to the client
+FORWARDED_HEADERS = ('Content-Type', 'Location', 'Allow', 'Retry-After')
+
+
+def memoized(key, compute):
+    """
+    compute(), remembered under `key` for the rest of the current batch.
+    Outside a batch it just calls compute().
+    """
+    memo = _batch_memo.get()
+    if memo is None:
+        return compute()
+    try:
+        return memo[key]
+    except KeyError:
+        value = memo[key] = compute()
+        return value
+
+
+class SubRequest(HttpRequest):
+    """A sub-request, with the batch request's host and scheme."""
+
+    def __init__(self, parent, method, path, body):
+        super().__init__()
+        path_info, _, query = path.partition('?')
+        self.method = method
+        self.path = self.path_info = path_info
+        self.GET = QueryDict(query)
+        self.META = {
+            key: value for key, value in parent.META.items()
+            if key.startswith('HTTP_') or key in ('SERVER_NAME', 'SERVER_PORT', 'REMOTE_ADDR')
+        }
+        self.META.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            # bodies are embedded in the batch's JSON, never browsable HTML
+            'HTTP_ACCEPT': 'application/json',
+        })
+        self._stream = io.BytesIO(body)
+        self._read_started = False
+        self._parent_scheme = parent.scheme
+
+    def _get_scheme(self):
+        return self._parent_scheme
+
+
+def _loads(content):
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+
+class BatchView(APIView):
+    # one login check for the whole batch; sub-requests get the user
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        specs = request.data.get('requests') if isinstance(request.data, dict) else None
+        max_requests = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+        if not isinstance(specs, list) or not specs:
+            return Response({"error": "Send a non-empty \"requests\" list."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(specs) > max_requests:
+            return Response({"error": f"A batch holds at most {max_requests} requests."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # the batch user is the first entry in the identity map
+        memo = {('user', request.user.username): request.user}
+        token = _batch_memo.set(memo)
+        try:
+            responses = self.run(request, specs, memo)
+        finally:
+            _batch_memo.reset(token)
+        return Response({"responses": responses})
+
+    def run(self, request, specs, memo):
+        results = [None] * len(specs)
+        # other connections can't see uncommitted rows, so inside a
+        # transaction (ATOMIC_REQUESTS, tests) everything stays on this one
+        concurrent = not connection.in_atomic_block
+        reads = []
+        for index, spec in enumerate(specs):
+            method = str(spec.get('method', 'GET')).upper() if isinstance(spec, dict) else None
+            if method in SAFE_METHODS:
+                reads.append(index)
+                continue
+            self.run_reads(request, specs, reads, results, concurrent)
+            reads = []
+            memo.clear()
+            results[index] = self.call(request, spec)
+            memo.clear()
+        self.run_reads(request, specs, reads, results, concurrent)
+        return results
+
+    def run_reads(self, request, specs, indexes, results, concurrent):
+        if len(indexes) < 2 or not concurrent:
+            for index in indexes:
+                results[index] = self.call(request, specs[index])
+            return
+        workers = min(len(indexes), getattr(settings, 'BATCH_MAX_CONCURRENCY', 4))
+        with ThreadPoolExecutor(workers) as pool:
+            # each thread runs in a copy of this context, so it sees the
+            # same memo (and the request's query log)
+            futures = [
+                pool.submit(contextvars.copy_context().run, self.call_in_thread, request, specs[index])
+                for index in indexes
+            ]
+            for index, future in zip(indexes, futures):
+                results[index] = future.result()
+
+    def call_in_thread(self, request, spec):
+        try:
+            return self.call(request, spec)
+        finally:
+            # worker threads open their own connections
+            connections.close_all()
+
+    def call(self, request, spec):
+        if not isinstance(spec, dict):
+            return self.error(status.HTTP_400_BAD_REQUEST, 'Each request must be an object.')
+        method = str(spec.get('method', 'GET')).upper()
+        path = spec.get('path')
+        if method not in ALLOWED_METHODS:
+            return self.error(status.HTTP_405_METHOD_NOT_ALLOWED, f'Method {method} not allowed.')
+        if not isinstance(path, str) or not path.startswith('/api/'):
+            return self.error(status.HTTP_400_BAD_REQUEST, 'path must start with /api/.')
+
+        try:
+            match = resolve(path.partition('?')[0])
+        except Resolver404:
+            return self.error(status.HTTP_404_NOT_FOUND, 'Not found.')
+        if getattr(match.func, 'cls', None) is type(self):
+            return self.error(status.HTTP_400_BAD_REQUEST, 'Batches cannot be nested.')
+        # the batch got past load shedding as a write; its reads are
+        # held to the same rules as when they come on their own
+        if sheds(match.func, method, getattr(request._request, 'overload', 0)):
+            return self.describe(shed_response())
+
+        body = b'' if spec.get('body') is None else json.dumps(spec['body']).encode()
+        sub = SubRequest(request._request, method, path, body)
+        sub.resolver_match = match
+        # DRF's hook for pre-authenticated requests: the JWT was already
+        # checked for the batch, so skip it here
+        sub.user = sub._force_auth_user = request.user
+        sub._force_auth_token = request.auth
+
+        view = match.func
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        response = view(sub, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return self.describe(response)
+
+    def describe(self, response):
+        if response.streaming:
+            return self.error(status.HTTP_400_BAD_REQUEST, 'Streaming responses cannot be batched.')
+        content_type = response.get('Content-Type', '')
+        if not response.content:
+            body = None
+        elif content_type.startswith('application/json'):
+            body = _loads(response.content)
+        else:
+            body = response.content.decode(response.charset or 'utf-8', errors='replace')
+        return {
+            "status": response.status_code,
+            "headers": {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)},
+            "body": body,
+        }
+
+    def error(self, status_code, message):
+        return {"status": status_code, "headers": {}, "body": {"error": message}}
@@ -0,0 +1,233 @@
+"""
+Read-through caching with single flight and stale-while-revalidate.
+
+    values = cached_many(keys, build_many)
+
+serves the payloads that look the same to every reader — posts, for
+the detail view and the feed (posts/payloads.py), and profiles
+(users/payloads.py) — out of the cache. build_many(keys) returns
+{key: (value, deps)}, where deps name what the value was built from,
+e.g. [('post', 12), ('user', 3)]. Writes call touch() for what they
+change (each app's signals.py). An entry is fresh for READ_CACHE_SECONDS
+after it was built, unless one of its deps was touched since; stale, it
+is kept READ_CACHE_STALE_SECONDS longer.
+
+A missing entry is built once, however many requests want it at the
+same time (single flight):
+
+  * threads of the same worker wait on the builder's flight and are
+    handed its result, or its exception;
+  * other workers find the builder's lock in the cache and poll for
+    the result, for up to SINGLE_FLIGHT_WAIT_SECONDS, then build it
+    themselves (the lock may belong to a worker that died).
+
+A stale entry is rebuilt by whichever request takes its lock, while
+every other request is served the stale value meanwhile. So when a like
+makes a viral post stale, one request rebuilds it, and the hundreds of
+requests that arrive meanwhile get the old like count, not a database
+query each.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .fieldsets import requested_fieldset
+
+# polls for another worker's build start this far apart, then back off
+POLL_SECONDS = 0.005
+
+
+def read_cache_enabled(request=None):
+    """Whether the shared read payloads should serve this request."""
+    return bool(getattr(settings, 'READ_CACHE_SECONDS', 30)) and not requested_fieldset(request)
+
+
+class SharedRequest:
+    """
+    The request as nobody in particular sees it, for building shared
+    payloads: absolute URLs still come out right, per-user fields don't.
+    """
+    user = AnonymousUser()
+
+    def __init__(self, request):
+        self._request = request
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+
+def stamp_key(kind, pk):
+    return f'changed:{kind}:{pk}'
+
+
+def lock_key(key):
+    return f'{key}:building'
+
+
+def _lifetime():
+    return getattr(settings, 'READ_CACHE_SECONDS', 30) + getattr(settings, 'READ_CACHE_STALE_SECONDS', 300)
+
+
+def touch(kind, ids):
+    """
+    Make everything built from (kind, id) stale, for each of the ids.
+    Inside a transaction it's done again on commit, for builds that
+    read the old rows in the meantime.
+    """
+    keys = [stamp_key(kind, pk) for pk in set(ids)]
+    if not keys:
+        return
+
+    def stamp():
+        cache.set_many(dict.fromkeys(keys, time.time()), _lifetime())
+
+    stamp()
+    if connection.in_atomic_block:
+        transaction.on_commit(stamp)
+
+
+class _Flight:
+    """One in-process build of a key, for other threads to wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.found = False
+        self.value = None
+        self.error = None
+
+    def land(self, built):
+        if built is not None:
+            self.found, self.value = True, built[0]
+        self.done.set()
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def cached(key, build):
+    """cached_many() for one key; build() returns (value, deps) or None."""
+    def build_many(keys):
+        built = build()
+        return {} if built is None else {key: built}
+    return cached_many([key], build_many).get(key)
+
+
+def cached_many(keys, build_many):
+    """
+    {key: value} for the keys. Keys build_many() leaves out of its
+    answer (the object is gone) are left out of the result as well.
+    Values may be shared with other threads: copy before changing them.
+    """
+    now = time.time()
+    entries = cache.get_many(keys)
+    deps = {stamp_key(*dep) for _, _, entry_deps in entries.values() for dep in entry_deps}
+    stamps = cache.get_many(list(deps)) if deps else {}
+    fresh_for = getattr(settings, 'READ_CACHE_SECONDS', 30)
+
+    results, stale, missing = {}, [], []
+    for key in keys:
+        if key not in entries:
+            missing.append(key)
+            continue
+        value, built_at, entry_deps = entries[key]
+        results[key] = value
+        if now >= built_at + fresh_for or any(
+            stamps.get(stamp_key(*dep), 0) >= built_at for dep in entry_deps
+        ):
+            stale.append(key)
+
+    # stale entries: the request that gets the lock rebuilds, the others
+    # keep the value they already have
+    lock_seconds = getattr(settings, 'SINGLE_FLIGHT_LOCK_SECONDS', 10)
+    rebuild = [key for key in stale if cache.add(lock_key(key), 1, lock_seconds)]
+    # missing ones: one flight per key in this worker, one lock across them
+    leading, following = {}, {}
+    with _flights_lock:
+        for key in dict.fromkeys(missing):
+            if key in _flights:
+                following[key] = _flights[key]
+            else:
+                leading[key] = _flights[key] = _Flight()
+    locked = [key for key in leading if cache.add(lock_key(key), 1, lock_seconds)]
+    elsewhere = [key for key in leading if key not in locked]
+
+    built = {}
+    try:
+        built.update(_build(rebuild + locked, build_many))
+        # keys another worker is building: wait for its result
+        if elsewhere:
+            landed = _poll(elsewhere)
+            built.update(landed)
+            late = [key for key in elsewhere if key not in landed]
+            if late:
+                built.update(_build(late, build_many))
+    except BaseException as exc:
+        for flight in leading.values():
+            flight.error = exc
+        raise
+    finally:
+        with _flights_lock:
+            for key, flight in leading.items():
+                _flights.pop(key, None)
+                flight.land(built.get(key) if flight.error is None else None)
+
+    for key in rebuild:
+        if key in built:
+            results[key] = built[key][0]
+        else:
+            # gone since it was cached: don't serve it stale either
+            results.pop(key, None)
+            cache.delete(key)
+    for key in leading:
+        if key in built:
+            results[key] = built[key][0]
+
+    # keys a thread of this worker was building when we asked
+    for key, flight in following.items():
+        if not flight.done.wait(getattr(settings, 'SINGLE_FLIGHT_WAIT_SECONDS', 2)):
+            flight = _Flight()
+            flight.land(_build([key], build_many).get(key))
+        if flight.error is not None:
+            raise flight.error
+        if flight.found:
+            results[key] = flight.value
+    return results
+
+
+def _build(keys, build_many):
+    """Build and store the keys; {key: (value, deps)} for the ones found."""
+    if not keys:
+        return {}
+    # stamped before reading, so a change made during the build makes
+    # the new entry stale straight away
+    started = time.time()
+    try:
+        built = build_many(keys)
+        cache.set_many({
+            key: (value, started, list(deps)) for key, (value, deps) in built.items()
+        }, _lifetime())
+    finally:
+        cache.delete_many([lock_key(key) for key in keys])
+    return built
+
+
+def _poll(keys):
+    """Entries another worker is building, as they land; gives up after the wait."""
+    deadline = time.monotonic() + getattr(settings, 'SINGLE_FLIGHT_WAIT_SECONDS', 2)
+    landed, pause = {}, POLL_SECONDS
+    waiting = list(keys)
+    while waiting and time.monotonic() < deadline:
+        time.sleep(pause)
+        pause = min(pause * 2, 0.1)
+        for key, (value, _, deps) in cache.get_many(waiting).items():
+            landed[key] = (value, deps)
+        waiting = [key for key in waiting if key not in landed]
+        if waiting and not cache.get_many([lock_key(key) for key in waiting]):
+            # the builder let go without storing anything (not found, or it failed)
+            break
+    return landed
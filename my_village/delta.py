@@ -0,0 +1,155 @@
+"""
+Delta sync: "what changed since I last looked" for list endpoints.
+
+    GET /api/notifications/                    -> a normal first page
+    GET /api/notifications/?since=<cursor>     -> only what changed
+
+A delta response is
+
+    {"cursor": "...", "results": [...], "deleted": [ids]}
+
+`results` holds the items created or updated after the cursor, in full,
+and `deleted` the ids of the ones that went away. The client merges
+both into what it has (by id) and sends `cursor` next time; the first
+cursor comes in the X-Delta-Cursor header of the full list. A client
+whose cursor can't be synced — older than DELTA_SYNC_MAX_AGE, or too
+much changed, e.g. the user followed someone and the whole feed moved —
+gets 410 Gone and reloads the list without ?since.
+
+Most polls find nothing new, so whether anything changed is decided
+before touching the tables. Every stream keeps a high-water mark per
+owner in the cache ("delta:posts:<author id>" is when that author's
+posts last changed), bumped by the writes; a view compares the marks
+it depends on with the cursor, and answers an empty delta with a new
+cursor when none moved. A mark missing from the cache counts as moved
+once, and is started again from the current cursor.
+
+Cursors are issued a little before the moment they stand for
+(DELTA_SYNC_OVERLAP_SECONDS), so a row written by a transaction that
+committed while the response was being built isn't missed; the price
+is that such rows may be sent twice.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .fastpath import plan_for
+from .fieldsets import requested_fieldset
+
+CURSOR_HEADER = 'X-Delta-Cursor'
+
+
+def encode_cursor(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def _issued(moment):
+    return moment - timedelta(seconds=getattr(settings, 'DELTA_SYNC_OVERLAP_SECONDS', 1))
+
+
+def cursor_for(moment):
+    """The cursor for a response built from the database as of `moment`."""
+    return encode_cursor(_issued(moment))
+
+
+def decode_cursor(value):
+    """The moment a cursor stands for; ValueError if it isn't one."""
+    micros = int(value)
+    if micros < 0:
+        raise ValueError(value)
+    return datetime.fromtimestamp(micros / 1_000_000, tz=dt_timezone.utc)
+
+
+def mark_key(stream, owner_id):
+    return f'delta:{stream}:{owner_id}'
+
+
+def bump(stream, owner_ids, moment=None):
+    """Record that the owners' `stream` changed (now, by default)."""
+    stamp = (moment or timezone.now()).timestamp()
+    marks = {mark_key(stream, owner_id): stamp for owner_id in set(owner_ids)}
+    if marks:
+        cache.set_many(marks, getattr(settings, 'DELTA_SYNC_MAX_AGE', 7 * 86400))
+
+
+def changed_since(marks, since, now=None):
+    """
+    Whether any of the (stream, owner_id) marks moved after `since`.
+    Marks the cache doesn't have count as moved; they're started again
+    at the cursor for `now`, the one this request hands out, so the
+    next request is cheap.
+    """
+    keys = [mark_key(stream, owner_id) for stream, owner_id in marks]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        restart = _issued(now or timezone.now()).timestamp()
+        for key in missing:
+            cache.add(key, restart, getattr(settings, 'DELTA_SYNC_MAX_AGE', 7 * 86400))
+        return True
+    return any(stamp > since.timestamp() for stamp in found.values())
+
+
+class DeltaSyncMixin:
+    """
+    ListAPIView mixin that answers ?since=<cursor>. Views implement
+    get_delta_marks(), the (stream, owner_id) marks their list depends
+    on, and get_delta(since), which returns (changed queryset, deleted
+    ids) or None when the client has to reload. Marks that mean the
+    list has to be reloaded when they move go in get_reset_marks().
+    """
+
+    def list(self, request, *args, **kwargs):
+        now = timezone.now()
+        if 'since' not in request.query_params:
+            response = super().list(request, *args, **kwargs)
+            response[CURSOR_HEADER] = cursor_for(now)
+            return response
+
+        try:
+            since = decode_cursor(request.query_params['since'])
+        except (ValueError, OverflowError, OSError):
+            return Response({"error": "Invalid since cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        if since < now - timedelta(seconds=getattr(settings, 'DELTA_SYNC_MAX_AGE', 7 * 86400)):
+            return Response({"error": "This cursor has expired, reload the list."}, status=status.HTTP_410_GONE)
+
+        cursor = cursor_for(now)
+        if changed_since(self.get_reset_marks(), since, now):
+            return Response({"error": "Too much has changed, reload the list."}, status=status.HTTP_410_GONE)
+        if not changed_since(self.get_delta_marks(), since, now):
+            return Response({'cursor': cursor, 'results': [], 'deleted': []})
+
+        delta = self.get_delta(since)
+        if delta is None:
+            return Response({"error": "Too much has changed, reload the list."}, status=status.HTTP_410_GONE)
+        changed, deleted = delta
+        results = self.serialize_delta(changed, getattr(settings, 'DELTA_SYNC_MAX_ITEMS', 200) - len(deleted))
+        if results is None:
+            return Response({"error": "Too much has changed, reload the list."}, status=status.HTTP_410_GONE)
+        return Response({'cursor': cursor, 'results': results, 'deleted': deleted})
+
+    def serialize_delta(self, queryset, limit):
+        """The changed items as the list would show them, or None past `limit`."""
+        # fetching one more than the limit tells us it didn't fit
+        fetch = max(limit, 0) + 1
+        plan = plan_for(self.get_serializer_class())
+        fast = getattr(settings, 'FAST_LIST_SERIALIZATION', False) and not requested_fieldset(self.request)
+        if fast and plan is not None:
+            context = self.get_serializer_context()
+            rows = list(plan.values_queryset(queryset, context)[:fetch])
+            return plan.assemble(rows, context) if len(rows) <= limit else None
+        objects = list(queryset[:fetch])
+        return self.get_serializer(objects, many=True).data if len(objects) <= limit else None
+
+    def get_reset_marks(self):
+        return []
+
+    def get_delta_marks(self):
+        raise NotImplementedError
+
+    def get_delta(self, since):
+        raise NotImplementedError
@@ -0,0 +1,301 @@
+"""
+Fast, read-only serialization for list endpoints.
+
+DRF builds a model instance per row and walks every field of every
+nested serializer for it. For big pages of posts that dominates CPU
+time. A ValuesPlan is compiled once per serializer class instead:
+
+  * plain fields become columns of one values_list() query, with
+    nested single objects (author, profiles) pulled in through joins;
+  * SerializerMethodFields become SQL annotations, declared on the
+    serializer in a `fast_fields` dict (see count_related below);
+  * nested many=True serializers (post comments) become one extra
+    query per page, grouped in Python;
+  * the row -> dict step is generated as a single Python expression,
+    so each output object is built without per-field dispatch.
+
+Leaf values still go through the DRF field's own to_representation()
+wherever that isn't a no-op, so the output is exactly what the
+serializer itself would return — posts/tests.py and
+notifications/tests.py check the two paths against each other.
+
+A serializer the compiler doesn't understand (source='*', many
+related fields, method fields without a fast_fields entry...) gets no
+plan and its views keep using the regular serializer.
+"""
+import threading
+
+from django.conf import settings
+from django.db.models import BooleanField, Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .fieldsets import requested_fieldset
+
+# DRF fields whose to_representation() returns database values unchanged
+_IDENTITY_METHODS = {
+    serializers.CharField.to_representation,
+    serializers.IntegerField.to_representation,
+    serializers.BooleanField.to_representation,
+}
+
+
+class UnsupportedSerializer(Exception):
+    pass
+
+
+def count_related(model, fk):
+    """
+    fast_fields entry for a `<relation>.count()` method field:
+    the number of `model` rows whose `fk` points at the object.
+    """
+    def build(outer, context):
+        counts = (
+            model._default_manager.filter(**{fk: OuterRef(outer)})
+            .order_by().values(fk).annotate(n=Count('*')).values('n')
+        )
+        return Coalesce(Subquery(counts[:1]), 0)
+    return build
+
+
+def exists_for_request_user(model, fk, user_field='user'):
+    """
+    fast_fields entry for "has the requesting user got a `model` row
+    pointing at this object" method fields (is_liked_by_user).
+    """
+    def build(outer, context):
+        request = context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return Value(False, output_field=BooleanField())
+        return Exists(model._default_manager.filter(**{fk: OuterRef(outer), user_field: request.user}))
+    return build
+
+
+def _file_converter(field, model_field):
+    # values() returns the stored name where DRF's FileField reads a
+    # FieldFile, so mirror FileField.to_representation() here
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+    def convert(name, context):
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = model_field.attr_class(None, model_field, name).url
+        request = context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
+
+
+class ValuesPlan:
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.columns = []        # values_list() lookups, in order
+        self.annotations = []    # (alias, builder(outer, context), outer lookup)
+        self.many = []           # (key, child plan, fk name)
+        self.namespace = {}      # converters used by the generated code
+        self._column_index = {}
+
+        serializer = serializer_class()
+        self.pk_index = self._column(self.model._meta.pk.name)
+        expression = self._compile(serializer, self.model, prefix='', outer='pk', top_level=True)
+        # the generated function turns one row tuple into one output dict
+        self.build = eval(f'lambda r, ctx: {expression}', self.namespace)
+
+    # -- compilation ---------------------------------------------------
+
+    def _column(self, lookup):
+        if lookup not in self._column_index:
+            self._column_index[lookup] = len(self.columns)
+            self.columns.append(lookup)
+        return self._column_index[lookup]
+
+    def _annotation(self, builder, outer):
+        alias = f'_fast{len(self.annotations)}'
+        self.annotations.append((alias, builder, outer))
+        return alias
+
+    def _converter(self, func):
+        name = f'c{len(self.namespace)}'
+        self.namespace[name] = func
+        return name
+
+    def _compile(self, serializer, model, prefix, outer, top_level=False):
+        fast_fields = getattr(type(serializer), 'fast_fields', {})
+        parts = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            parts.append(f'{name!r}: {self._compile_field(name, field, model, prefix, outer, fast_fields, top_level)}')
+        return '{' + ', '.join(parts) + '}'
+
+    def _compile_field(self, name, field, model, prefix, outer, fast_fields, top_level):
+        if isinstance(field, serializers.SerializerMethodField):
+            if name not in fast_fields:
+                raise UnsupportedSerializer(f'no fast_fields entry for {name}')
+            alias = self._annotation(fast_fields[name], outer)
+            return f'r[{self._column(alias)}]'
+
+        if field.source == '*' or '.' in field.source:
+            raise UnsupportedSerializer(f'unsupported source for {name}')
+        lookup = prefix + field.source
+
+        if isinstance(field, serializers.ListSerializer):
+            if not top_level or not isinstance(field.child, serializers.ModelSerializer):
+                raise UnsupportedSerializer(f'unsupported nested list {name}')
+            relation = model._meta.get_field(field.source)
+            if not relation.one_to_many:
+                raise UnsupportedSerializer(f'{name} is not a reverse foreign key')
+            self.many.append((name, plan_for(type(field.child), strict=True), relation.field.name))
+            return 'None'
+
+        if isinstance(field, serializers.ModelSerializer):
+            relation = model._meta.get_field(field.source)
+            if not (relation.many_to_one or relation.one_to_one):
+                raise UnsupportedSerializer(f'{name} is not a single relation')
+            related = relation.related_model
+            exists = self._column(f'{lookup}__{related._meta.pk.name}')
+            inner = self._compile(field, related, f'{lookup}__', f'{lookup}__{related._meta.pk.name}')
+            return f'(None if r[{exists}] is None else {inner})'
+
+        if isinstance(field, PrimaryKeyRelatedField):
+            if field.pk_field is not None:
+                raise UnsupportedSerializer(f'pk_field on {name}')
+            return f'r[{self._column(lookup)}]'
+
+        if isinstance(field, serializers.RelatedField) or isinstance(field, serializers.ManyRelatedField):
+            raise UnsupportedSerializer(f'unsupported related field {name}')
+
+        index = self._column(lookup)
+        if isinstance(field, serializers.FileField):
+            convert = self._converter(_file_converter(field, model._meta.get_field(field.source)))
+            return f'{convert}(r[{index}], ctx)'
+        if type(field).to_representation in _IDENTITY_METHODS:
+            return f'r[{index}]'
+        convert = self._converter(field.to_representation)
+        return f'(None if r[{index}] is None else {convert}(r[{index}]))'
+
+    # -- execution -------------------------------------------------------
+
+    def values_queryset(self, queryset, context, extra=()):
+        """
+        Turn a queryset of the serializer's model into the row query
+        the plan reads. Ordering, filters and slicing carry over, so the
+        result can be handed to a paginator.
+        """
+        annotations = {
+            alias: builder(outer, context)
+            for alias, builder, outer in self.annotations
+        }
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset.values_list(*self.columns, *extra)
+
+    def assemble(self, rows, context, children=None):
+        """
+        Build output dicts from rows fetched with values_queryset().
+        `children` may carry the nested lists already fetched with
+        grouped_by(), one dict per entry in self.many.
+        """
+        rows = rows if isinstance(rows, list) else list(rows)
+        if children is None and self.many and rows:
+            ids = [row[self.pk_index] for row in rows]
+            children = [child.grouped_by(fk, ids, context) for key, child, fk in self.many]
+        return self._build_items(rows, context, children)
+
+    def _build_items(self, rows, context, children):
+        build = self.build
+        items = [build(row, context) for row in rows]
+        if children:
+            pk_index = self.pk_index
+            for (key, child, fk), grouped in zip(self.many, children):
+                for item, row in zip(items, rows):
+                    item[key] = grouped.get(row[pk_index], [])
+        return items
+
+    def children_queryset(self, fk, ids, context):
+        queryset = self.model._default_manager.filter(**{f'{fk}__in': ids})
+        return self.values_queryset(queryset, context, extra=(fk,))
+
+    def grouped_by(self, fk, ids, context):
+        """Children of the given parent ids, as {parent id: [dict, ...]}."""
+        rows = list(self.children_queryset(fk, ids, context))
+        items = self.assemble([row[:-1] for row in rows], context)
+        return self._group(rows, items)
+
+    @staticmethod
+    def _group(rows, items):
+        grouped = {}
+        for item, row in zip(items, rows):
+            grouped.setdefault(row[-1], []).append(item)
+        return grouped
+
+    def serialize(self, queryset, context):
+        return self.assemble(self.values_queryset(queryset, context), context)
+
+    # async versions, for the ASGI views
+
+    async def aassemble(self, rows, context, children=None):
+        if children is None and self.many and rows:
+            ids = [row[self.pk_index] for row in rows]
+            children = [await child.agrouped_by(fk, ids, context) for key, child, fk in self.many]
+        return self._build_items(rows, context, children)
+
+    async def agrouped_by(self, fk, ids, context):
+        # async for, not aiterator(): values_list().aiterator() opens
+        # its cursor on the event loop thread in Django 5.2
+        rows = [row async for row in self.children_queryset(fk, ids, context)]
+        items = await self.aassemble([row[:-1] for row in rows], context)
+        return self._group(rows, items)
+
+
+_plans = {}
+# re-entrant: compiling a plan compiles the plans of its nested lists
+_plans_lock = threading.RLock()
+
+
+def plan_for(serializer_class, strict=False):
+    """
+    The compiled plan for a serializer class, or None if it can't be
+    compiled (strict=True raises UnsupportedSerializer instead).
+    """
+    try:
+        plan = _plans[serializer_class]
+    except KeyError:
+        with _plans_lock:
+            try:
+                plan = ValuesPlan(serializer_class)
+            except UnsupportedSerializer:
+                plan = None
+            _plans[serializer_class] = plan
+    if plan is None and strict:
+        raise UnsupportedSerializer(serializer_class.__name__)
+    return plan
+
+
+class FastListMixin:
+    """
+    ListAPIView mixin that serves list pages through the serializer's
+    compiled plan when FAST_LIST_SERIALIZATION is on. Requests using
+    ?fields= sparse fieldsets, and serializers without a plan, take
+    the regular path.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'FAST_LIST_SERIALIZATION', False) or requested_fieldset(request):
+            return super().list(request, *args, **kwargs)
+        plan = plan_for(self.get_serializer_class())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        context = self.get_serializer_context()
+        rows = plan.values_queryset(self.filter_queryset(self.get_queryset()), context)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.assemble(page, context))
+        return Response(plan.assemble(rows, context))
@@ -0,0 +1,85 @@
+"""
+Sparse fieldsets for read requests.
+
+    ?fields=id,content,author               only these fields
+    ?fields=id,content,author.username      dotted paths narrow nested objects
+    ?fields=id,author&expand=author         keep a nested object whole
+
+Once ?fields= is given, a nested object that is listed but neither
+expanded nor narrowed with a dotted path is rendered as its primary
+key (or a list of them). Fields that aren't listed are dropped before
+the serializer runs, so the queries behind them — nested objects,
+counts — never happen. Without ?fields= nothing changes.
+
+Only GET/HEAD/OPTIONS requests are affected; writes always validate
+against the full serializer.
+"""
+from rest_framework import permissions, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+
+
+def parse_field_paths(value):
+    """'id,author.username' -> {'id': {}, 'author': {'username': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def requested_fieldset(request):
+    """
+    Return (fields, expand) trees for the request, or None when the
+    client didn't ask for a sparse response.
+    """
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    fields = params.get('fields')
+    if not fields:
+        return None
+    return parse_field_paths(fields), parse_field_paths(params.get('expand', ''))
+
+
+class SparseFieldsetMixin:
+    """
+    Mixin for ModelSerializers. The outermost serializer reads the
+    fieldset from the request; nested serializers get their part of it
+    from their parent.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self._get_fieldset()
+        if fieldset is None:
+            return fields
+
+        only, expand = fieldset
+        kept = {}
+        for name, field in fields.items():
+            if name not in only:
+                continue
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if isinstance(nested, serializers.BaseSerializer):
+                if only[name]:
+                    nested._fieldset = (only[name], expand.get(name, {}))
+                elif name not in expand:
+                    kwargs = {'source': field.source} if field.source else {}
+                    field = PrimaryKeyRelatedField(read_only=True, many=many, **kwargs)
+            kept[name] = field
+        return kept
+
+    def _get_fieldset(self):
+        if hasattr(self, '_fieldset'):
+            return self._fieldset
+        # only the outermost serializer (or the child of an outermost
+        # many=True list) looks at the request
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return None
+        return requested_fieldset(self.context.get('request'))
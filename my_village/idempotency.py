@@ -0,0 +1,173 @@
+"""
+Idempotency-Key support for POST requests.
+
+A client that retries a POST after a timeout can't tell whether the
+first attempt went through, so on a flaky network a retry creates a
+second post or comment, or flips a like back off. Clients that send
+
+    Idempotency-Key: <unique value per intended write, e.g. a UUID>
+
+get the first attempt's response replayed for every retry with the
+same key, for IDEMPOTENCY_KEY_TTL seconds. A replay is a cache read and
+never reaches the view, so nothing is written twice; it carries an
+Idempotent-Replayed: true header.
+
+Keys are scoped to the user in the request's JWT (only the signature
+is checked, no database lookup), so two users can't see each other's
+responses; requests without a valid token are passed through as they
+are. The first attempt holds the key while it runs:
+
+  * a retry arriving before it finishes gets 409 with Retry-After;
+  * reusing a key for a different request (method, path or body) is a
+    client bug and gets 422;
+  * responses worth retrying (5xx, 408, 429) aren't kept, so the
+    retry runs the request again.
+
+Responses live in the Django cache, which has to be shared between
+workers (see the production checklist).
+"""
+import hashlib
+import json
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import RequestDataTooBig
+from django.http import HttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# stands in the cache for a response while the first attempt runs
+IN_PROGRESS = 'in-progress'
+# answers a retry should try again after, rather than be given again
+RETRYABLE_STATUSES = (408, 429)
+
+
+def _error(message, status):
+    # shaped like the API's own error responses
+    body = json.dumps({"error": message}, separators=(',', ':'))
+    return HttpResponse(body, status=status, content_type='application/json')
+
+
+class IdempotencyMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        claim = self.claim(request)
+        if claim is None:
+            return self.get_response(request)
+        if isinstance(claim, HttpResponse):
+            return claim
+        key, fingerprint = claim
+        lock_seconds = getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60)
+        if not cache.add(key, (IN_PROGRESS, fingerprint), lock_seconds):
+            return self.replay(cache.get(key), fingerprint)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.store(key, fingerprint, response)
+        return response
+
+    async def __acall__(self, request):
+        claim = self.claim(request)
+        if claim is None:
+            return await self.get_response(request)
+        if isinstance(claim, HttpResponse):
+            return claim
+        key, fingerprint = claim
+        lock_seconds = getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60)
+        if not await cache.aadd(key, (IN_PROGRESS, fingerprint), lock_seconds):
+            return self.replay(await cache.aget(key), fingerprint)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            stored = self.stored(fingerprint, response)
+            if stored is None:
+                await cache.adelete(key)
+            else:
+                await cache.aset(key, stored, getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+        return response
+
+    def claim(self, request):
+        """
+        (cache key, request fingerprint) for a POST carrying a key, an
+        error response for a bad key, or None to pass the request on.
+        """
+        value = request.headers.get(HEADER)
+        if request.method != 'POST' or value is None:
+            return None
+        if not value or len(value) > MAX_KEY_LENGTH:
+            return _error(f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters.', 400)
+        user_id = self.user_id(request)
+        if user_id is None:
+            return None
+
+        digest = hashlib.sha256()
+        digest.update(f'{request.method} {request.get_full_path()}\n'.encode())
+        try:
+            digest.update(request.body)
+        except RequestDataTooBig:
+            # big uploads are told apart by their length alone
+            digest.update(request.META.get('CONTENT_LENGTH', '').encode())
+        key_hash = hashlib.sha256(value.encode()).hexdigest()
+        return f'idempotency:{user_id}:{key_hash}', digest.hexdigest()
+
+    def user_id(self, request):
+        auth = JWTAuthentication()
+        header = auth.get_header(request)
+        raw_token = auth.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None
+        try:
+            token = auth.get_validated_token(raw_token)
+        except (InvalidToken, TokenError):
+            return None
+        return token.get(jwt_settings.USER_ID_CLAIM)
+
+    def replay(self, stored, fingerprint):
+        if stored is None:
+            # the first attempt failed and let go of the key between
+            # our add() and get(); the client can try again
+            stored = (IN_PROGRESS, fingerprint)
+        if stored[1] != fingerprint:
+            return _error(f'This {HEADER} was already used for a different request.', 422)
+        if stored[0] == IN_PROGRESS:
+            response = _error(f'A request with this {HEADER} is still being processed.', 409)
+            response['Retry-After'] = '1'
+            return response
+        status, headers, content = stored[0], stored[2], stored[3]
+        response = HttpResponse(content, status=status)
+        for name, value in headers:
+            response[name] = value
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+    def store(self, key, fingerprint, response):
+        stored = self.stored(fingerprint, response)
+        if stored is None:
+            cache.delete(key)
+        else:
+            cache.set(key, stored, getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+
+    def stored(self, fingerprint, response):
+        """What to keep for replays: (status, fingerprint, headers, body) or None."""
+        if response is None or response.streaming:
+            return None
+        if response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES:
+            return None
+        return (response.status_code, fingerprint, list(response.items()), response.content)
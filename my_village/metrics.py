@@ -0,0 +1,322 @@
+"""
+In-process request metrics, served at /metrics in Prometheus text format.
+
+MetricsMiddleware records, per resolved view name, the request latency,
+SQL query count and time, render time and response size. Numbers are
+aggregated in the worker process that served the request, so each
+worker needs to be scraped (or summed) on its own.
+
+SQL is captured through a connection execute wrapper that only does
+work while a request is being measured, so queries run from management
+commands or shells pay nothing beyond one context variable lookup.
+"""
+import bisect
+import heapq
+import hmac
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_request_logger = logging.getLogger('my_village.slow_requests')
+
+# the QueryLog for the request running in the current context, if any
+_current_query_log = ContextVar('current_query_log', default=None)
+
+
+class QueryLog:
+    """
+    Counts the SQL run during one request. When keep > 0 it also
+    remembers the `keep` slowest statements for the slow-request log,
+    and with record_all it keeps every statement in order.
+
+    Logs nest: a log started while another is active passes each
+    query on to the outer one, so a profiler can collect its own
+    query list without hiding queries from the metrics.
+    """
+
+    def __init__(self, keep=0, record_all=False, parent=None):
+        self.count = 0
+        self.duration = 0.0
+        self.keep = keep
+        self.queries = [] if record_all else None
+        self.parent = parent
+        self._slowest = []
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        if self.parent is not None:
+            self.parent.add(sql, duration)
+        if self.queries is not None:
+            self.queries.append((sql, duration))
+        if not self.keep:
+            return
+        # min-heap, so the fastest of the kept queries is the one evicted
+        item = (duration, self.count, sql)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, item)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def slowest(self):
+        return [(sql, duration) for duration, _, sql in sorted(self._slowest, reverse=True)]
+
+
+def start_query_log(keep=0, record_all=False):
+    """
+    Start collecting SQL for the current context.
+    Returns (log, token); pass the token to stop_query_log().
+    """
+    log = QueryLog(keep=keep, record_all=record_all, parent=_current_query_log.get())
+    return log, _current_query_log.set(log)
+
+
+def stop_query_log(token):
+    _current_query_log.reset(token)
+
+
+def _record_query(execute, sql, params, many, context):
+    log = _current_query_log.get()
+    if log is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        log.add(sql, time.perf_counter() - start)
+
+
+def install_query_hook(connection):
+    # inserted at the front so it survives the push/pop done by
+    # connection.execute_wrapper() blocks that are open when we add it
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_query_hook(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+class _ViewStats:
+    __slots__ = (
+        'buckets', 'count', 'duration', 'statuses',
+        'queries', 'query_duration', 'render_duration', 'response_bytes',
+    )
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.statuses = {}
+        self.queries = 0
+        self.query_duration = 0.0
+        self.render_duration = 0.0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(self, view, method, status, duration, queries=0,
+                query_duration=0.0, render_duration=0.0, response_bytes=0):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, duration)
+        with self._lock:
+            stats = self._stats.get((view, method))
+            if stats is None:
+                stats = self._stats[(view, method)] = _ViewStats()
+            stats.buckets[bucket] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.queries += queries
+            stats.query_duration += query_duration
+            stats.render_duration += render_duration
+            stats.response_bytes += response_bytes
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def render(self):
+        """Return every metric in Prometheus text exposition format."""
+        with self._lock:
+            snapshot = sorted(self._stats.items())
+            snapshot = [(key, _copy_stats(stats)) for key, stats in snapshot]
+
+        lines = [
+            '# HELP myvillage_request_duration_seconds Request latency by view.',
+            '# TYPE myvillage_request_duration_seconds histogram',
+        ]
+        for (view, method), stats in snapshot:
+            labels = _labels(view=view, method=method)
+            cumulative = 0
+            for bound, hits in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += hits
+                lines.append(
+                    f'myvillage_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'myvillage_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f'myvillage_request_duration_seconds_sum{{{labels}}} {stats.duration}')
+            lines.append(f'myvillage_request_duration_seconds_count{{{labels}}} {stats.count}')
+
+        lines += [
+            '# HELP myvillage_requests_total Requests by view and status code.',
+            '# TYPE myvillage_requests_total counter',
+        ]
+        for (view, method), stats in snapshot:
+            for status, hits in sorted(stats.statuses.items()):
+                labels = _labels(view=view, method=method, status=status)
+                lines.append(f'myvillage_requests_total{{{labels}}} {hits}')
+
+        counters = [
+            ('myvillage_db_queries_total', 'SQL queries run by view.', 'queries'),
+            ('myvillage_db_query_seconds_total', 'Time spent in SQL by view.', 'query_duration'),
+            ('myvillage_render_seconds_total', 'Time spent rendering responses by view.', 'render_duration'),
+            ('myvillage_response_bytes_total', 'Response body bytes by view.', 'response_bytes'),
+        ]
+        for name, help_text, attr in counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (view, method), stats in snapshot:
+                labels = _labels(view=view, method=method)
+                lines.append(f'{name}{{{labels}}} {getattr(stats, attr)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _copy_stats(stats):
+    copy = _ViewStats()
+    for attr in _ViewStats.__slots__:
+        value = getattr(stats, attr)
+        setattr(copy, attr, value.copy() if isinstance(value, (list, dict)) else value)
+    return copy
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+registry = MetricsRegistry()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name
+
+
+class MetricsMiddleware:
+    """
+    Should sit at the top of MIDDLEWARE so the latency it records
+    covers every other middleware as well as the view. Works under
+    both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.slow_threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', None)
+        self.slow_queries = getattr(settings, 'SLOW_REQUEST_LOG_QUERIES', 5)
+        # connections opened before this middleware was imported
+        # (test runners, warm-up code) never saw connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_hook(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        keep = self.slow_queries if self.slow_threshold is not None else 0
+        log, token = start_query_log(keep)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_query_log(token)
+        self.record(request, response, time.perf_counter() - start, log)
+        return response
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context into its worker thread, so
+        # queries run by sync views and the async ORM land in this log
+        keep = self.slow_queries if self.slow_threshold is not None else 0
+        log, token = start_query_log(keep)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_query_log(token)
+        self.record(request, response, time.perf_counter() - start, log)
+        return response
+
+    def record(self, request, response, duration, log):
+        view = view_label(request)
+        render_duration = getattr(request, '_metrics_render_duration', 0.0)
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(
+            view, request.method, response.status_code, duration,
+            queries=log.count,
+            query_duration=log.duration,
+            render_duration=render_duration,
+            response_bytes=size,
+        )
+
+        if self.slow_threshold is not None and duration * 1000 >= self.slow_threshold:
+            self.log_slow_request(request, view, duration, log)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, so time
+        # the render itself with a post-render callback
+        start = time.perf_counter()
+
+        def record_render(rendered):
+            request._metrics_render_duration = time.perf_counter() - start
+
+        response.add_post_render_callback(record_render)
+        return response
+
+    def log_slow_request(self, request, view, duration, log):
+        lines = [
+            f"{request.method} {request.path} ({view}) took {duration * 1000:.1f}ms, "
+            f"{log.count} queries in {log.duration * 1000:.1f}ms"
+        ]
+        for sql, query_duration in log.slowest():
+            lines.append(f"  {query_duration * 1000:.1f}ms  {sql}")
+        slow_request_logger.warning('\n'.join(lines))
+
+
+def metrics_view(request):
+    # scrapers authenticate with a static bearer token; without one set,
+    # the metrics are only served while DEBUG is on
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=403)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,20 @@
+"""
+Query parameters shared by several endpoints.
+"""
+
+
+def parse_ids(value, limit):
+    """
+    '1,2,3' -> [1, 2, 3], in the order given. Raises ValueError, with a
+    message for the client, when there are none, too many, or some
+    aren't ids.
+    """
+    try:
+        ids = [int(part) for part in (value or '').split(',') if part.strip()]
+    except ValueError:
+        raise ValueError('ids must be whole numbers.') from None
+    if not ids:
+        raise ValueError('Pass the ids as ?ids=1,2,3.')
+    if len(ids) > limit:
+        raise ValueError(f'At most {limit} ids per request.')
+    return ids
@@ -0,0 +1,179 @@
+"""
+Opt-in request profiler for production.
+
+A request is profiled with cProfile when either
+  * it is picked by random sampling (PROFILE_SAMPLE_RATE), or
+  * PROFILE_HEADER_ENABLED is on and it carries a valid signed
+    X-Profile-Request header.
+
+Each profile is written to PROFILE_DIR as a .pstats file (open it with
+`python -m pstats`, snakeviz, or turn it into a flamegraph with
+flameprof) plus a .json file holding the view name, timing and the
+full query log. Only the newest PROFILE_MAX_FILES profiles are kept.
+
+Generate a header value, valid for PROFILE_TOKEN_MAX_AGE seconds, with:
+
+    python manage.py shell -c "from my_village.profiling import make_profile_token; print(make_profile_token())"
+
+When neither trigger is configured the middleware removes itself from
+the stack at startup, so it costs nothing.
+
+Under ASGI the profiler only sees the event loop thread: time spent in
+sync views and async ORM queries shows up as waiting, and other
+requests handled on the loop meanwhile are included in the profile.
+The query log is still complete.
+"""
+import cProfile
+import json
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+from .metrics import start_query_log, stop_query_log, view_label
+
+PROFILE_HEADER = 'X-Profile-Request'
+_SIGNING_SALT = 'my_village.profiling'
+
+
+def make_profile_token():
+    return signing.TimestampSigner(salt=_SIGNING_SALT).sign('profile')
+
+
+def _valid_token(value):
+    max_age = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600)
+    try:
+        return signing.TimestampSigner(salt=_SIGNING_SALT).unsign(value, max_age=max_age) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0)
+        self.header_enabled = getattr(settings, 'PROFILE_HEADER_ENABLED', False)
+        if not self.sample_rate and not self.header_enabled:
+            raise MiddlewareNotUsed()
+
+        url_names = getattr(settings, 'PROFILE_URL_NAMES', None)
+        self.url_names = set(url_names) if url_names else None
+        self.directory = Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+        self.max_files = getattr(settings, 'PROFILE_MAX_FILES', 50)
+        # cProfile can't run two profilers in one interpreter at once,
+        # so concurrent picks in threaded workers are simply skipped
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+        if not self._lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            self._lock.release()
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+        if not self._lock.acquire(blocking=False):
+            return await self.get_response(request)
+        try:
+            return await self.aprofile(request)
+        finally:
+            self._lock.release()
+
+    def should_profile(self, request):
+        header = request.headers.get(PROFILE_HEADER) if self.header_enabled else None
+        if header:
+            picked = _valid_token(header)
+        else:
+            picked = self.sample_rate and random.random() < self.sample_rate
+        if not picked:
+            return False
+        if self.url_names is None:
+            return True
+        try:
+            return resolve(request.path_info).url_name in self.url_names
+        except Resolver404:
+            return False
+
+    def profile(self, request):
+        profiler = cProfile.Profile()
+        log, token = start_query_log(record_all=True)
+        started_at = time.time()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            stop_query_log(token)
+        self.write(profiler, self.describe(request, response, started_at, time.perf_counter() - start, log))
+        return response
+
+    async def aprofile(self, request):
+        profiler = cProfile.Profile()
+        log, token = start_query_log(record_all=True)
+        started_at = time.time()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            stop_query_log(token)
+        self.write(profiler, self.describe(request, response, started_at, time.perf_counter() - start, log))
+        return response
+
+    def describe(self, request, response, started_at, duration, log):
+        return {
+            'view': view_label(request),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'started_at': started_at,
+            'duration_ms': round(duration * 1000, 3),
+            'query_count': log.count,
+            'query_ms': round(log.duration * 1000, 3),
+            'queries': [
+                {'sql': sql, 'ms': round(query_duration * 1000, 3)}
+                for sql, query_duration in log.queries
+            ],
+        }
+
+    def write(self, profiler, info):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        view = re.sub(r'[^\w.-]+', '_', info['view'])
+        started = info['started_at']
+        stem = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime(started))}.{int(started * 1000) % 1000:03d}-{os.getpid()}-{view}"
+        profiler.dump_stats(self.directory / f'{stem}.pstats')
+        with open(self.directory / f'{stem}.json', 'w') as fh:
+            json.dump(info, fh, indent=2)
+        self.prune()
+
+    def prune(self):
+        # keep only the newest max_files profiles; the names start with
+        # a UTC timestamp, so name order is age order across workers
+        profiles = sorted(self.directory.glob('*.pstats'))
+        # not profiles[:-max_files], which is empty for 0
+        for old in profiles[:max(len(profiles) - self.max_files, 0)]:
+            old.unlink(missing_ok=True)
+            old.with_suffix('.json').unlink(missing_ok=True)
@@ -0,0 +1,101 @@
+"""
+EXPLAIN checks for the queries behind the hot endpoints.
+
+    problems = plan_problems(Comment.objects.filter(post_id=1)[:10])
+
+plan_problems() runs the query through the database's EXPLAIN and
+returns what it finds wrong with the plan:
+
+  * "scan"  — a table read from end to end (SQLite `SCAN t` without an
+    index, Postgres `Seq Scan`);
+  * "sort"  — rows sorted after reading them (SQLite `USE TEMP B-TREE`,
+    Postgres `Sort`) because no index delivers them in order.
+
+The tests assert the list is empty (or only holds problems a query is
+explicitly allowed), so a dropped index or a filter that stops matching
+one fails the build instead of showing up as a slow endpoint later.
+
+Postgres is asked to avoid sequential scans while explaining: on test
+databases with a handful of rows it would rightly prefer them, which
+says nothing about the production plan. SQLite without ANALYZE stats
+already assumes big tables.
+"""
+import re
+
+from django.db import connections, transaction
+
+SCAN = 'scan'
+SORT = 'sort'
+
+_SQLITE_RULES = [
+    # "SCAN posts_post" but not "SCAN posts_post USING INDEX ..."
+    (SCAN, re.compile(r'\bSCAN (?!.*\bUSING (?:COVERING )?INDEX\b)(?!CONSTANT ROW)(\S+)')),
+    (SORT, re.compile(r'\bUSE TEMP B-TREE FOR (?:ORDER BY|GROUP BY|DISTINCT)')),
+]
+_POSTGRES_RULES = [
+    (SCAN, re.compile(r'\bSeq Scan on (\S+)')),
+    (SORT, re.compile(r'(?<!Incremental )\bSort\b(?! Key| Method)')),
+]
+
+
+def explain(queryset):
+    """The EXPLAIN output for a queryset, one plan line per item."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.explain().splitlines()
+    with transaction.atomic(using=queryset.db):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        transaction.set_rollback(True, using=queryset.db)
+    return plan.splitlines()
+
+
+def plan_problems(queryset, allow=()):
+    """
+    [(kind, plan line), ...] for every full scan or sort in the plan,
+    leaving out the kinds listed in `allow`.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        rules = _SQLITE_RULES
+    elif vendor == 'postgresql':
+        rules = _POSTGRES_RULES
+    else:
+        raise NotImplementedError(f'No plan rules for {vendor}.')
+
+    problems = []
+    for line in explain(queryset):
+        for kind, pattern in rules:
+            if kind not in allow and pattern.search(line):
+                problems.append((kind, line.strip()))
+    return problems
+
+
+def page_queryset(view_class, user, **kwargs):
+    """
+    The query a ListAPIView runs for its first page, built by the view
+    itself so the check follows whatever get_queryset() does today.
+    """
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    request = Request(APIRequestFactory().get('/'))
+    request.user = user
+    view = view_class(request=request, kwargs=kwargs, format_kwarg=None)
+    queryset = view.filter_queryset(view.get_queryset())
+    page_size = view.paginator.get_page_size(request) if view.paginator else None
+    return queryset[:page_size] if page_size else queryset
+
+
+class QueryPlanAssertions:
+    """TestCase mixin with assertIndexed() and assertViewIndexed()."""
+
+    def assertIndexed(self, queryset, allow=(), msg=None):
+        problems = plan_problems(queryset, allow)
+        if problems:
+            details = '\n'.join(f'  {kind}: {line}' for kind, line in problems)
+            self.fail(msg or f'Query plan has problems:\n{details}\n\nSQL: {queryset.query}')
+
+    def assertViewIndexed(self, view_class, user, allow=(), **kwargs):
+        self.assertIndexed(page_queryset(view_class, user, **kwargs), allow)
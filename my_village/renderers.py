@@ -0,0 +1,40 @@
+"""
+JSON renderer backed by orjson, which encodes responses several times
+faster than the standard library json module DRF uses. Output matches
+DRF's JSONRenderer (compact, UTF-8). Falls back to DRF's renderer when
+orjson isn't installed.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# orjson hands anything it can't encode natively (Decimal, lazy
+# translation strings, querysets...) to DRF's encoder
+_encode_fallback = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        # datetimes go to DRF's encoder too: orjson writes UTC as
+        # +00:00 where DRF writes Z
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=_encode_fallback, option=option)
+
+        # same as DRF: escape the two line separators that are valid
+        # JSON but break JavaScript string literals
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
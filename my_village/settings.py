@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,10 +52,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so the latency it records covers the whole stack
+    'my_village.metrics.MetricsMiddleware',
+    'my_village.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    # turns search and the feed away while the worker is overloaded
+    'my_village.shedding.LoadSheddingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # replays retried POSTs that carry an Idempotency-Key
+    'my_village.idempotency.IdempotencyMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -89,6 +99,18 @@ DATABASES = {
     }
 }
 
+# The therapist directory count, the trending ranking and the
+# delta-sync marks live here. LocMemCache is per process, which is fine
+# for one process in development; production needs a shared cache
+# (Redis, Memcached) so every worker sees the others' writes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # one delta-sync mark per active author and user
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -108,6 +130,41 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing (users/hashing.py). The profile picks the hasher new
+# passwords get; the others in its list are there to check passwords
+# stored before a switch, which are hashed again at their next login.
+# 'argon2' needs argon2-cffi: pip install "django[argon2]". Set the
+# profile with MY_VILLAGE_PASSWORD_HASHER.
+PASSWORD_HASHER_PROFILES = {
+    'pbkdf2': [
+        'users.hashing.TunedPBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'users.hashing.TunedArgon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ],
+    'argon2': [
+        'users.hashing.TunedArgon2PasswordHasher',
+        'users.hashing.TunedPBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ],
+}
+PASSWORD_HASHER_PROFILE = os.environ.get('MY_VILLAGE_PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]
+PASSWORD_PBKDF2_ITERATIONS = 1_000_000
+# time_cost passes over memory_cost KiB, per lane
+PASSWORD_ARGON2 = {'time_cost': 2, 'memory_cost': 19 * 1024, 'parallelism': 1}
+
+# Logins hash in a pool of PASSWORD_HASHING_WORKERS threads per process,
+# half the cores by default, so the rest stay free for requests; with
+# PASSWORD_HASHING_MAX_WAITING more queued, logins get 503. 0 hashes
+# on the request thread.
+PASSWORD_HASHING_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+PASSWORD_HASHING_MAX_WAITING = 64
+AUTHENTICATION_BACKENDS = ['users.backends.PooledModelBackend']
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
@@ -127,6 +184,16 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 REST_FRAMEWORK = {
+    # orjson-backed JSON; both fall back to DRF's own classes without orjson
+    'DEFAULT_RENDERER_CLASSES': (
+        'my_village.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'my_village.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
@@ -135,8 +202,115 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # a token bucket per user and endpoint class, kept in the cache
+    # (my_village/throttling.py); '30/min' lets 30 through at once and
+    # refills one every 2 seconds
+    'DEFAULT_THROTTLE_CLASSES': (
+        'my_village.throttling.EndpointThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'feed': '60/min',
+        'search': '30/min',
+        'export': '10/hour',
+        'read': '600/min',
+        'write': '120/min',
+    },
 }
 
+# Serve list endpoints through compiled values() plans instead of
+# DRF serializer instances (my_village/fastpath.py). Same JSON, less CPU.
+FAST_LIST_SERIALIZATION = False
+
+# Route feed, notifications, post detail and profile GETs to the native
+# async views (my_village/async_views.py). asgi.py switches this on;
+# under WSGI the sync views are cheaper, so it stays off there.
+ASYNC_VIEWS = os.environ.get('MY_VILLAGE_ASYNC_VIEWS', '') == '1'
+
+# wsgi.py and asgi.py warm new workers up before their first request
+# (my_village/warmup.py). Connections opened before a fork would be
+# shared by the workers: with gunicorn --preload turn
+# WARM_UP_CONNECTIONS off and open them in a post_fork hook instead.
+WARM_UP_WORKERS = True
+WARM_UP_CONNECTIONS = True
+
+# Shared read cache for post, feed and profile payloads
+# (my_village/cache.py): an entry is fresh for READ_CACHE_SECONDS unless
+# a write touched what it was built from, then served stale for up to
+# READ_CACHE_STALE_SECONDS more while one request rebuilds it. A miss is
+# built once however many requests want it; the others wait up to
+# SINGLE_FLIGHT_WAIT_SECONDS for it, and a builder's lock expires after
+# SINGLE_FLIGHT_LOCK_SECONDS. READ_CACHE_SECONDS = 0 turns the cache off.
+READ_CACHE_SECONDS = 30
+READ_CACHE_STALE_SECONDS = 300
+SINGLE_FLIGHT_WAIT_SECONDS = 2
+SINGLE_FLIGHT_LOCK_SECONDS = 10
+
+# most posts /api/posts/?ids= fetches at once
+POSTS_BULK_MAX_IDS = 50
+
+# /api/batch/ (my_village/batch.py): most sub-requests per batch, and
+# how many consecutive GETs may run at once
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_CONCURRENCY = 4
+
+# purge_deleted (users/purge.py): rows deleted per transaction, seconds
+# to sleep between chunks, and how long a job may go without progress
+# before another worker takes it over
+PURGE_CHUNK_SIZE = 500
+PURGE_CHUNK_PAUSE = 0.05
+PURGE_JOB_TIMEOUT = 600
+
+# /api/social/trending/ (social/trending.py): likes and comments are
+# counted in TRENDING_BUCKET_SECONDS buckets over a sliding window,
+# written to the database every TRENDING_FLUSH_SECONDS; the ranking of
+# the TRENDING_TOP_SIZE hottest posts is cached for TRENDING_CACHE_SECONDS
+TRENDING_BUCKET_SECONDS = 300
+TRENDING_WINDOW_SECONDS = 2 * 3600
+TRENDING_FLUSH_SECONDS = 10
+TRENDING_TOP_SIZE = 100
+TRENDING_CACHE_SECONDS = 30
+
+# rollup_stats (social/stats.py): rows counted per transaction, and how
+# old a like, comment or follow must be before it's counted
+STATS_ROLLUP_BATCH = 5000
+STATS_ROLLUP_LAG_SECONDS = 60
+
+# how long a user's mute/block exclusion set is cached between changes
+# (users/exclusions.py)
+EXCLUSIONS_CACHE_SECONDS = 3600
+
+# how long the therapist directory's count is cached between changes
+THERAPIST_DIRECTORY_CACHE_SECONDS = 300
+
+# admin changelists count at most this many rows; bigger unfiltered
+# tables show the database's row estimate (my_village/admin.py)
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# ?since= delta sync on the feed and notifications (my_village/delta.py):
+# how old a cursor may be (and how long tombstones are kept), how far
+# back cursors reach to cover in-flight writes, and the most changes a
+# delta returns before the client is told to reload the list
+DELTA_SYNC_MAX_AGE = 7 * 86400
+DELTA_SYNC_OVERLAP_SECONDS = 1
+DELTA_SYNC_MAX_ITEMS = 200
+
+# Idempotency-Key on POSTs (my_village/idempotency.py): how long a
+# response is replayed to retries, and how long a first attempt may
+# hold its key before a retry is let through again
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# Load shedding (my_village/shedding.py): a worker is overloaded with
+# more than SHED_MAX_IN_FLIGHT requests in flight, or once requests wait
+# longer than SHED_MAX_QUEUE_MS in the proxy's queue (X-Request-Start),
+# and severely so past twice either. SHED_LEVELS: the level from which
+# each endpoint class is answered 503; classes not listed never are.
+# None switches a limit off.
+SHED_MAX_IN_FLIGHT = 64
+SHED_MAX_QUEUE_MS = 500
+SHED_LEVELS = {'feed': 1, 'search': 1, 'export': 1, 'read': 2}
+SHED_RETRY_AFTER = 5
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -146,6 +320,32 @@ SIMPLE_JWT = {
 
 
 CORS_ALLOW_ALL_ORIGINS = True  
+# so browser clients can send idempotency keys and read the headers
+# the API answers with
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['X-Delta-Cursor', 'Idempotent-Replayed', 'Retry-After']
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+
+# Request metrics, served at /metrics in Prometheus text format.
+# Scrapers must send METRICS_TOKEN as a bearer token; while it's empty
+# /metrics answers 403 unless DEBUG is on.
+METRICS_TOKEN = os.environ.get('MY_VILLAGE_METRICS_TOKEN', '')
+
+# Log requests slower than this many milliseconds, together with their
+# slowest queries, to the 'my_village.slow_requests' logger.
+# None turns the slow-request log off.
+SLOW_REQUEST_THRESHOLD_MS = None
+SLOW_REQUEST_LOG_QUERIES = 5
+
+# Request profiler (my_village/profiling.py). Off unless a request is
+# sampled or carries a signed X-Profile-Request header.
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_HEADER_ENABLED = False
+PROFILE_TOKEN_MAX_AGE = 3600
+# restrict profiling to these URL names, e.g. ['feed', 'search']
+PROFILE_URL_NAMES = None
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_MAX_FILES = 50
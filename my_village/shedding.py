@@ -0,0 +1,153 @@
+"""
+Load shedding: when a worker falls behind, turn the expensive endpoints
+away first so the cheap ones keep answering.
+
+A worker is overloaded when either
+
+  * more than SHED_MAX_IN_FLIGHT requests are running in its process, or
+  * a request waited in the front proxy's queue for longer than
+    SHED_MAX_QUEUE_MS before a worker picked it up. The wait is read off
+    the X-Request-Start header the proxy stamps on the way in, e.g. for
+    nginx: proxy_set_header X-Request-Start "t=${msec}";
+
+and severely overloaded past twice either limit. SHED_LEVELS says from
+which level each endpoint class (see throttling.py) is turned away:
+search, the feed and exports as soon as the worker is overloaded, other
+reads once it's severe. Writes, logins and everything outside the API
+are never shed.
+
+A shed request is answered 503 with Retry-After before any
+authentication or database work, so it costs next to nothing. Work
+that finds out later that it can't be taken on now (a full password
+hashing pool, users/hashing.py) raises Overloaded, and is answered
+the same way from wherever it was raised. Retry-After
+is SHED_RETRY_AFTER seconds plus up to as many again, so the clients
+that were turned away together don't all come back together. Batches
+(batch.py) are admitted as a write, and their sub-requests are checked
+one by one.
+"""
+import json
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+from .throttling import endpoint_class
+
+REQUEST_START_HEADER = 'X-Request-Start'
+SEVERE = 2
+
+
+class Overloaded(Exception):
+    """Raised to turn a request away like a shed one, 503 with Retry-After."""
+
+
+def queue_ms(request, now=None):
+    """How long (ms) the request waited before reaching us, or None if unknown."""
+    value = request.headers.get(REQUEST_START_HEADER, '')
+    try:
+        stamp = float(value.removeprefix('t='))
+    except ValueError:
+        return None
+    # proxies stamp seconds (nginx), milliseconds or microseconds (Apache)
+    if stamp > 1e14:
+        stamp /= 1_000_000
+    elif stamp > 1e11:
+        stamp /= 1000
+    return max((time.time() if now is None else now) - stamp, 0.0) * 1000
+
+
+def _level(value, limit):
+    if not limit or value is None or value <= limit:
+        return 0
+    return SEVERE if value > limit * 2 else 1
+
+
+def sheds(view_func, method, level):
+    """Whether a request to this view is turned away at this overload level."""
+    view_class = getattr(view_func, 'cls', None)
+    if not level or view_class is None:
+        return False
+    shed_from = getattr(settings, 'SHED_LEVELS', {}).get(endpoint_class(view_class, method))
+    return shed_from is not None and level >= shed_from
+
+
+def shed_response():
+    retry_after = getattr(settings, 'SHED_RETRY_AFTER', 5)
+    body = json.dumps({"error": "The server is busy, try again shortly."}, separators=(',', ':'))
+    response = HttpResponse(body, status=503, content_type='application/json')
+    response['Retry-After'] = str(random.randint(retry_after, retry_after * 2))
+    return response
+
+
+class LoadSheddingMiddleware:
+    """
+    Counts the requests in flight in this process and, while it's
+    overloaded, answers the sheddable ones itself. The level is left on
+    request.overload for batches to check their sub-requests against.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        shed = self.admit(request)
+        if shed is not None:
+            return shed
+        try:
+            return self.get_response(request)
+        finally:
+            self.leave()
+
+    async def __acall__(self, request):
+        shed = self.admit(request)
+        if shed is not None:
+            return shed
+        try:
+            return await self.get_response(request)
+        finally:
+            self.leave()
+
+    def admit(self, request):
+        """Count the request in, or return the 503 that sheds it."""
+        with self.lock:
+            self.in_flight += 1
+            in_flight = self.in_flight
+        request.overload = max(
+            _level(in_flight, getattr(settings, 'SHED_MAX_IN_FLIGHT', None)),
+            _level(queue_ms(request), getattr(settings, 'SHED_MAX_QUEUE_MS', None)),
+        )
+        if not request.overload:
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if not sheds(match.func, request.method, request.overload):
+            return None
+        self.leave()
+        # so /metrics counts the 503 against the view it kept away
+        request.resolver_match = match
+        return shed_response()
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, Overloaded):
+            return shed_response()
+        return None
@@ -0,0 +1,99 @@
+"""
+Per-user rate limits, one token bucket per user and endpoint class.
+
+A view's endpoint class is its `throttle_scope` ('feed', 'search',
+'export', ...), or 'read' / 'write' by method for views without one.
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] gives each class a rate like
+'30/min': a bucket of 30 tokens, refilled evenly over the minute, so a
+client can burst up to 30 requests and then gets one every 2 seconds.
+A class without a rate isn't limited. Anonymous requests are counted
+per client IP instead of per user.
+
+Buckets live in the Django cache so every worker draws from the same
+one (the cache has to be shared, see the production checklist). Each
+bucket is a single integer, the moment (in ms) its debt is paid off,
+and taking a token is an atomic incr() of that moment; no worker ever
+reads, changes and writes it back, so there's no race to lose under
+concurrent requests. A bucket whose moment has passed is full and
+starts again from now; every take keeps the key for another ten
+periods, so a bucket in debt never expires into a full one. An
+over-limit request gets its token back and is answered 429 with
+Retry-After: the seconds until a token is free.
+"""
+import time
+
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'30/min' -> (30, 60): tokens per bucket, seconds to refill it."""
+    tokens, period = rate.split('/')
+    return int(tokens), PERIODS[period[0]]
+
+
+def endpoint_class(view_class, method):
+    """The endpoint class a request to `view_class` is counted under."""
+    # the async views (async_views.py) stand in for their sync view
+    view_class = getattr(view_class, 'sync_view', None) or view_class
+    scope = getattr(view_class, 'throttle_scope', None)
+    if scope:
+        return scope
+    return 'read' if method in SAFE_METHODS else 'write'
+
+
+def take(key, tokens, period, now=None):
+    """
+    Take a token from the bucket at `key`. Returns 0 when there was one,
+    otherwise the seconds until there will be.
+    """
+    now = int((time.time() if now is None else now) * 1000)
+    interval = max(period * 1000 // tokens, 1)
+    # an idle bucket is full long before this; the key only has to
+    # outlive the busy ones
+    timeout = period * 10
+    try:
+        paid_off = cache.incr(key, interval)
+    except ValueError:
+        cache.add(key, now, timeout)
+        paid_off = cache.incr(key, interval)
+    if paid_off - interval < now:
+        # the bucket had filled up again: start over from now. Two
+        # workers doing this at once hand out one extra token, at most
+        paid_off = now + interval
+        cache.set(key, paid_off, timeout)
+    else:
+        # incr() keeps the old expiry: a client that never lets its
+        # bucket fill would otherwise get a full one when the key expires
+        cache.touch(key, timeout)
+    over = paid_off - now - tokens * interval
+    if over > 0:
+        cache.decr(key, interval)
+        return over / 1000
+    return 0
+
+
+class EndpointThrottle(BaseThrottle):
+    """Token-bucket throttle for DEFAULT_THROTTLE_CLASSES."""
+
+    delay = None
+
+    def allow_request(self, request, view):
+        scope = endpoint_class(type(view), request.method)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        user = request.user
+        if user and user.is_authenticated:
+            ident = user.pk
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        self.delay = take(f'throttle:{scope}:{ident}', *parse_rate(rate))
+        return not self.delay
+
+    def wait(self):
+        return self.delay
@@ -5,9 +5,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from .batch import BatchView
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/batch/', BatchView.as_view(), name='batch'),
     path('api/users/', include('users.urls')),
     path('api/posts/', include('posts.urls')),
     path('api/social/', include('social.urls')),
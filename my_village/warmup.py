@@ -0,0 +1,106 @@
+"""
+Worker warm-up: build at boot what the first requests would otherwise
+build on the clock.
+
+A fresh worker compiles the URL patterns, walks every model's fields,
+builds each serializer's fields and fast-path plan (fastpath.py),
+loads the translation catalogs DRF's messages come from, sets up the
+JWT signing key and connects to the database, all lazily on first use,
+so the first requests after a scale-out are the slow ones. wsgi.py and
+asgi.py call warm_up() once the application is loaded, when
+WARM_UP_WORKERS is on.
+
+Everything but the database connections is plain in-process state, so
+with gunicorn --preload it's built once in the master and shared by
+the forked workers. Connections must not be shared across a fork: for
+--preload set WARM_UP_CONNECTIONS = False and call open_connections()
+from gunicorn's post_fork hook instead. A connection opened here only
+outlives the first request with persistent connections (CONN_MAX_AGE)
+or a connection pool.
+"""
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+from django.utils import translation
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .fastpath import plan_for
+
+
+def _patterns(patterns):
+    for pattern in patterns:
+        yield pattern
+        if isinstance(pattern, URLResolver):
+            yield from _patterns(pattern.url_patterns)
+
+
+def view_classes():
+    """The view class behind every route, async views' sync views included."""
+    classes = []
+    for pattern in _patterns(get_resolver().url_patterns):
+        view_class = getattr(getattr(pattern, 'callback', None), 'cls', None)
+        for cls in (view_class, getattr(view_class, 'sync_view', None)):
+            if cls is not None and cls not in classes:
+                classes.append(cls)
+    return classes
+
+
+def warm_urls():
+    resolver = get_resolver()
+    for pattern in _patterns(resolver.url_patterns):
+        # regexes are compiled on first match
+        pattern.pattern.regex
+    # reverse() and {% url %} lookups
+    resolver.reverse_dict
+
+
+def warm_models():
+    for model in apps.get_models():
+        model._meta.get_fields()
+
+
+def warm_serializers():
+    serializer_classes = {getattr(cls, 'serializer_class', None) for cls in view_classes()}
+    for serializer_class in serializer_classes - {None}:
+        serializer_class().fields
+        plan_for(serializer_class)
+
+
+def warm_translations():
+    # DRF's error messages are lazy translations; the first one loads
+    # every installed app's catalog
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('Not found.')
+
+
+def warm_jwt():
+    # signs and verifies one token: loads the algorithm and prepares the key
+    AccessToken(str(AccessToken()))
+
+
+def open_connections():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+STEPS = [
+    ('urls', warm_urls),
+    ('models', warm_models),
+    ('serializers', warm_serializers),
+    ('translations', warm_translations),
+    ('jwt', warm_jwt),
+]
+
+
+def warm_up(connect=True):
+    """Run every warm-up step; returns [(step, seconds)] in the order run."""
+    steps = STEPS + [('connections', open_connections)] if connect else STEPS
+    timings = []
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings.append((name, time.perf_counter() - start))
+    return timings
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_village.settings')
 
 application = get_wsgi_application()
+
+# build what the first requests would otherwise build (my_village/warmup.py)
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_UP_WORKERS:
+    from my_village.warmup import warm_up
+
+    warm_up(connect=settings.WARM_UP_CONNECTIONS)
@@ -1,3 +1,12 @@
 from django.contrib import admin
 
-# Register your models here.
+from my_village.admin import LargeTableAdmin
+from .models import Notification
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ['id', 'recipient', 'sender', 'notification_type', 'post_id', 'is_read', 'created_at']
+    list_filter = ['notification_type', 'is_read']
+    list_select_related = ['recipient', 'sender']
+    raw_id_fields = ['recipient', 'sender', 'post']
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class NotificationsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'notifications'
+
+    def ready(self):
+        import notifications.signals  # delta-sync marks and tombstones
@@ -0,0 +1,22 @@
+"""
+Where notifications are sent from.
+
+notify() is the one way the API creates notifications, so a recipient's
+mutes and blocks (users/exclusions.py) are applied before anything is
+written: a notification from someone they excluded never exists, and
+their notification list needs no filtering to hide it.
+"""
+from users.exclusions import excluded_ids
+from .models import Notification
+
+
+def notify(recipient, sender, notification_type, post=None):
+    """Create the notification, unless `recipient` excluded `sender`; returns it or None."""
+    if sender.pk in excluded_ids(recipient):
+        return None
+    return Notification.objects.create(
+        recipient=recipient,
+        sender=sender,
+        notification_type=notification_type,
+        post=post
+    )
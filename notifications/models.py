@@ -32,9 +32,15 @@ class Notification(models.Model):
     )
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # moves when the notification is read, for ?since= delta sync
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at'], name='notif_recipient_created_idx'),
+            models.Index(fields=['recipient', 'updated_at'], name='notif_recipient_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} → {self.recipient.username} ({self.notification_type})"
\ No newline at end of file
@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from .models import Notification
 from users.serializers import UserSerializer
+from my_village.fieldsets import SparseFieldsetMixin
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # Nested the full sender object so the frontend knows
     # exactly who triggered the notification without
     # making a second API call to look up the user.
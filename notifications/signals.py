@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from my_village.delta import bump
+from users.models import Tombstone
+from users.purge import bury, chunk_purged
+from .models import Notification
+
+
+@receiver(post_save, sender=Notification)
+def notification_changed(sender, instance, **kwargs):
+    bump('notification', [instance.recipient_id])
+
+
+@receiver(chunk_purged, sender=Notification)
+def notifications_purged(sender, rows, job, **kwargs):
+    # so delta sync can tell the recipients' clients to drop them
+    bury(Tombstone.NOTIFICATION, [(row['recipient_id'], row['id']) for row in rows])
+    bump('notification', [row['recipient_id'] for row in rows])
@@ -1,3 +1,110 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from my_village.fastpath import plan_for
+from my_village.query_plans import SORT, QueryPlanAssertions
+from my_village.renderers import ORJSONRenderer
+from posts.tests import make_village
+from users.purge import Purger, schedule_post_deletion
+from .models import Notification
+from .serializers import NotificationSerializer
+from .views import NotificationListView
+
+
+class FastPathEquivalenceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        post = cls.therapist.posts.first()
+        Notification.objects.create(recipient=cls.therapist, sender=cls.parent,
+                                     notification_type=Notification.LIKE, post=post)
+        Notification.objects.create(recipient=cls.therapist, sender=cls.admin,
+                                     notification_type=Notification.COMMENT, post=post, is_read=True)
+        Notification.objects.create(recipient=cls.therapist, sender=cls.parent,
+                                     notification_type=Notification.FOLLOW)
+
+    def test_serializer(self):
+        request = Request(APIRequestFactory().get('/api/notifications/'))
+        request.user = self.therapist
+        context = {'request': request}
+        queryset = Notification.objects.all()
+        renderer = ORJSONRenderer()
+        slow = NotificationSerializer(queryset, many=True, context=context).data
+        fast = plan_for(NotificationSerializer, strict=True).serialize(queryset, context)
+        self.assertEqual(renderer.render(fast), renderer.render(slow))
+
+    def test_list_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.therapist)
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            slow = client.get('/api/notifications/')
+        with override_settings(FAST_LIST_SERIALIZATION=True):
+            fast = client.get('/api/notifications/')
+        self.assertEqual(fast.content, slow.content)
+
+
+@override_settings(DELTA_SYNC_OVERLAP_SECONDS=0)
+class NotificationDeltaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.post = cls.therapist.posts.first()
+        cls.like = Notification.objects.create(recipient=cls.therapist, sender=cls.parent,
+                                               notification_type=Notification.LIKE, post=cls.post)
+        Notification.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.therapist)
+
+    def sync(self, cursor):
+        response = self.client.get('/api/notifications/', {'since': cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_delta(self):
+        cursor = self.client.get('/api/notifications/')['X-Delta-Cursor']
+        delta = self.sync(cursor)
+        self.assertEqual((delta['results'], delta['deleted']), ([], []))
+        # nothing moved: answered from the cache alone
+        with self.assertNumQueries(0):
+            delta = self.sync(delta['cursor'])
+
+        follow = Notification.objects.create(recipient=self.therapist, sender=self.admin,
+                                             notification_type=Notification.FOLLOW)
+        delta = self.sync(delta['cursor'])
+        self.assertEqual([n['id'] for n in delta['results']], [follow.pk])
+
+        # reading them all changes both
+        self.client.post('/api/notifications/read-all/')
+        delta = self.sync(delta['cursor'])
+        self.assertEqual({n['id']: n['is_read'] for n in delta['results']},
+                         {follow.pk: True, self.like.pk: True})
+
+        # a deleted post's notifications are dropped once they're purged
+        schedule_post_deletion(self.post)
+        Purger(pause=0).run_pending()
+        delta = self.sync(delta['cursor'])
+        self.assertEqual((delta['results'], delta['deleted']), ([], [self.like.pk]))
+
+
+class QueryPlanTests(QueryPlanAssertions, TestCase):
+
+    def test_notification_list(self):
+        parent, therapist, admin = make_village()
+        self.assertViewIndexed(NotificationListView, therapist)
+
+    def test_notification_delta(self):
+        parent, therapist, admin = make_village()
+        since = timezone.now() - timedelta(minutes=5)
+        # rows off notif_recipient_updated_idx, sorted newest first after
+        queryset = Notification.objects.filter(recipient=therapist, updated_at__gt=since)
+        self.assertIndexed(queryset, allow=(SORT,))
@@ -1,8 +1,9 @@
 from django.urls import path
+from my_village.async_views import read_view
 from . import views
 
 urlpatterns = [
-    path('', views.NotificationListView.as_view(), name='notifications'),
+    path('', read_view(views.AsyncNotificationListView), name='notifications'),
     path('<int:pk>/read/', views.MarkNotificationReadView.as_view(), name='notification-read'),
     path('read-all/', views.MarkAllReadView.as_view(), name='notifications-read-all'),
 ]
\ No newline at end of file
@@ -1,17 +1,43 @@
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from .models import Notification
 from .serializers import NotificationSerializer
+from my_village.delta import DeltaSyncMixin, bump
+from my_village.fastpath import FastListMixin
+from my_village.async_views import AsyncListView
+from users.models import Tombstone
+from users.purge import buried_since
 
 
-class NotificationListView(generics.ListAPIView):
+class NotificationListView(DeltaSyncMixin, FastListMixin, generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         # users only ever see their own notifications
-        return Notification.objects.filter(recipient=self.request.user)
+        # and none about deleted posts waiting to be purged
+        return Notification.objects.filter(recipient=self.request.user).filter(
+            Q(post__isnull=True) | Q(post__deleted_at__isnull=True)
+        )
+
+    # ?since= delta sync, see my_village/delta.py
+    # (a deleted post's notifications are dropped once they're purged)
+
+    def get_delta_marks(self):
+        return [('notification', self.request.user.pk)]
+
+    def get_delta(self, since):
+        user = self.request.user
+        changed = self.get_queryset().filter(updated_at__gt=since)
+        return changed, buried_since(Tombstone.NOTIFICATION, [user.pk], since)
+
+
+class AsyncNotificationListView(AsyncListView):
+    # served under ASGI, see my_village/async_views.py
+    sync_view = NotificationListView
 
 
 class MarkNotificationReadView(APIView):
@@ -37,5 +63,7 @@ class MarkAllReadView(APIView):
         Notification.objects.filter(
             recipient=request.user,
             is_read=False
-        ).update(is_read=True)
+        ).update(is_read=True, updated_at=timezone.now())
+        # update() skips the post_save signal that moves the sync mark
+        bump('notification', [request.user.pk])
         return Response({"status": "all notifications marked as read"})
\ No newline at end of file
@@ -1,3 +1,43 @@
 from django.contrib import admin
 
-# Register your models here.
+from my_village.admin import LargeTableAdmin
+from .models import Post, Comment, Like, Tag, PostTag
+
+
+@admin.register(Post)
+class PostAdmin(LargeTableAdmin):
+    list_display = ['id', 'author', 'created_at', 'deleted_at']
+    list_select_related = ['author']
+    raw_id_fields = ['author']
+
+    def get_queryset(self, request):
+        # Post.objects hides soft-deleted posts; the admin shows everything
+        return Post.all_objects.all()
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ['id', 'author', 'post_id', 'depth', 'reply_count', 'created_at']
+    list_select_related = ['author']
+    raw_id_fields = ['author', 'post', 'parent']
+
+
+@admin.register(Like)
+class LikeAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'post_id', 'created_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user', 'post']
+
+
+@admin.register(Tag)
+class TagAdmin(LargeTableAdmin):
+    list_display = ['name', 'post_count']
+    search_fields = ['name']
+    readonly_fields = ['post_count']
+
+
+@admin.register(PostTag)
+class PostTagAdmin(LargeTableAdmin):
+    list_display = ['id', 'tag', 'post_id', 'created_at']
+    list_select_related = ['tag']
+    raw_id_fields = ['tag', 'post']
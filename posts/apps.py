@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class PostsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'posts'
+
+    def ready(self):
+        import posts.signals  # thread counts during purges, delta-sync marks
@@ -0,0 +1,23 @@
+"""
+Rebuild the #hashtag index from the posts' text.
+
+    python manage.py rebuild_tags
+
+Posts written through the API are indexed as they're saved; this is
+for rows that weren't (bulk imports, restores) or after changing the
+tag rules in posts/tags.py. Runs in one transaction.
+"""
+from django.core.management.base import BaseCommand
+
+from posts.tags import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Re-extract the hashtags of every post and rebuild Tag/PostTag.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        created = rebuild_index(options['chunk_size'])
+        self.stdout.write(f'indexed {created} post tag(s)')
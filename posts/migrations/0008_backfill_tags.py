@@ -0,0 +1,54 @@
+from collections import Counter
+
+from django.db import migrations, transaction
+from django.db.models import Exists, F, OuterRef
+
+from posts.tags import extract_tags
+
+
+def index_existing_posts(apps, schema_editor):
+    # the posts written before the tag index existed; ones the API has
+    # tagged since are left alone. A chunk per transaction, like
+    # rebuild_index() (which rebuilds everything in one)
+    Post = apps.get_model('posts', 'Post')
+    Tag = apps.get_model('posts', 'Tag')
+    PostTag = apps.get_model('posts', 'PostTag')
+    untagged = Post.objects.filter(deleted_at__isnull=True).exclude(
+        Exists(PostTag.objects.filter(post_id=OuterRef('pk')))
+    )
+    last_id = 0
+    while True:
+        chunk = list(
+            untagged.filter(pk__gt=last_id).order_by('pk')
+            .values_list('pk', 'content', 'created_at')[:2000]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        tagged = [(pk, created_at, extract_tags(content)) for pk, content, created_at in chunk]
+        names = {name for _, _, post_names in tagged for name in post_names}
+        if not names:
+            continue
+        with transaction.atomic():
+            Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+            tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+            rows = [
+                PostTag(tag_id=tag_ids[name], post_id=pk, created_at=created_at)
+                for pk, created_at, post_names in tagged for name in post_names
+            ]
+            PostTag.objects.bulk_create(rows)
+            for tag_id, count in Counter(row.tag_id for row in rows).items():
+                Tag.objects.filter(pk=tag_id).update(post_count=F('post_count') + count)
+
+
+class Migration(migrations.Migration):
+    # one transaction per chunk, not one for the whole table
+    atomic = False
+
+    dependencies = [
+        ('posts', '0007_post_author_updated_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_posts, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,13 @@ from django.db import models
 from django.conf import settings
 
 
+class LivePostManager(models.Manager):
+    # soft-deleted posts disappear from every query that goes through
+    # Post.objects (and user.posts); Post.all_objects still sees them
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Post(models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -12,9 +19,22 @@ class Post(models.Model):
     media_url = models.URLField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # set when the post is deleted; users/purge.py removes it for good
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = LivePostManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # an author's posts newest first: profiles and the feed
+            models.Index(fields=['author', '-created_at'], name='post_author_created_idx'),
+            # the global timeline, /api/posts/
+            models.Index(fields=['-created_at'], name='post_created_idx'),
+            # an author's posts changed since a delta-sync cursor
+            models.Index(fields=['author', 'updated_at'], name='post_author_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author.username}: {self.content[:50]}"
@@ -33,12 +53,33 @@ class Comment(models.Model):
     )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # threading (posts/threads.py): the comment this replies to, and the
+    # ids from the top-level comment down to this one, 10 digits each,
+    # so a whole thread is one range of comment_post_path_idx
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='replies'
+    )
+    path = models.CharField(max_length=200, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # kept up to date as replies come and go
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+    descendant_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # a post's comments oldest first, without a sort
+            models.Index(fields=['post', 'created_at'], name='comment_post_created_idx'),
+            # a thread in reading order (depth first, oldest reply first)
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.author.username} on post {self.post.id}"
+        return f"{self.author.username} on post {self.post_id}"
 
 
 class Like(models.Model):
@@ -56,6 +97,57 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ('user', 'post')
+        indexes = [
+            # the unique index leads with user; this one serves a post's
+            # likers and the liked-by-me check from the post side
+            models.Index(fields=['post', 'user'], name='like_post_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} likes post {self.post_id}"
+
+
+class Tag(models.Model):
+    """
+    A #hashtag, stored casefolded. post_count is kept up to date as
+    posts are tagged and untagged (posts/tags.py), so popular tags are
+    read off tag_popularity_idx without counting anything.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-post_count', 'name'], name='tag_popularity_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.name}"
+
+
+class PostTag(models.Model):
+    # the inverted index: one row per tag used in a post
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_tags'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='post_tags'
+    )
+    # copy of the post's created_at, so a tag's posts come off
+    # posttag_tag_created_idx newest first without touching posts_post
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'tag'], name='posttag_post_tag_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', '-created_at'], name='posttag_tag_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} likes post {self.post.id}"
\ No newline at end of file
+        return f"post {self.post_id} #{self.tag_id}"
@@ -0,0 +1,120 @@
+"""
+Cached post payloads for the post detail view and the feed.
+
+A post reads the same for everyone but for is_liked_by_user, so the
+rest of PostSerializer's output is built once and shared through the
+read cache (my_village/cache.py), and is_liked_by_user is filled in per
+request with one query on the like index. Payloads are built through
+PostSerializer's compiled plan (my_village/fastpath.py), a few queries
+for any number of posts. A payload goes stale when
+the post is edited or deleted, gets or loses a like or a comment, or
+its author changes their profile (see signals.py here and in users).
+The follower counts nested in it, the author's and the commenters',
+may be up to READ_CACHE_SECONDS old.
+
+Keys carry the scheme and host the payload was built for, since the
+file URLs in it (profile pictures) are absolute.
+
+posts_by_id() is the bulk fetch behind /api/posts/?ids=: cached payloads
+when it can, else one query for the lot.
+"""
+from django.conf import settings
+from django.db.models import Prefetch
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from my_village.cache import SharedRequest, cached_many, read_cache_enabled
+from my_village.fastpath import plan_for
+from my_village.fieldsets import requested_fieldset
+from .models import Comment, Like, Post
+from .serializers import PostSerializer
+
+
+def payload_key(pk, request):
+    return f'post:{pk}:{request.build_absolute_uri("/")}'
+
+
+def build_payloads(ids, request):
+    """{id: payload} for the live posts among the ids, is_liked_by_user left False."""
+    context = {'request': SharedRequest(request)}
+    queryset = Post.objects.filter(pk__in=ids)
+    plan = plan_for(PostSerializer)
+    # whatever FAST_LIST_SERIALIZATION says: a payload is always the
+    # whole post, which the plan builds the same, in a query or two
+    # where the serializer takes several per post
+    if plan is not None:
+        payloads = plan.assemble(list(plan.values_queryset(queryset, context)), context)
+    else:
+        payloads = PostSerializer(queryset, many=True, context=context).data
+    return {payload['id']: payload for payload in payloads}
+
+
+def post_payloads(ids, request):
+    """The live posts among the ids as the request's user sees them, in order."""
+    keys = {payload_key(pk, request): pk for pk in ids}
+
+    def build_many(wanted):
+        built = build_payloads([keys[key] for key in wanted], request)
+        return {
+            key: (built[keys[key]], [('post', keys[key]), ('user', built[keys[key]]['author']['id'])])
+            for key in wanted if keys[key] in built
+        }
+
+    found = cached_many(list(keys), build_many)
+    liked = set()
+    if found and request.user.is_authenticated:
+        liked = set(Like.objects.filter(
+            user=request.user, post_id__in=list(keys.values())
+        ).values_list('post_id', flat=True))
+    return [
+        dict(found[key], is_liked_by_user=pk in liked)
+        for key, pk in keys.items() if key in found
+    ]
+
+
+def posts_by_id(ids, request, context):
+    """
+    {id: post as the request's user sees it} for the live posts among
+    the ids. Without the read cache they're read in one query, the
+    plan's or one with authors and comments prefetched.
+    """
+    if read_cache_enabled(request):
+        return {post['id']: post for post in post_payloads(ids, request)}
+    queryset = Post.objects.filter(pk__in=ids)
+    plan = plan_for(PostSerializer)
+    if getattr(settings, 'FAST_LIST_SERIALIZATION', False) and plan is not None and not requested_fieldset(request):
+        rows = list(plan.values_queryset(queryset, context))
+        return {row[plan.pk_index]: item for row, item in zip(rows, plan.assemble(rows, context))}
+    posts = list(queryset.select_related('author').prefetch_related(
+        Prefetch('comments', queryset=Comment.objects.select_related('author'))
+    ))
+    # keyed by the instances: ?fields= may leave the ids out
+    data = PostSerializer(posts, many=True, context=context).data
+    return {post.pk: item for post, item in zip(posts, data)}
+
+
+class CachedPostListMixin:
+    """
+    ListAPIView mixin for lists of posts: the page is read as ids and
+    the posts come from post_payloads(). Sparse fieldsets, and every
+    request while the read cache is off, take the regular path.
+    """
+
+    def list(self, request, *args, **kwargs):
+        try:
+            data = self.cached_read()
+        except NotFound:
+            data = None
+        if data is None:
+            return super().list(request, *args, **kwargs)
+        return Response(data)
+
+    def cached_read(self):
+        """The response body from cached payloads, or None."""
+        if not read_cache_enabled(self.request):
+            return None
+        ids = self.filter_queryset(self.get_queryset()).values_list('pk', flat=True)
+        page = self.paginate_queryset(ids)
+        if page is None:
+            return post_payloads(ids, self.request)
+        return self.get_paginated_response(post_payloads(page, self.request)).data
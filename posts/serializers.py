@@ -1,9 +1,11 @@
 from rest_framework import serializers
-from .models import Post, Comment, Like
+from .models import Post, Comment, Like, Tag
 from users.serializers import UserSerializer
+from my_village.fastpath import count_related, exists_for_request_user
+from my_village.fieldsets import SparseFieldsetMixin
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # author is read_only because the author is always the
     # logged-in user making the request — not client-supplied.
     # This prevents user A from posting a comment attributed to user B.
@@ -11,11 +13,17 @@ class CommentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Comment
-        fields = ['id', 'author', 'content', 'created_at']
+        fields = ['id', 'author', 'content', 'created_at', 'parent', 'depth', 'reply_count', 'descendant_count']
         read_only_fields = ['author', 'created_at']
 
+    def validate_parent(self, value):
+        # a reply's place in its thread is fixed (posts/threads.py)
+        if self.instance is not None and value != self.instance.parent:
+            raise serializers.ValidationError('Comments cannot be moved to another thread.')
+        return value
 
-class PostSerializer(serializers.ModelSerializer):
+
+class PostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     likes_count = serializers.SerializerMethodField()
     comments_count = serializers.SerializerMethodField()
@@ -26,6 +34,14 @@ class PostSerializer(serializers.ModelSerializer):
     # state on any frontend without a separate API call.
     is_liked_by_user = serializers.SerializerMethodField()
 
+    # SQL versions of the method fields for the values() fast path
+    # used by list views (my_village/fastpath.py)
+    fast_fields = {
+        'likes_count': count_related(Like, 'post'),
+        'comments_count': count_related(Comment, 'post'),
+        'is_liked_by_user': exists_for_request_user(Like, 'post'),
+    }
+
     class Meta:
         model = Post
         fields = [
@@ -59,4 +75,10 @@ class LikeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Like
         fields = ['id', 'user', 'post', 'created_at']
-        read_only_fields = ['user', 'created_at']
\ No newline at end of file
+        read_only_fields = ['user', 'created_at']
+
+
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['name', 'post_count']
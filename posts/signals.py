@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from my_village.cache import touch
+from my_village.delta import bump
+from users.models import DeletionJob
+from users.purge import chunk_purged
+from .models import Post, Comment, Like
+from .threads import ancestor_ids, recount
+
+
+@receiver(post_save, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    # new, edited or deleted: followers' feeds have something to sync
+    bump('post', [instance.author_id])
+    touch('post', [instance.pk])
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def post_counts_changed(sender, instance, **kwargs):
+    # cached post payloads carry the counts and the comments
+    touch('post', [instance.post_id])
+
+
+@receiver(chunk_purged, sender=Like)
+@receiver(chunk_purged, sender=Comment)
+def post_counts_purged(sender, rows, **kwargs):
+    touch('post', [row['post_id'] for row in rows])
+
+
+@receiver(chunk_purged, sender=Comment)
+def recount_threads(sender, rows, job, **kwargs):
+    # a purged post takes all its threads with it, nothing to fix up
+    if job.kind == DeletionJob.POST:
+        return
+    # comments purged from the middle of other people's threads (and
+    # the replies that cascaded with them) leave stale counts above them
+    parents = {row['parent_id'] for row in rows if row['parent_id']}
+    affected = set()
+    for pk, path in Comment.objects.filter(pk__in=parents).values_list('pk', 'path'):
+        affected.add(pk)
+        affected.update(ancestor_ids(path))
+    recount(affected)
@@ -0,0 +1,106 @@
+"""
+#hashtags as an inverted index.
+
+    sync_tags(post)            # after a post is created or edited
+    untag_posts([post.pk])     # when posts are hidden or deleted
+
+Tags are pulled out of the post text, casefolded ("#Sleep" and
+"#sleep" are one tag) and kept in Tag, with one PostTag row per tag a
+post uses. Both functions only touch the tags that changed, and adjust
+Tag.post_count in the same transaction, so listing a tag's posts
+and ranking tags never reads posts_post.
+"""
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Post, Tag, PostTag
+
+MAX_TAG_LENGTH = 50
+# '#' not glued to a preceding word (so not URL fragments), then word
+# characters with at least one letter: #sleep, #ADHD, #2yo — not #1
+TAG_PATTERN = re.compile(r'(?<![\w&/])#(\w*[^\W\d_]\w*)')
+
+
+def normalize(name):
+    return name.lstrip('#').casefold()
+
+
+def extract_tags(text):
+    """The distinct tag names in `text`, in order of appearance."""
+    names = []
+    for match in TAG_PATTERN.finditer(text or ''):
+        name = normalize(match.group(1))
+        if len(name) <= MAX_TAG_LENGTH and name not in names:
+            names.append(name)
+    return names
+
+
+def sync_tags(post):
+    """Make the post's PostTag rows match the tags in its content."""
+    wanted = set(extract_tags(post.content))
+    current = dict(PostTag.objects.filter(post=post).values_list('tag__name', 'tag_id'))
+    added = wanted - current.keys()
+    removed = [current[name] for name in current.keys() - wanted]
+    if not added and not removed:
+        return
+
+    with transaction.atomic():
+        if removed:
+            PostTag.objects.filter(post=post, tag_id__in=removed).delete()
+            Tag.objects.filter(pk__in=removed).update(post_count=F('post_count') - 1)
+        if added:
+            Tag.objects.bulk_create([Tag(name=name) for name in added], ignore_conflicts=True)
+            tag_ids = list(Tag.objects.filter(name__in=added).values_list('pk', flat=True))
+            PostTag.objects.bulk_create([
+                PostTag(tag_id=tag_id, post=post, created_at=post.created_at) for tag_id in tag_ids
+            ])
+            Tag.objects.filter(pk__in=tag_ids).update(post_count=F('post_count') + 1)
+
+
+def untag_posts(post_ids):
+    """Take posts out of the index, e.g. once they're deleted."""
+    with transaction.atomic():
+        rows = PostTag.objects.filter(post_id__in=post_ids)
+        counts = Counter(rows.values_list('tag_id', flat=True))
+        if not counts:
+            return
+        rows.delete()
+        for tag_id, count in counts.items():
+            Tag.objects.filter(pk=tag_id).update(post_count=F('post_count') - count)
+
+
+def rebuild_index(chunk_size=2000):
+    """
+    Re-extract every live post's tags from scratch, for posts written
+    without going through the API (bulk imports, seed_village).
+    Returns the number of PostTag rows created.
+    """
+    created = 0
+    with transaction.atomic():
+        PostTag.objects.all().delete()
+        Tag.objects.update(post_count=0)
+        last_id = 0
+        while True:
+            chunk = list(
+                Post.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', 'content', 'created_at')[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            tagged = [(pk, created_at, extract_tags(content)) for pk, content, created_at in chunk]
+            names = {name for _, _, post_names in tagged for name in post_names}
+            Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+            tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+            rows = [
+                PostTag(tag_id=tag_ids[name], post_id=pk, created_at=created_at)
+                for pk, created_at, post_names in tagged for name in post_names
+            ]
+            PostTag.objects.bulk_create(rows)
+            created += len(rows)
+            for tag_id, count in Counter(row.tag_id for row in rows).items():
+                Tag.objects.filter(pk=tag_id).update(post_count=F('post_count') + count)
+    return created
@@ -1,3 +1,752 @@
-from django.test import TestCase
+import threading
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from my_village import async_views
+from my_village.cache import cached, lock_key, touch
+from my_village.fastpath import plan_for
+from my_village.fieldsets import parse_field_paths
+from my_village.parsers import ORJSONParser
+from my_village.query_plans import QueryPlanAssertions
+from my_village.renderers import ORJSONRenderer
+from notifications.models import Notification
+from notifications.views import AsyncNotificationListView
+from social.views import AsyncFeedView
+from users.models import User, ParentProfile, TherapistProfile, DeletionJob
+from users.purge import Purger, chunk_purged, schedule_user_deletion
+from users.views import AsyncUserProfileView
+from .models import Post, Comment, Like, Tag, PostTag
+from .serializers import PostSerializer, CommentSerializer
+from .tags import extract_tags, rebuild_index
+from .threads import MAX_DEPTH, subtree
+from .views import AsyncPostDetailView, CommentListCreateView, PostListCreateView, TagCursorPagination
+
+
+def make_village():
+    parent = User.objects.create_user(username='jane', password='x', role=User.PARENT, bio='Mum of two')
+    ParentProfile.objects.filter(user=parent).update(
+        number_of_children=2, children_age_range='4-8 years', concerns='Sleep'
+    )
+    therapist = User.objects.create_user(
+        username='dr_smith', password='x', role=User.THERAPIST,
+        profile_picture='profile_pictures/smith.png'
+    )
+    TherapistProfile.objects.filter(user=therapist).update(
+        license_number='LIC-1', specialization='ADHD', years_of_experience=8, is_verified=True
+    )
+    # no profile row at all, like accounts created outside registration
+    admin = User.objects.create_user(username='admin', password='x', role='')
+    parent.following.add(therapist, admin)
+    therapist.following.add(parent)
+
+    busy = Post.objects.create(author=therapist, content='Bedtime tips ✨', media_url='https://example.com/a.jpg')
+    quiet = Post.objects.create(author=parent, content='Any advice?')
+    Post.objects.create(author=admin, content='Welcome everyone')
+    Comment.objects.create(author=parent, post=busy, content='Thank you!')
+    Comment.objects.create(author=admin, post=busy, content='Pinned')
+    Comment.objects.create(author=therapist, post=quiet, content='Try a routine.')
+    Like.objects.create(user=parent, post=busy)
+    Like.objects.create(user=admin, post=busy)
+    Like.objects.create(user=therapist, post=quiet)
+    return parent, therapist, admin
+
+
+class FastPathEquivalenceTests(TestCase):
+    """The compiled values() path must produce byte-identical JSON."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def context_for(self, user):
+        request = Request(APIRequestFactory().get('/api/posts/'))
+        request.user = user
+        return {'request': request}
+
+    def assertSameJSON(self, serializer_class, queryset, user):
+        renderer = ORJSONRenderer()
+        context = self.context_for(user)
+        slow = serializer_class(queryset, many=True, context=context).data
+        fast = plan_for(serializer_class, strict=True).serialize(queryset, context)
+        self.assertEqual(renderer.render(fast), renderer.render(slow))
+
+    def test_posts(self):
+        for user in (self.parent, self.therapist, self.admin):
+            self.assertSameJSON(PostSerializer, Post.objects.all(), user)
+
+    def test_posts_anonymous(self):
+        self.assertSameJSON(PostSerializer, Post.objects.all(), AnonymousUser())
+
+    def test_comments(self):
+        self.assertSameJSON(CommentSerializer, Comment.objects.all(), self.parent)
+
+    def test_empty_page(self):
+        self.assertSameJSON(PostSerializer, Post.objects.none(), self.parent)
+
+    def test_list_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.parent)
+        busy = Post.objects.get(content__startswith='Bedtime')
+        for url in ['/api/posts/', '/api/posts/?page=2', '/api/social/feed/',
+                    '/api/social/search/?q=e', f'/api/posts/{busy.pk}/comments/']:
+            with self.settings(REST_FRAMEWORK={'PAGE_SIZE': 2, 'DEFAULT_PAGINATION_CLASS':
+                                               'rest_framework.pagination.PageNumberPagination'}):
+                with override_settings(FAST_LIST_SERIALIZATION=False):
+                    slow = client.get(url)
+                with override_settings(FAST_LIST_SERIALIZATION=True):
+                    fast = client.get(url)
+            self.assertEqual(fast.status_code, slow.status_code, url)
+            self.assertEqual(fast.content, slow.content, url)
+
+
+class SparseFieldsetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.busy = Post.objects.get(content__startswith='Bedtime')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+
+    def post(self, **params):
+        response = self.client.get(f'/api/posts/{self.busy.pk}/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_parse_field_paths(self):
+        self.assertEqual(parse_field_paths('id, author.username,author.id,,comments.'),
+                         {'id': {}, 'author': {'username': {}, 'id': {}}, 'comments': {}})
+
+    def test_only_the_fields_asked_for(self):
+        self.assertEqual(self.post(fields='id,content'), {'id': self.busy.pk, 'content': 'Bedtime tips ✨'})
+        # unknown names are ignored, not an error
+        self.assertEqual(self.post(fields='id,nope,author.nope'), {'id': self.busy.pk, 'author': {}})
+        self.assertEqual(self.post(fields='nope'), {})
+
+    def test_nested_objects(self):
+        # listed alone, a nested object comes back as its key
+        post = self.post(fields='author,comments')
+        self.assertEqual(post['author'], self.therapist.pk)
+        self.assertEqual(sorted(post['comments']), sorted(self.busy.comments.values_list('pk', flat=True)))
+        # expanded, whole, and narrowed to the dotted paths
+        self.assertEqual(self.post(fields='author', expand='author')['author']['username'], 'dr_smith')
+        self.assertIn('bio', self.post(fields='author', expand='author')['author'])
+        self.assertEqual(self.post(fields='author.username,comments.content'), {
+            'author': {'username': 'dr_smith'},
+            'comments': [{'content': 'Thank you!'}, {'content': 'Pinned'}],
+        })
+
+    def test_skipped_fields_cost_no_queries(self):
+        def queries(**params):
+            with CaptureQueriesContext(connection) as captured:
+                self.post(**params)
+            return len(captured)
+        with self.settings(READ_CACHE_SECONDS=0):
+            self.assertLess(queries(fields='id,content'), queries())
+
+    def test_writes_ignore_fields(self):
+        response = self.client.patch(f'/api/posts/{Post.objects.get(author=self.parent).pk}/?fields=id',
+                                     {'content': 'Edited'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content'], 'Edited')
+        self.assertIn('likes_count', response.json())
+
+
+class ORJSONTests(TestCase):
+
+    def test_renders_like_drf(self):
+        data = {
+            'text': 'Bedtime tips ✨ \u2028 line', 'amount': Decimal('1.50'), 'none': None,
+            'at': datetime(2026, 1, 2, 3, 4, 5, 600000, tzinfo=dt_timezone.utc), 'nested': [1, {'a': True}],
+        }
+        ours = ORJSONRenderer().render(data)
+        self.assertEqual(ours, JSONRenderer().render(data))
+        self.assertNotIn('\u2028'.encode(), ours)
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        self.assertEqual(ORJSONRenderer().render({1: 'a'}), b'{"1":"a"}')
+        indented = ORJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(indented, b'{\n  "a": 1\n}')
+
+    def test_parses_like_drf(self):
+        body = '{"content": "Bedtime ✨", "ids": [1, 2], "deep": {"x": null}}'.encode()
+        self.assertEqual(ORJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"content": '))
+        # and back again
+        self.assertEqual(ORJSONParser().parse(BytesIO(ORJSONRenderer().render({'a': [1, 'b']}))), {'a': [1, 'b']})
+
+    def test_without_orjson(self):
+        data = {'text': 'Bedtime ✨', 'amount': Decimal('2')}
+        with mock.patch('my_village.renderers.orjson', None), mock.patch('my_village.parsers.orjson', None):
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+            self.assertEqual(ORJSONParser().parse(BytesIO(b'{"a": 1}')), {'a': 1})
+
+    def test_api_round_trip(self):
+        parent, therapist, admin = make_village()
+        client = APIClient()
+        client.force_authenticate(parent)
+        response = client.post('/api/posts/', '{"content": "Hello \u2728"}', content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(Post.objects.get(pk=response.json()['id']).content, 'Hello ✨')
+
+
+class AsyncViewTests(TestCase):
+    """The ASGI views must answer exactly like the DRF views they replace."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.busy = Post.objects.get(content__startswith='Bedtime')
+        Notification.objects.create(recipient=cls.parent, sender=cls.therapist,
+                                     notification_type=Notification.FOLLOW)
+
+    def headers_for(self, user):
+        if user is None:
+            return {}
+        return {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    async def assertSameResponse(self, url, user, method='get', data=None):
+        headers = self.headers_for(user)
+        match = resolve(url.split('?')[0])
+        view_class = {
+            'feed': AsyncFeedView, 'notifications': AsyncNotificationListView,
+            'post-detail': AsyncPostDetailView, 'profile': AsyncUserProfileView,
+        }[match.url_name]
+        request = getattr(AsyncRequestFactory(), method)(url, data, content_type='application/json', headers=headers)
+        fast = await view_class.as_view()(request, **match.kwargs)
+        if hasattr(fast, 'render'):
+            fast.render()
+        slow = await sync_to_async(getattr(APIClient(), method))(url, data, format='json', headers=headers)
+        self.assertEqual(fast.status_code, slow.status_code, url)
+        self.assertEqual(fast.content, slow.content, url)
+        for header in ('Content-Type', 'Allow'):
+            self.assertEqual(fast.get(header), slow.get(header), (url, header))
+        # the test client also runs the CORS middleware, which adds Origin
+        self.assertIn('Accept', fast.get('Vary', ''))
+        return fast
+
+    def test_views_are_async(self):
+        # Django only awaits views marked as coroutine functions
+        for view_class in (AsyncFeedView, AsyncNotificationListView, AsyncPostDetailView, AsyncUserProfileView):
+            self.assertTrue(iscoroutinefunction(view_class.as_view()), view_class)
+
+    async def test_lists(self):
+        # PageNumberPagination reads PAGE_SIZE at import time
+        with mock.patch.object(PageNumberPagination, 'page_size', 1):
+            for url in ['/api/social/feed/', '/api/social/feed/?page=2', '/api/notifications/']:
+                response = await self.assertSameResponse(url, self.parent)
+                self.assertIn('X-Delta-Cursor', response)
+            # empty first page, out-of-range and bad page numbers
+            await self.assertSameResponse('/api/social/feed/', self.admin)
+            await self.assertSameResponse('/api/social/feed/?page=3', self.parent)
+            await self.assertSameResponse('/api/social/feed/?page=x', self.parent)
+
+    async def test_details(self):
+        for user in (self.parent, self.admin):
+            await self.assertSameResponse(f'/api/posts/{self.busy.pk}/', user)
+        await self.assertSameResponse('/api/posts/999/', self.parent)
+        await self.assertSameResponse('/api/users/profile/dr_smith/', self.parent)
+        await self.assertSameResponse('/api/users/profile/dr_smith/', None)
+        await self.assertSameResponse('/api/users/profile/nobody/', None)
+
+    async def test_throttled(self):
+        rates = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'feed': '2/min'}}
+        await sync_to_async(cache.clear)()
+        with override_settings(REST_FRAMEWORK=rates):
+            # the async view and the sync one each take a token, and
+            # then both answer 429
+            await self.assertSameResponse('/api/social/feed/', self.parent)
+            response = await self.assertSameResponse('/api/social/feed/', self.parent)
+        self.assertEqual(response.status_code, 429)
+
+    async def test_fallback_takes_one_token(self):
+        rates = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'feed': '1/min'}}
+        await sync_to_async(cache.clear)()
+        headers = self.headers_for(self.parent)
+        with override_settings(REST_FRAMEWORK=rates):
+            # allowed() takes the only token, then the bad page number
+            # hands the request to the sync view, which answers the 404
+            # without charging it again
+            for status in (404, 429):
+                request = AsyncRequestFactory().get('/api/social/feed/?page=x', headers=headers)
+                response = await AsyncFeedView.as_view()(request)
+                self.assertEqual(response.status_code, status)
+        # the emptied bucket would throttle the tests after this one
+        await sync_to_async(cache.clear)()
+
+    async def test_handed_to_sync_view(self):
+        await self.assertSameResponse('/api/social/feed/', None)
+        await self.assertSameResponse('/api/social/feed/?fields=id,content', self.parent)
+        await self.assertSameResponse('/api/notifications/?since=x', self.parent)
+        response = await self.assertSameResponse(f'/api/posts/{self.busy.pk}/', self.parent,
+                                                 method='patch', data={'content': 'mine?'})
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(READ_CACHE_SECONDS=0)
+class AsyncLookupTests(TransactionTestCase):
+    # committed data, so the lookups' own connections can see it
+
+    async def test_independent_lookups_overlap(self):
+        await sync_to_async(cache.clear)()
+        parent, therapist, admin = await sync_to_async(make_village)()
+        busy = await Post.objects.aget(content__startswith='Bedtime')
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(parent).access_token}'}
+        closing = async_views._closing
+        met = threading.Barrier(2, timeout=5)
+        calls = []
+
+        def spy(func, *args):
+            calls.append(func)
+            # both lookups have to be running at once to get past this
+            met.wait()
+            return closing(func, *args)
+
+        with mock.patch.object(async_views, '_closing', spy), \
+                mock.patch.object(PageNumberPagination, 'page_size', 1):
+            for view_class, url, kwargs in [(AsyncFeedView, '/api/social/feed/', {}),
+                                            (AsyncPostDetailView, f'/api/posts/{busy.pk}/', {'pk': busy.pk})]:
+                calls.clear()
+                request = AsyncRequestFactory().get(url, headers=headers)
+                fast = await view_class.as_view()(request, **kwargs)
+                slow = await sync_to_async(APIClient().get)(url, headers=headers)
+                self.assertEqual(fast.content, slow.content, url)
+                self.assertEqual(len(calls), 2, url)
+
+
+class PostDeletionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.busy = Post.objects.get(author=cls.therapist)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.therapist)
+
+    def test_delete_hides_then_purges(self):
+        Notification.objects.create(recipient=self.therapist, sender=self.parent,
+                                    notification_type=Notification.LIKE, post=self.busy)
+        response = self.client.delete(f'/api/posts/{self.busy.pk}/')
+        self.assertEqual(response.status_code, 204)
+
+        # hidden everywhere at once, but nothing cascaded yet
+        self.assertEqual(self.client.get(f'/api/posts/{self.busy.pk}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/posts/{self.busy.pk}/comments/').json()['count'], 0)
+        self.assertEqual(self.client.get('/api/notifications/').json()['count'], 0)
+        self.assertNotIn(self.busy.pk, [p['id'] for p in self.client.get('/api/posts/').json()['results']])
+        self.assertEqual(Comment.objects.filter(post=self.busy).count(), 2)
+
+        purged = []
+
+        def on_chunk(sender, rows, **kwargs):
+            purged.append((sender, len(rows)))
+        chunk_purged.connect(on_chunk)
+        self.addCleanup(chunk_purged.disconnect, on_chunk)
+        self.assertEqual(Purger(chunk_size=1, pause=0).run_pending(), 1)
+
+        self.assertFalse(Post.all_objects.filter(pk=self.busy.pk).exists())
+        self.assertFalse(Comment.objects.filter(post_id=self.busy.pk).exists())
+        self.assertFalse(Like.objects.filter(post_id=self.busy.pk).exists())
+        self.assertEqual(purged, [(Notification, 1), (Like, 1), (Like, 1), (Comment, 1), (Comment, 1), (Post, 1)])
+        job = DeletionJob.objects.get()
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(job.progress, {'notifications': 1, 'likes': 2, 'comments': 2, 'posts': 1})
+        self.assertEqual(Purger().run_pending(), 0)
+
+    def test_only_the_author_deletes(self):
+        self.client.force_authenticate(self.parent)
+        self.assertEqual(self.client.delete(f'/api/posts/{self.busy.pk}/').status_code, 403)
+        self.assertFalse(DeletionJob.objects.exists())
+
+
+class TagTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+
+    def counts(self):
+        return {tag['name']: tag['post_count'] for tag in self.client.get('/api/posts/tags/').json()}
+
+    def test_extract_tags(self):
+        self.assertEqual(extract_tags('#Sleep help? #sleep #2yo #1 me@x.com#no https://x.org/#frag #Ünïcode'),
+                         ['sleep', '2yo', 'ünïcode'])
+
+    def test_index_follows_edits(self):
+        post_id = self.client.post('/api/posts/', {'content': 'Rough night #Sleep #toddler'}).json()['id']
+        self.client.post('/api/posts/', {'content': 'Naps? #sleep'})
+        self.assertEqual(self.counts(), {'sleep': 2, 'toddler': 1})
+
+        self.client.patch(f'/api/posts/{post_id}/', {'content': 'Rough night #sleep #anxiety'})
+        self.assertEqual(self.counts(), {'sleep': 2, 'anxiety': 1})
+        self.client.delete(f'/api/posts/{post_id}/')
+        self.assertEqual(self.counts(), {'sleep': 1})
+
+        # rebuilding from the text gives the same index
+        before = set(PostTag.objects.values_list('post_id', 'tag__name'))
+        rebuild_index()
+        self.assertEqual(set(PostTag.objects.values_list('post_id', 'tag__name')), before)
+        self.assertEqual(self.counts(), {'sleep': 1})
+
+    def test_tag_posts_cursor(self):
+        with mock.patch.object(TagCursorPagination, 'page_size', 2):
+            ids = [self.client.post('/api/posts/', {'content': f'#ADHD tip {i}'}).json()['id'] for i in range(5)]
+            response = self.client.get('/api/posts/tags/adhd/').json()
+            self.assertEqual([post['id'] for post in response['results']], ids[::-1][:2])
+            self.assertIn('likes_count', response['results'][0])
+            seen = [post['id'] for post in response['results']]
+            while response['next']:
+                response = self.client.get(response['next']).json()
+                seen += [post['id'] for post in response['results']]
+            self.assertEqual(seen, ids[::-1])
+            with override_settings(FAST_LIST_SERIALIZATION=True):
+                fast = self.client.get('/api/posts/tags/ADHD/').json()
+            self.assertEqual(fast['results'], self.client.get('/api/posts/tags/adhd/').json()['results'])
+        self.assertEqual(self.client.get('/api/posts/tags/nothing/').status_code, 404)
+
+    def test_tag_posts_queries_dont_grow_with_the_page(self):
+        def queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/api/posts/tags/sleep/')
+            return len(response.json()['results']), len(captured)
+
+        self.client.post('/api/posts/', {'content': '#sleep one'})
+        few = queries()
+        for i in range(5):
+            self.client.post('/api/posts/', {'content': f'#sleep more {i}'})
+        many = queries()
+        self.assertEqual((few[0], many[0]), (1, 6))
+        self.assertEqual(few[1], many[1])
+        self.assertEqual(self.client.get('/api/posts/tags/sleep/', {'fields': 'id'}).json()['results'][0],
+                         {'id': Post.objects.latest('pk').pk})
+
+
+class ThreadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.post = Post.objects.create(author=cls.therapist, content='Ask me about sleep')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+        self.url = f'/api/posts/{self.post.pk}/comments/'
+
+    def reply(self, content, parent=None, user=None):
+        self.client.force_authenticate(user or self.parent)
+        response = self.client.post(self.url, {'content': content, 'parent': parent}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def counts(self, pk):
+        return Comment.objects.filter(pk=pk).values_list('reply_count', 'descendant_count').get()
+
+    def test_threads(self):
+        a = self.reply('a')
+        a1 = self.reply('a1', a, self.therapist)
+        a1x = self.reply('a1x', a1)
+        a2 = self.reply('a2', a, self.admin)
+        b = self.reply('b')
+        self.assertEqual(self.counts(a), (2, 3))
+        self.assertEqual(self.counts(a1), (1, 1))
+
+        thread = self.client.get(f'{self.url}{a}/thread/').json()
+        self.assertEqual([(c['id'], c['depth'], c['parent']) for c in thread['results']],
+                         [(a, 0, None), (a1, 1, a), (a1x, 2, a1), (a2, 1, a)])
+        top = self.client.get(f'{self.url}?top_level=1').json()['results']
+        self.assertEqual([(c['id'], c['reply_count'], c['descendant_count']) for c in top],
+                         [(a, 2, 3), (b, 0, 0)])
+        with override_settings(FAST_LIST_SERIALIZATION=True):
+            self.assertEqual(self.client.get(f'{self.url}{a}/thread/').json(), thread)
+
+        # deleting a reply takes its subtree off every ancestor
+        self.client.force_authenticate(self.therapist)
+        self.assertEqual(self.client.delete(f'{self.url}{a1}/').status_code, 204)
+        self.assertFalse(Comment.objects.filter(pk=a1x).exists())
+        self.assertEqual(self.counts(a), (1, 1))
+
+    def test_bad_replies(self):
+        other = Comment.objects.exclude(post=self.post).first()
+        response = self.client.post(self.url, {'content': 'x', 'parent': other.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('same post', response.json()['error'])
+
+        parent = None
+        for _ in range(MAX_DEPTH + 1):
+            parent = self.reply('deeper', parent)
+        self.assertEqual(self.client.post(self.url, {'content': 'x', 'parent': parent}).status_code, 400)
+
+        top = self.reply('top')
+        response = self.client.patch(f'{self.url}{parent}/', {'parent': top})
+        self.assertEqual(response.status_code, 400)
+
+    def test_purged_replies_are_recounted(self):
+        a = self.reply('a')
+        a1 = self.reply('a1', a, self.admin)
+        self.reply('a1x', a1)
+        self.reply('a2', a)
+        schedule_user_deletion(self.admin)
+        Purger(pause=0).run_pending()
+        self.assertEqual(self.counts(a), (1, 1))
+        self.assertEqual([c.content for c in subtree(Comment.objects.get(pk=a))], ['a', 'a2'])
+
+
+class IdempotencyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.busy = Post.objects.get(author=cls.therapist)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.parent).access_token}')
+
+    def post(self, path, data=None, key='key-1', client=None):
+        return (client or self.client).post(path, data, format='json', headers={'Idempotency-Key': key})
+
+    def test_retried_writes_are_replayed(self):
+        first = self.post('/api/posts/', {'content': 'Is this thing on?'})
+        self.assertEqual(first.status_code, 201)
+        # the retry never reaches the database
+        with self.assertNumQueries(0):
+            retry = self.post('/api/posts/', {'content': 'Is this thing on?'})
+        self.assertEqual((retry.status_code, retry.content), (201, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Post.objects.filter(content='Is this thing on?').count(), 1)
+
+        # a retried like stays a like
+        welcome = self.admin.posts.get()
+        self.post(f'/api/posts/{welcome.pk}/like/', key='like-1')
+        self.post(f'/api/posts/{welcome.pk}/like/', key='like-1')
+        self.assertTrue(Like.objects.filter(user=self.parent, post__author=self.admin).exists())
+        self.assertEqual(Notification.objects.filter(notification_type=Notification.LIKE).count(), 1)
+
+    def test_keys_are_per_user_and_per_request(self):
+        self.post('/api/posts/', {'content': 'mine'})
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.therapist).access_token}')
+        self.assertEqual(self.post('/api/posts/', {'content': 'mine'}, client=other).status_code, 201)
+        self.assertEqual(Post.objects.filter(content='mine').count(), 2)
+
+        self.assertEqual(self.post('/api/posts/', {'content': 'not the same'}).status_code, 422)
+        self.assertEqual(self.post('/api/posts/', {'content': 'x'}, key='k' * 256).status_code, 400)
+
+    def test_retry_during_first_attempt(self):
+        retries = []
+        create = PostListCreateView.perform_create
+
+        def slow_create(view, serializer):
+            retries.append(self.post('/api/posts/', {'content': 'slow'}))
+            create(view, serializer)
+        with mock.patch.object(PostListCreateView, 'perform_create', slow_create):
+            self.assertEqual(self.post('/api/posts/', {'content': 'slow'}).status_code, 201)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(retries[0]['Retry-After'], '1')
+        self.assertEqual(Post.objects.filter(content='slow').count(), 1)
+
+    def test_failures_are_not_kept(self):
+        with mock.patch('posts.views.sync_tags', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post('/api/posts/', {'content': '#boom'})
+        self.assertEqual(self.post('/api/posts/', {'content': '#boom'}).status_code, 201)
+
+
+class ReadCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.busy = Post.objects.get(author=cls.therapist)
+
+    def setUp(self):
+        cache.clear()
+        self.client = self.client_for(self.parent)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_payloads_are_shared(self):
+        path = f'/api/posts/{self.busy.pk}/'
+        mine = self.client.get(path).json()
+        with CaptureQueriesContext(connection) as queries:
+            theirs = self.client_for(self.therapist).get(path).json()
+        # the user's like is the only thing read for the second reader
+        self.assertFalse([q['sql'] for q in queries if 'FROM "posts_post"' in q['sql']])
+        self.assertEqual((mine['is_liked_by_user'], theirs['is_liked_by_user']), (True, False))
+        self.assertEqual(dict(mine, is_liked_by_user=False), theirs)
+
+        for path in [path, '/api/social/feed/', '/api/users/profile/dr_smith/']:
+            with override_settings(READ_CACHE_SECONDS=0):
+                uncached = self.client.get(path).json()
+            self.assertEqual(self.client.get(path).json(), uncached, path)
+
+    def test_writes_make_payloads_stale(self):
+        path = f'/api/posts/{self.busy.pk}/'
+        self.client.get(path)
+        self.client_for(self.therapist).post(f'/api/posts/{self.busy.pk}/like/')
+        self.assertEqual(self.client.get(path).json()['likes_count'], 3)
+
+        self.assertEqual(self.client.get('/api/users/profile/admin/').json()['followers_count'], 1)
+        self.client_for(self.therapist).post('/api/users/follow/admin/')
+        self.assertEqual(self.client.get('/api/users/profile/admin/').json()['followers_count'], 2)
+
+        self.client_for(self.therapist).delete(path)
+        self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_stale_value_is_served_while_rebuilding(self):
+        self.assertEqual(cached('k', lambda: (1, [('post', 1)])), 1)
+        touch('post', [1])
+        # another request holds the rebuild
+        cache.add(lock_key('k'), 1)
+        self.assertEqual(cached('k', lambda: self.fail('rebuilt twice')), 1)
+        cache.delete(lock_key('k'))
+        self.assertEqual(cached('k', lambda: (2, [('post', 1)])), 2)
+        self.assertEqual(cached('k', lambda: self.fail('fresh entry rebuilt')), 2)
+
+    def test_misses_are_built_once(self):
+        building, release, builds = threading.Event(), threading.Event(), []
+
+        def build():
+            builds.append(1)
+            building.set()
+            release.wait(5)
+            return 'payload', []
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cached('hot', build)))
+        leader.start()
+        building.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(cached('hot', build))) for _ in range(5)]
+        for thread in followers:
+            thread.start()
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join()
+        self.assertEqual((len(builds), results), (1, ['payload'] * 6))
+
+
+class BulkFetchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.posts = list(Post.objects.order_by('pk'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+
+    def fetch(self, *ids, **params):
+        response = self.client.get('/api/posts/', {'ids': ','.join(map(str, ids)), **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_posts_come_back_in_order(self):
+        ids = [post.pk for post in reversed(self.posts)]
+        singles = [self.client.get(f'/api/posts/{pk}/').json() for pk in ids]
+        for cache_seconds, fast in [(30, False), (0, False), (0, True)]:
+            with self.subTest(cache=cache_seconds, fast=fast), \
+                    self.settings(READ_CACHE_SECONDS=cache_seconds, FAST_LIST_SERIALIZATION=fast):
+                self.assertEqual(self.fetch(*ids), singles)
+        with self.settings(READ_CACHE_SECONDS=0):
+            self.assertEqual(self.fetch(ids[0], fields='content'), [{'content': singles[0]['content']}])
+
+    def test_missing_posts_are_reported_inline(self):
+        busy, quiet = self.posts[0], self.posts[1]
+        self.client.force_authenticate(self.therapist)
+        self.client.delete(f'/api/posts/{busy.pk}/')
+        self.client.force_authenticate(self.parent)
+        results = self.fetch(quiet.pk, busy.pk, 999999, quiet.pk)
+        self.assertEqual(results[0]['content'], quiet.content)
+        self.assertEqual(results[1:], [
+            {'id': busy.pk, 'error': 'This post was deleted.'},
+            {'id': 999999, 'error': 'Post not found.'},
+        ])
+
+    def test_queries_dont_grow_with_the_batch(self):
+        def queries(ids):
+            with CaptureQueriesContext(connection) as captured:
+                self.fetch(*ids)
+            return len(captured)
+        with self.settings(READ_CACHE_SECONDS=0, FAST_LIST_SERIALIZATION=True):
+            one = queries([self.posts[0].pk])
+            for n in range(5):
+                Post.objects.create(author=self.admin, content=f'more {n}')
+            self.assertEqual(queries(list(Post.objects.values_list('pk', flat=True))), one)
+
+    @override_settings(POSTS_BULK_MAX_IDS=2)
+    def test_bad_ids(self):
+        for ids in ['', '1,x', '1,2,3']:
+            response = self.client.get('/api/posts/', {'ids': ids})
+            self.assertEqual(response.status_code, 400, ids)
+            self.assertIn('error', response.json())
+
+
+class QueryPlanTests(QueryPlanAssertions, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def test_post_list(self):
+        self.assertViewIndexed(PostListCreateView, self.parent)
+
+    def test_author_posts(self):
+        self.assertIndexed(Post.objects.filter(author=self.therapist)[:10])
+
+    def test_comment_list(self):
+        post = Post.objects.first()
+        self.assertViewIndexed(CommentListCreateView, self.parent, post_id=post.pk)
+
+    def test_comment_thread(self):
+        root = Comment.objects.first()
+        root.path = str(root.pk).zfill(10)
+        self.assertIndexed(subtree(root))
+        self.assertIndexed(Comment.objects.filter(post_id=root.post_id, parent__isnull=True)[:10])
+
+    def test_tag_posts(self):
+        client = APIClient()
+        client.force_authenticate(self.parent)
+        client.post('/api/posts/', {'content': '#sleep'})
+        tag = Tag.objects.get(name='sleep')
+        self.assertIndexed(PostTag.objects.filter(tag=tag).order_by('-created_at')[:10])
+        self.assertIndexed(Tag.objects.filter(post_count__gt=0).order_by('-post_count', 'name')[:20])
+
+    def test_post_likes(self):
+        post = Post.objects.first()
+        self.assertIndexed(Like.objects.filter(post=post).order_by('user'))
+        self.assertIndexed(Like.objects.filter(post=post, user=self.parent))
@@ -0,0 +1,106 @@
+"""
+Threaded comments as materialized paths.
+
+A comment's `path` is the ids of its top-level comment, every reply in
+between and itself, each zero-padded to SEGMENT digits:
+
+    0000000012                      top-level comment 12
+    00000000120000000031            31, a reply to 12
+    000000001200000000310000000047  47, a reply to 31
+
+so a comment's whole subtree is every path starting with its own, and
+sorting by path gives the thread in reading order. Paths are digits
+only and of equal length per level, which lets the subtree be fetched
+as a plain range on comment_post_path_idx (see subtree()) rather than
+a LIKE, which SQLite can't serve from a case-sensitive index.
+
+reply_count (direct replies) and descendant_count (the whole subtree)
+are adjusted as comments are added and removed, on the parent and on
+every ancestor, whose ids are read straight off the path.
+"""
+from django.db import transaction
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, LPad
+
+from .models import Comment
+
+SEGMENT = 10
+MAX_DEPTH = Comment._meta.get_field('path').max_length // SEGMENT - 1
+
+
+class ThreadError(ValueError):
+    pass
+
+
+def ancestor_ids(path):
+    """Ids of the comments above the one with this path, top first."""
+    return [int(path[i:i + SEGMENT]) for i in range(0, len(path) - SEGMENT, SEGMENT)]
+
+
+def subtree(comment, include_self=True):
+    """The comment's replies, their replies and so on, in reading order."""
+    # paths of equal length compare like the numbers they spell, so the
+    # subtree is [path, path + 1) — every longer path with this prefix
+    upper = str(int(comment.path) + 1).zfill(len(comment.path))
+    lookup = 'path__gte' if include_self else 'path__gt'
+    return Comment.objects.filter(
+        post_id=comment.post_id, **{lookup: comment.path}, path__lt=upper
+    ).order_by('path')
+
+
+def top_level_path():
+    """A top-level comment's path as an expression, for bulk inserts."""
+    return LPad(Cast('id', CharField()), SEGMENT, Value('0'))
+
+
+def check_parent(parent, post):
+    if parent is None:
+        return
+    if parent.post_id != post.pk:
+        raise ThreadError('You can only reply to a comment on the same post.')
+    if parent.depth >= MAX_DEPTH:
+        raise ThreadError(f'Threads go at most {MAX_DEPTH + 1} levels deep.')
+
+
+def place(comment):
+    """
+    Give a just-created comment its path and depth and count it on its
+    ancestors. Call inside the transaction that created it.
+    """
+    segment = str(comment.pk).zfill(SEGMENT)
+    parent = comment.parent
+    comment.path = parent.path + segment if parent else segment
+    comment.depth = parent.depth + 1 if parent else 0
+    Comment.objects.filter(pk=comment.pk).update(path=comment.path, depth=comment.depth)
+    if parent:
+        Comment.objects.filter(pk=parent.pk).update(reply_count=F('reply_count') + 1)
+        Comment.objects.filter(pk__in=ancestor_ids(comment.path)).update(
+            descendant_count=F('descendant_count') + 1
+        )
+
+
+def remove(comment):
+    """Delete a comment with its subtree and take them off the counts."""
+    with transaction.atomic():
+        descendants = Comment.objects.filter(pk=comment.pk).values_list('descendant_count', flat=True).first()
+        if descendants is None:
+            return
+        removed = 1 + descendants
+        comment.delete()
+        if comment.parent_id:
+            Comment.objects.filter(pk=comment.parent_id).update(reply_count=F('reply_count') - 1)
+            Comment.objects.filter(pk__in=ancestor_ids(comment.path)).update(
+                descendant_count=F('descendant_count') - removed
+            )
+
+
+def recount(comment_ids):
+    """
+    Recompute reply_count and descendant_count for these comments, for
+    deletions that didn't go through remove() (the background purge).
+    """
+    for comment in Comment.objects.filter(pk__in=comment_ids).only('pk', 'post_id', 'path'):
+        Comment.objects.filter(pk=comment.pk).update(
+            reply_count=Comment.objects.filter(parent_id=comment.pk).count(),
+            descendant_count=subtree(comment, include_self=False).count(),
+        )
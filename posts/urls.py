@@ -1,10 +1,14 @@
 from django.urls import path
+from my_village.async_views import read_view
 from . import views
 
 urlpatterns = [
     path('', views.PostListCreateView.as_view(), name='post-list-create'),
-    path('<int:pk>/', views.PostDetailView.as_view(), name='post-detail'),
+    path('tags/', views.PopularTagsView.as_view(), name='tag-list'),
+    path('tags/<str:name>/', views.TagPostsView.as_view(), name='tag-posts'),
+    path('<int:pk>/', read_view(views.AsyncPostDetailView), name='post-detail'),
     path('<int:post_id>/comments/', views.CommentListCreateView.as_view(), name='comment-list-create'),
     path('<int:post_id>/comments/<int:pk>/', views.CommentDetailView.as_view(), name='comment-detail'),
+    path('<int:post_id>/comments/<int:pk>/thread/', views.CommentThreadView.as_view(), name='comment-thread'),
     path('<int:post_id>/like/', views.LikePostView.as_view(), name='like-post'),
 ]
\ No newline at end of file
@@ -1,10 +1,23 @@
 from rest_framework import generics, status, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from .models import Post, Comment, Like
-from .serializers import PostSerializer, CommentSerializer
-from notifications.models import Notification
+from .models import Post, Comment, Like, Tag, PostTag
+from .payloads import post_payloads, posts_by_id
+from .serializers import PostSerializer, CommentSerializer, TagSerializer
+from .tags import normalize, sync_tags
+from .threads import ThreadError, check_parent, place, remove, subtree
+from notifications.fanout import notify
+from my_village.fastpath import FastListMixin
+from my_village.async_views import AsyncDetailView
+from my_village.cache import read_cache_enabled
+from my_village.params import parse_ids
+from social.trending import trending
+from users.purge import schedule_post_deletion
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -16,17 +29,49 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         return obj.author == request.user
 
 
-class PostListCreateView(generics.ListCreateAPIView):
+class PostListCreateView(FastListMixin, generics.ListCreateAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return Post.objects.all()
 
+    def list(self, request, *args, **kwargs):
+        # ?ids=3,1,2 fetches those posts, in that order, in one go
+        # (deep links, push notifications, client caches)
+        if 'ids' in request.query_params:
+            return self.list_by_id(request)
+        return super().list(request, *args, **kwargs)
+
+    def list_by_id(self, request):
+        try:
+            ids = parse_ids(request.query_params['ids'], getattr(settings, 'POSTS_BULK_MAX_IDS', 50))
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        found = posts_by_id(ids, request, self.get_serializer_context())
+
+        # posts that didn't come back are reported in their place
+        missing = [pk for pk in ids if pk not in found]
+        deleted = set()
+        if missing:
+            deleted = set(Post.all_objects.filter(
+                pk__in=missing, deleted_at__isnull=False
+            ).values_list('pk', flat=True))
+        results = []
+        for pk in dict.fromkeys(ids):
+            if pk in found:
+                results.append(found[pk])
+            elif pk in deleted:
+                results.append({'id': pk, 'error': 'This post was deleted.'})
+            else:
+                results.append({'id': pk, 'error': 'Post not found.'})
+        return Response({'results': results})
+
     def perform_create(self, serializer):
         # force the author to be the logged-in user
         # never trust the client to send the author field
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        sync_tags(post)
 
 
 class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -38,33 +83,87 @@ class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
         # pass request into serializer so is_liked_by_user works
         return {'request': self.request}
 
+    def retrieve(self, request, *args, **kwargs):
+        data = self.cached_read()
+        if data is None:
+            # missing posts 404 from here
+            return super().retrieve(request, *args, **kwargs)
+        return Response(data)
+
+    def cached_read(self):
+        # the shared payload from the read cache, see posts/payloads.py
+        if not read_cache_enabled(self.request):
+            return None
+        payloads = post_payloads([self.kwargs['pk']], self.request)
+        return payloads[0] if payloads else None
+
+    def perform_update(self, serializer):
+        # only the tags that were added or removed are touched
+        sync_tags(serializer.save())
+
+    def perform_destroy(self, instance):
+        # hidden right away, comments/likes purged later by purge_deleted
+        schedule_post_deletion(instance)
+
 
-class CommentListCreateView(generics.ListCreateAPIView):
+class AsyncPostDetailView(AsyncDetailView):
+    # served under ASGI — the post and its comments load side by side
+    sync_view = PostDetailView
+
+
+class CommentListCreateView(FastListMixin, generics.ListCreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         # only return comments for the post in the URL
-        return Comment.objects.filter(post_id=self.kwargs['post_id'])
+        # (none once the post is deleted, even before the purge)
+        comments = Comment.objects.filter(post_id=self.kwargs['post_id'], post__deleted_at__isnull=True)
+        # ?top_level=1 — just the threads' first comments, each with
+        # its reply_count; open a thread with .../<id>/thread/
+        if self.request.query_params.get('top_level') in ('1', 'true'):
+            comments = comments.filter(parent__isnull=True)
+        return comments
 
     def perform_create(self, serializer):
         post = get_object_or_404(Post, id=self.kwargs['post_id'])
-        serializer.save(author=self.request.user, post=post)
+        try:
+            check_parent(serializer.validated_data.get('parent'), post)
+        except ThreadError as exc:
+            raise ValidationError({"error": str(exc)})
+        with transaction.atomic():
+            comment = serializer.save(author=self.request.user, post=post)
+            # path, depth and the ancestors' counts
+            place(comment)
+        trending.record_comment(post.pk)
 
         # don't notify yourself if you comment on your own post
         if post.author != self.request.user:
-            Notification.objects.create(
-                recipient=post.author,
-                sender=self.request.user,
-                notification_type='comment',
-                post=post
-            )
+            notify(post.author, self.request.user, 'comment', post)
 
 
 class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.filter(post__deleted_at__isnull=True)
+
+    def perform_destroy(self, instance):
+        # replies go with it, and the thread's counts are adjusted
+        remove(instance)
+
+
+class CommentThreadView(FastListMixin, generics.ListAPIView):
+    # a comment and every reply under it, in reading order, from one
+    # range of the (post, path) index however deep the thread goes
+    serializer_class = CommentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        root = get_object_or_404(
+            Comment.objects.filter(post__deleted_at__isnull=True).only('pk', 'post_id', 'path'),
+            pk=self.kwargs['pk'], post_id=self.kwargs['post_id']
+        )
+        return subtree(root)
 
 
 class LikePostView(APIView):
@@ -77,15 +176,56 @@ class LikePostView(APIView):
         if not created:
             # already liked — unlike it
             like.delete()
+            trending.record_like(post.pk, -1)
             return Response({"status": "unliked"}, status=status.HTTP_200_OK)
 
+        trending.record_like(post.pk)
+
         # only notify on a new like, not when re-liking
         if post.author != request.user:
-            Notification.objects.create(
-                recipient=post.author,
-                sender=request.user,
-                notification_type='like',
-                post=post
-            )
-
-        return Response({"status": "liked"}, status=status.HTTP_201_CREATED)
\ No newline at end of file
+            notify(post.author, request.user, 'like', post)
+
+        return Response({"status": "liked"}, status=status.HTTP_201_CREATED)
+
+
+class TagCursorPagination(CursorPagination):
+    # newest first straight off posttag_tag_created_idx — no COUNT,
+    # and deep pages cost the same as the first
+    ordering = '-created_at'
+
+
+class TagPostsView(generics.ListAPIView):
+    # posts using a #tag, newest first, with ?cursor= pagination
+    # the page is read from the PostTag index, then the posts by id
+    serializer_class = PostSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TagCursorPagination
+
+    def get_queryset(self):
+        tag = get_object_or_404(Tag, name=normalize(self.kwargs['name']))
+        return PostTag.objects.filter(tag=tag).only('post_id', 'created_at')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        ids = [entry.post_id for entry in page]
+        # cached payloads when it can, like the feed, else one query
+        found = posts_by_id(ids, request, self.get_serializer_context())
+        return self.get_paginated_response([found[pk] for pk in ids if pk in found])
+
+    def get_serializer_context(self):
+        return {'request': self.request}
+
+
+class PopularTagsView(generics.ListAPIView):
+    # most used tags, from the counts kept on Tag — ?limit=20 (max 100)
+    serializer_class = TagSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
+
+    def get_queryset(self):
+        try:
+            limit = int(self.request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        limit = min(max(limit, 1), 100)
+        return Tag.objects.filter(post_count__gt=0).order_by('-post_count', 'name')[:limit]
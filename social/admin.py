@@ -1,3 +1,42 @@
 from django.contrib import admin
 
-# Register your models here.
+from my_village.admin import LargeTableAdmin
+from .models import AuthorDailyStats, FeedFilter, FollowEvent, PostActivityBucket, PostDailyStats, RollupWatermark
+
+
+@admin.register(FeedFilter)
+class FeedFilterAdmin(LargeTableAdmin):
+    list_display = ['user', 'sort_by', 'therapists_only', 'keyword_filter']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+
+@admin.register(PostActivityBucket)
+class PostActivityBucketAdmin(LargeTableAdmin):
+    list_display = ['post_id', 'bucket_start', 'likes', 'comments']
+    raw_id_fields = ['post']
+
+
+@admin.register(AuthorDailyStats)
+class AuthorDailyStatsAdmin(LargeTableAdmin):
+    list_display = ['author', 'day', 'likes', 'comments', 'new_followers']
+    list_select_related = ['author']
+    raw_id_fields = ['author']
+
+
+@admin.register(PostDailyStats)
+class PostDailyStatsAdmin(LargeTableAdmin):
+    list_display = ['post_id', 'author_id', 'day', 'likes', 'comments']
+    raw_id_fields = ['post', 'author']
+
+
+@admin.register(FollowEvent)
+class FollowEventAdmin(LargeTableAdmin):
+    list_display = ['follower', 'followed', 'day']
+    list_select_related = ['follower', 'followed']
+    raw_id_fields = ['follower', 'followed']
+
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['source', 'last_id', 'updated_at']
@@ -0,0 +1,35 @@
+"""
+Keep the trending window tidy.
+
+    python manage.py compact_trending           # once, e.g. from cron
+    python manage.py compact_trending --loop    # every --interval seconds
+
+Writes this process's pending counts, deletes PostActivityBucket rows
+that have slid out of the window and rebuilds the cached ranking (see
+social/trending.py).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from social.trending import trending
+
+
+class Command(BaseCommand):
+    help = 'Prune trending buckets outside the window and refresh the cached ranking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='keep running')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='seconds between runs with --loop (default: 60)')
+
+    def handle(self, *args, **options):
+        while True:
+            pruned = trending.compact()
+            if options['verbosity'] > 0:
+                top = trending.top(1)
+                best = f'top post {top[0][0]} (score {top[0][1]})' if top else 'nothing trending'
+                self.stdout.write(f'pruned {pruned} bucket(s); {best}')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
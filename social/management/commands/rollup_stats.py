@@ -0,0 +1,33 @@
+"""
+Keep the engagement rollups behind /api/users/me/stats/ current.
+
+    python manage.py rollup_stats           # once, e.g. from cron
+    python manage.py rollup_stats --loop    # every --interval seconds
+
+Counts the likes, comments and follows since the last run into the
+daily stats tables (see social/stats.py). Several copies can run at
+once; each row is still counted once.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from social.stats import roll_up_all
+
+
+class Command(BaseCommand):
+    help = 'Add new likes, comments and follows to the daily engagement rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='keep running')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='seconds between runs with --loop (default: 60)')
+
+    def handle(self, *args, **options):
+        while True:
+            counted = roll_up_all()
+            if options['verbosity'] > 0:
+                self.stdout.write('counted ' + ', '.join(f'{n} {source}' for source, n in counted.items()))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_deleted_at'),
+        ('social', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostActivityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('likes', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_buckets', to='posts.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket_start'], name='activity_bucket_start_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'bucket_start'), name='activity_post_bucket_uniq')],
+            },
+        ),
+    ]
@@ -28,4 +28,130 @@ class FeedFilter(models.Model):
     keyword_filter = models.CharField(max_length=100, blank=True, null=True)
 
     def __str__(self):
-        return f"{self.user.username}'s feed preferences"
\ No newline at end of file
+        return f"{self.user.username}'s feed preferences"
+
+
+class PostActivityBucket(models.Model):
+    """
+    Likes and comments a post got during one TRENDING_BUCKET_SECONDS
+    slice of time. Written by social/trending.py when it compacts its
+    in-memory counts; buckets older than the trending window are
+    pruned by compact_trending.
+    """
+    post = models.ForeignKey(
+        'posts.Post',
+        on_delete=models.CASCADE,
+        related_name='activity_buckets'
+    )
+    bucket_start = models.DateTimeField()
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'bucket_start'], name='activity_post_bucket_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket_start'], name='activity_bucket_start_idx'),
+        ]
+
+    def __str__(self):
+        return f"post {self.post_id} @ {self.bucket_start:%Y-%m-%d %H:%M}: {self.likes} likes, {self.comments} comments"
+
+
+class AuthorDailyStats(models.Model):
+    """
+    Engagement an author got on one day: likes and comments on their
+    posts (not counting their own) and follows. Added to by the
+    rollup_stats job (social/stats.py); /api/users/me/stats/ reads only
+    these rows.
+    """
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_stats'
+    )
+    day = models.DateField()
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    new_followers = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'day'], name='authorstats_author_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"user {self.author_id} on {self.day}: {self.likes} likes, {self.comments} comments"
+
+
+class PostDailyStats(models.Model):
+    """The likes and comments one post got on one day, as for AuthorDailyStats."""
+    post = models.ForeignKey(
+        'posts.Post',
+        on_delete=models.CASCADE,
+        related_name='daily_stats'
+    )
+    # the post's author, so an author's posts are read off one index
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='post_daily_stats'
+    )
+    day = models.DateField()
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], name='poststats_post_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['author', 'day'], name='poststats_author_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"post {self.post_id} on {self.day}: {self.likes} likes, {self.comments} comments"
+
+
+class FollowEvent(models.Model):
+    """
+    `follower` started following `followed` on `day`. The follow table
+    has no date, so the rollup_stats job counts new followers off these
+    rows. One per pair and day: following, unfollowing and following
+    again the same day is one new follower.
+    """
+    follower = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    followed = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    day = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'followed', 'day'], name='followevent_pair_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"user {self.follower_id} followed user {self.followed_id} on {self.day}"
+
+
+class RollupWatermark(models.Model):
+    """
+    The last row of a source table (likes, comments, follows) the
+    rollup_stats job has counted. Moved in the same transaction as the
+    counts it covers, so every row is counted exactly once.
+    """
+    source = models.CharField(max_length=20, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} up to {self.last_id}"
@@ -0,0 +1,164 @@
+"""
+Daily engagement rollups behind /api/users/me/stats/.
+
+Counting an author's likes, comments and new followers per day off the
+Like, Comment and Notification tables would be a grouped scan of the
+busiest tables on every dashboard load. The rollup_stats job counts
+each new row once instead, into AuthorDailyStats and PostDailyStats
+(one row per author or post and day), and the endpoint reads only
+those:
+
+  * each source keeps a RollupWatermark, the id of the last row it
+    counted; a run reads the rows past it in id order, off the primary
+    key, STATS_ROLLUP_BATCH at a time;
+  * a batch's counts and its watermark are written in one transaction,
+    so a row is counted once even when the job dies halfway, and the
+    watermark row is locked (select_for_update) while two copies run;
+  * rows younger than STATS_ROLLUP_LAG_SECONDS wait for the next run.
+    Ids are handed out before their transaction commits, so for a
+    moment a row can show up behind one with a higher id.
+
+New followers are counted from FollowEvent rows, which record_follow()
+writes for FollowUserView since the follow table has no date: one per
+pair and day, so toggling a follow back and forth counts once, and a
+follow taken back before the job gets to it isn't counted at all.
+Likes and comments on your own posts don't count, and a like or follow
+taken back after it was counted stays counted. Days are in TIME_ZONE.
+"""
+from collections import Counter, namedtuple
+from datetime import timedelta
+from itertools import takewhile
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Sum
+from django.utils import timezone
+
+from posts.models import Comment, Like
+from users.models import User
+from .models import AuthorDailyStats, FollowEvent, PostDailyStats, RollupWatermark
+
+# most days /api/users/me/stats/?days= reaches back
+MAX_DAYS = 365
+TOP_POSTS = 10
+
+# queryset() -> rows; columns to read (pk, created_at, author, actor,
+# and post when the rows are about one); the stats field they add to
+Source = namedtuple('Source', 'queryset columns field')
+
+Follow = User.following.through
+
+SOURCES = {
+    'likes': Source(
+        lambda: Like.objects.all(),
+        ('pk', 'created_at', 'post__author_id', 'user_id', 'post_id'), 'likes',
+    ),
+    'comments': Source(
+        lambda: Comment.objects.all(),
+        ('pk', 'created_at', 'post__author_id', 'author_id', 'post_id'), 'comments',
+    ),
+    'follows': Source(
+        lambda: FollowEvent.objects.filter(Exists(Follow.objects.filter(
+            from_user_id=OuterRef('follower_id'), to_user_id=OuterRef('followed_id'),
+        ))),
+        ('pk', 'created_at', 'followed_id', 'follower_id'), 'new_followers',
+    ),
+}
+
+
+def record_follow(follower, followed):
+    """Date a new follow for the rollup; once per pair and day."""
+    FollowEvent.objects.bulk_create(
+        [FollowEvent(follower=follower, followed=followed, day=timezone.localdate())],
+        ignore_conflicts=True,
+    )
+
+
+def roll_up(name, now=None):
+    """Count the source's next batch of new rows; returns how many were read."""
+    source = SOURCES[name]
+    cutoff = (now or timezone.now()) - timedelta(seconds=getattr(settings, 'STATS_ROLLUP_LAG_SECONDS', 60))
+    with transaction.atomic():
+        RollupWatermark.objects.get_or_create(source=name)
+        watermark = RollupWatermark.objects.select_for_update().get(source=name)
+        rows = source.queryset().filter(pk__gt=watermark.last_id).order_by('pk')
+        rows = rows.values_list(*source.columns)[:getattr(settings, 'STATS_ROLLUP_BATCH', 5000)]
+        # stop at the first row that's too young, so nothing behind it is skipped
+        ready = list(takewhile(lambda row: row[1] < cutoff, rows))
+        if not ready:
+            return 0
+
+        authors, posts = Counter(), Counter()
+        for pk, created_at, author_id, actor_id, *post_id in ready:
+            if actor_id == author_id:
+                continue
+            day = timezone.localdate(created_at)
+            authors[author_id, day] += 1
+            if post_id:
+                posts[post_id[0], author_id, day] += 1
+        for (author_id, day), count in authors.items():
+            _add(AuthorDailyStats, {'author_id': author_id, 'day': day}, source.field, count)
+        for (post_id, author_id, day), count in posts.items():
+            _add(PostDailyStats, {'post_id': post_id, 'day': day}, source.field, count, author_id=author_id)
+
+        watermark.last_id = ready[-1][0]
+        watermark.save(update_fields=['last_id', 'updated_at'])
+        return len(ready)
+
+
+def roll_up_all(now=None):
+    """Catch every source up; returns {source: rows read}."""
+    batch = getattr(settings, 'STATS_ROLLUP_BATCH', 5000)
+    counted = {}
+    for name in SOURCES:
+        counted[name] = 0
+        while True:
+            read = roll_up(name, now)
+            counted[name] += read
+            if read < batch:
+                break
+    return counted
+
+
+def _add(model, key, field, count, **defaults):
+    # the job's copies may add to the same day at once, hence F() and
+    # the create race, as in trending.py
+    rows = model.objects.filter(**key)
+    if rows.update(**{field: F(field) + count}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **defaults, **{field: count})
+    except IntegrityError:
+        rows.update(**{field: F(field) + count})
+
+
+def author_stats(user, days, today=None):
+    """The user's last `days` days, today included, read from the rollups."""
+    today = today or timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    found = {
+        row['day']: row for row in AuthorDailyStats.objects.filter(
+            author=user, day__gte=start, day__lte=today
+        ).values('day', 'likes', 'comments', 'new_followers')
+    }
+    daily = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = found.get(day, {'likes': 0, 'comments': 0, 'new_followers': 0})
+        daily.append({'day': day.isoformat(), 'likes': row['likes'], 'comments': row['comments'],
+                      'new_followers': row['new_followers']})
+    top_posts = (
+        PostDailyStats.objects.filter(author=user, day__gte=start, day__lte=today)
+        .values('post_id').annotate(likes=Sum('likes'), comments=Sum('comments'))
+        .order_by((F('likes') + F('comments')).desc(), '-post_id')[:TOP_POSTS]
+    )
+    updated = RollupWatermark.objects.order_by('updated_at').values_list('updated_at', flat=True).first()
+    return {
+        'days': days,
+        'updated_at': updated,
+        'totals': {name: sum(day[name] for day in daily) for name in ('likes', 'comments', 'new_followers')},
+        'daily': daily,
+        'top_posts': [{'post': row['post_id'], 'likes': row['likes'], 'comments': row['comments']}
+                      for row in top_posts],
+    }
@@ -1,3 +1,473 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from my_village.delta import bump, encode_cursor
+from my_village.query_plans import SORT, QueryPlanAssertions
+from my_village.shedding import REQUEST_START_HEADER, SEVERE, LoadSheddingMiddleware
+from my_village.throttling import endpoint_class, take
+from notifications.models import Notification
+from posts.models import Comment, Like, Post
+from posts.tests import make_village
+from posts.views import PostListCreateView
+from users.models import User
+from users.purge import schedule_post_deletion, schedule_user_deletion
+from .models import AuthorDailyStats, PostActivityBucket, PostDailyStats, RollupWatermark
+from .stats import roll_up_all
+from .trending import trending
+from .views import AsyncFeedView, FeedView, SearchPostsView
+
+
+class TrendingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.busy = Post.objects.get(author=cls.therapist)
+        cls.quiet = Post.objects.get(author=cls.parent)
+
+    def setUp(self):
+        cache.clear()
+        trending.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def trending_ids(self, query=''):
+        # don't wait out the flush and cache intervals
+        trending.rank()
+        return [post['id'] for post in self.client.get(f'/api/social/trending/{query}').json()]
+
+    def test_ranks_recent_activity(self):
+        self.assertEqual(self.trending_ids(), [])
+        self.client.post(f'/api/posts/{self.quiet.pk}/like/')
+        self.client.post(f'/api/posts/{self.busy.pk}/comments/', {'content': 'Great'})
+        self.assertEqual(self.trending_ids(), [self.busy.pk, self.quiet.pk])
+        self.assertEqual(self.trending_ids('?therapists=1'), [self.busy.pk])
+        self.assertEqual(self.trending_ids('?limit=1'), [self.busy.pk])
+
+        # unliking takes the like back
+        self.client.post(f'/api/posts/{self.quiet.pk}/like/')
+        self.assertEqual(self.trending_ids(), [self.busy.pk])
+
+    def test_queries_dont_grow_with_the_ranking(self):
+        def queries():
+            # a cold cache: every post's payload is built
+            cache.clear()
+            trending.clear()
+            trending.rank()
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/api/social/trending/')
+            self.assertEqual(response.status_code, 200)
+            return len(response.json()), len(captured)
+
+        for post in (self.busy, self.quiet):
+            trending.record_like(post.pk)
+        trending.flush()
+        few = queries()
+        for n in range(6):
+            post = Post.objects.create(author=self.therapist, content=f'hot {n}')
+            Comment.objects.create(author=self.parent, post=post, content='same')
+            trending.record_comment(post.pk)
+        trending.flush()
+        many = queries()
+        self.assertEqual((few[0], many[0]), (2, 8))
+        self.assertEqual(few[1], many[1])
+        for fast in (False, True):
+            with self.subTest(fast=fast), self.settings(READ_CACHE_SECONDS=0, FAST_LIST_SERIALIZATION=fast):
+                self.assertEqual(self.trending_ids('?limit=3'), [post.pk for post in Post.objects.order_by('-pk')[:3]])
+
+    def test_counts_are_compacted_into_buckets(self):
+        for _ in range(3):
+            trending.record_like(self.quiet.pk)
+        trending.record_comment(self.quiet.pk)
+        self.assertEqual(trending.flush(), 1)
+        trending.record_like(self.quiet.pk)
+        trending.flush()
+        bucket = PostActivityBucket.objects.get()
+        self.assertEqual((bucket.likes, bucket.comments), (4, 1))
+        self.assertEqual(trending.rank()['all'], [(self.quiet.pk, 7)])
+
+    def test_window_slides(self):
+        trending.record_like(self.busy.pk)
+        later = timezone.now() + timedelta(hours=3)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            trending.record_like(self.quiet.pk)
+            call_command('compact_trending', verbosity=0)
+            self.assertEqual(trending.top(10), [(self.quiet.pk, 1)])
+        self.assertEqual(PostActivityBucket.objects.get().post_id, self.quiet.pk)
+
+    def test_deleted_posts_drop_out(self):
+        trending.record_like(self.busy.pk)
+        trending.flush()
+        Post.objects.filter(pk=self.busy.pk).update(deleted_at=timezone.now())
+        self.assertEqual(trending.rank()['all'], [])
+
+
+@override_settings(DELTA_SYNC_OVERLAP_SECONDS=0)
+class FeedDeltaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        Post.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def setUp(self):
+        cache.clear()
+        # as if the cache had been up for a while
+        bump('follow', [self.parent.pk], timezone.now() - timedelta(hours=1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+
+    def sync(self, cursor, status=200):
+        response = self.client.get('/api/social/feed/', {'since': cursor})
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_changes_and_deletions(self):
+        cursor = self.client.get('/api/social/feed/')['X-Delta-Cursor']
+        delta = self.sync(cursor)
+        self.assertEqual((delta['results'], delta['deleted']), ([], []))
+        # nothing moved: only the follow list is read
+        with self.assertNumQueries(1):
+            delta = self.sync(delta['cursor'])
+        self.assertEqual(delta['results'], [])
+
+        new = Post.objects.create(author=self.therapist, content='New tips')
+        edited = Post.objects.get(author=self.admin)
+        edited.content = 'Welcome, everyone!'
+        edited.save()
+        Post.objects.create(author=self.parent, content='not in my own feed')
+        delta = self.sync(delta['cursor'])
+        self.assertEqual({p['id']: p['content'] for p in delta['results']},
+                         {new.pk: 'New tips', edited.pk: 'Welcome, everyone!'})
+
+        schedule_post_deletion(new)
+        delta = self.sync(delta['cursor'])
+        self.assertEqual((delta['results'], delta['deleted']), ([], [new.pk]))
+
+    def test_reload_needed(self):
+        cursor = self.client.get('/api/social/feed/')['X-Delta-Cursor']
+        self.parent.following.add(User.objects.create_user(username='new_friend', password='x'))
+        self.sync(cursor, 410)
+
+        cursor = self.client.get('/api/social/feed/')['X-Delta-Cursor']
+        self.sync(cursor)
+        schedule_user_deletion(self.admin)
+        self.sync(cursor, 410)
+
+        self.sync('yesterday', 400)
+        self.sync(encode_cursor(timezone.now() - timedelta(days=30)), 410)
+
+    @override_settings(DELTA_SYNC_MAX_ITEMS=2)
+    def test_too_many_changes(self):
+        cursor = self.client.get('/api/social/feed/')['X-Delta-Cursor']
+        for n in range(3):
+            Post.objects.create(author=self.therapist, content=f'post {n}')
+        self.sync(cursor, 410)
+
+
+class StatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # dr_smith's post has 2 likes and 2 comments, jane's 1 and 1
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.busy = Post.objects.get(author=cls.therapist)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.therapist)
+
+    def roll_up(self):
+        # past the lag, so everything written so far is counted
+        return roll_up_all(timezone.now() + timedelta(minutes=5))
+
+    def today(self, user):
+        return AuthorDailyStats.objects.filter(author=user, day=timezone.localdate()).values(
+            'likes', 'comments', 'new_followers').first()
+
+    def test_rows_are_counted_once(self):
+        self.assertEqual(self.roll_up(), {'likes': 3, 'comments': 3, 'follows': 0})
+        self.assertEqual(self.today(self.therapist), {'likes': 2, 'comments': 2, 'new_followers': 0})
+        self.assertEqual(self.today(self.parent), {'likes': 1, 'comments': 1, 'new_followers': 0})
+
+        # only what's new since the watermark, and not your own likes
+        as_admin = APIClient()
+        as_admin.force_authenticate(self.admin)
+        as_admin.post('/api/users/follow/dr_smith/')
+        Like.objects.create(user=self.therapist, post=self.busy)
+        self.assertEqual(self.roll_up(), {'likes': 1, 'comments': 0, 'follows': 1})
+        self.assertEqual(self.roll_up(), {'likes': 0, 'comments': 0, 'follows': 0})
+        self.assertEqual(self.today(self.therapist), {'likes': 2, 'comments': 2, 'new_followers': 1})
+        self.assertEqual(list(PostDailyStats.objects.filter(post=self.busy).values_list('likes', 'comments')),
+                         [(2, 2)])
+
+    def test_follows_count_once(self):
+        as_admin = APIClient()
+        as_admin.force_authenticate(self.admin)
+        # follow, unfollow, follow: one new follower
+        for _ in range(3):
+            as_admin.post('/api/users/follow/dr_smith/')
+        # a follow taken back before the job runs isn't counted
+        self.client.post('/api/users/follow/admin/')
+        self.client.post('/api/users/follow/admin/')
+        self.assertEqual(self.roll_up()['follows'], 1)
+        self.assertEqual(self.today(self.therapist)['new_followers'], 1)
+        self.assertIsNone(self.today(self.admin))
+
+        # nor is toggling it again after it was counted
+        as_admin.post('/api/users/follow/dr_smith/')
+        as_admin.post('/api/users/follow/dr_smith/')
+        self.assertEqual(self.roll_up()['follows'], 0)
+        self.assertEqual(self.today(self.therapist)['new_followers'], 1)
+
+    def test_muted_follower_counts(self):
+        # a muted follower sends no notification, but is still a follower
+        self.client.post('/api/users/mute/admin/')
+        as_admin = APIClient()
+        as_admin.force_authenticate(self.admin)
+        as_admin.post('/api/users/follow/dr_smith/')
+        self.assertFalse(Notification.objects.filter(recipient=self.therapist, sender=self.admin).exists())
+        self.roll_up()
+        self.assertEqual(self.today(self.therapist)['new_followers'], 1)
+
+    def test_recent_rows_wait_for_the_lag(self):
+        self.assertEqual(roll_up_all(), {'likes': 0, 'comments': 0, 'follows': 0})
+        self.assertFalse(AuthorDailyStats.objects.exists())
+        self.assertFalse(RollupWatermark.objects.exclude(last_id=0).exists())
+
+    @override_settings(STATS_ROLLUP_BATCH=2)
+    def test_batches(self):
+        self.assertEqual(self.roll_up(), {'likes': 3, 'comments': 3, 'follows': 0})
+        self.assertEqual(self.today(self.therapist), {'likes': 2, 'comments': 2, 'new_followers': 0})
+
+    def test_endpoint_reads_the_rollups(self):
+        self.roll_up()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/me/stats/', {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'posts_' in q['sql'] or 'notifications_' in q['sql']])
+        stats = response.json()
+        self.assertEqual(stats['totals'], {'likes': 2, 'comments': 2, 'new_followers': 0})
+        self.assertEqual(len(stats['daily']), 7)
+        self.assertEqual(stats['daily'][-1], {'day': timezone.localdate().isoformat(),
+                                              'likes': 2, 'comments': 2, 'new_followers': 0})
+        self.assertEqual(stats['top_posts'], [{'post': self.busy.pk, 'likes': 2, 'comments': 2}])
+        self.assertEqual(len(self.client.get('/api/users/me/stats/', {'days': 5000}).json()['daily']), 365)
+
+
+class MuteBlockTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # jane follows dr_smith and admin; dr_smith follows jane back
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def setUp(self):
+        cache.clear()
+        self.clients = {}
+        for user in (self.parent, self.therapist, self.admin):
+            self.clients[user.username] = client = APIClient()
+            client.force_authenticate(user)
+
+    def authors(self, path, **params):
+        response = self.clients['jane'].get(path, params)
+        return sorted({post['author']['username'] for post in response.json()['results']})
+
+    def test_mute(self):
+        self.assertEqual(self.clients['jane'].post('/api/users/mute/admin/').json()['status'], 'muted')
+        self.assertEqual(self.authors('/api/social/feed/'), ['dr_smith'])
+        self.assertEqual(self.authors('/api/social/search/', q='e'), ['dr_smith', 'jane'])
+        quiet = Post.objects.get(author=self.parent)
+        self.clients['admin'].post(f'/api/posts/{quiet.pk}/like/')
+        self.assertFalse(Notification.objects.filter(recipient=self.parent, sender=self.admin).exists())
+        users = self.clients['jane'].get('/api/users/me/muted/').json()['results']
+        self.assertEqual([user['username'] for user in users], ['admin'])
+
+        # muting isn't unfollowing, and only goes one way
+        self.assertTrue(self.parent.following.filter(pk=self.admin.pk).exists())
+        self.clients['jane'].post('/api/users/mute/admin/')
+        self.assertEqual(self.authors('/api/social/feed/'), ['admin', 'dr_smith'])
+
+    def test_block(self):
+        quiet = Post.objects.get(author=self.parent)
+        self.clients['dr_smith'].post(f'/api/posts/{quiet.pk}/comments/', {'content': 'Hello'})
+        self.assertEqual(Notification.objects.filter(recipient=self.parent).count(), 1)
+
+        self.assertEqual(self.clients['dr_smith'].post('/api/users/block/jane/').json()['status'], 'blocked')
+        self.assertFalse(self.parent.following.filter(pk=self.therapist.pk).exists())
+        self.assertFalse(self.therapist.following.filter(pk=self.parent.pk).exists())
+        self.assertFalse(Notification.objects.filter(recipient=self.parent).exists())
+        # the blocked side doesn't see the blocker either
+        self.assertEqual(self.authors('/api/social/search/', q='e'), ['admin', 'jane'])
+        for follower, followed in [('jane', 'dr_smith'), ('dr_smith', 'jane')]:
+            response = self.clients[follower].post(f'/api/users/follow/{followed}/')
+            self.assertEqual(response.status_code, 403, follower)
+
+        self.clients['dr_smith'].post('/api/users/block/jane/')
+        self.assertEqual(self.clients['jane'].post('/api/users/follow/dr_smith/').json()['status'], 'followed')
+
+    def test_version_outlives_eviction(self):
+        self.clients['jane'].post('/api/users/mute/admin/')
+        self.assertEqual(self.authors('/api/social/feed/'), ['dr_smith'])
+        # the cache drops the version key but keeps the set, and the
+        # unmute has no version to move
+        cache.delete(f'exclusions:version:{self.parent.pk}')
+        self.clients['jane'].post('/api/users/mute/admin/')
+        self.assertEqual(self.authors('/api/social/feed/'), ['admin', 'dr_smith'])
+
+    def test_no_cost_without_mutes(self):
+        feed = '/api/social/feed/'
+        self.clients['jane'].get(feed)
+        with CaptureQueriesContext(connection) as queries:
+            self.clients['jane'].get(feed)
+        sql = ' '.join(q['sql'] for q in queries)
+        # the set is cached, and empty it changes nothing
+        self.assertNotIn('users_mute', sql)
+        self.assertNotIn('users_block', sql)
+        self.assertNotIn(' NOT ', sql)
+        self.assertEqual(self.clients['jane'].post('/api/users/mute/jane/').status_code, 400)
+
+
+class ThrottleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_burst_then_wait(self):
+        # 3 a minute: a token every 20 seconds
+        for _ in range(3):
+            self.assertEqual(take('bucket', 3, 60, now=1000), 0)
+        self.assertEqual(take('bucket', 3, 60, now=1000), 20)
+        self.assertEqual(take('bucket', 3, 60, now=1010), 10)
+        self.assertEqual(take('bucket', 3, 60, now=1020), 0)
+        self.assertEqual(take('bucket', 3, 60, now=1020), 20)
+        # an idle bucket fills up again, and no further
+        for _ in range(3):
+            self.assertEqual(take('bucket', 3, 60, now=2000), 0)
+        self.assertEqual(take('bucket', 3, 60, now=2000), 20)
+
+    def test_denial_returns_the_token(self):
+        for _ in range(3):
+            take('bucket', 3, 60, now=1000)
+        paid_off = cache.get('bucket')
+        for _ in range(5):
+            self.assertEqual(take('bucket', 3, 60, now=1000), 20)
+        # hammering a full bucket doesn't push the next token further out
+        self.assertEqual(cache.get('bucket'), paid_off)
+
+    def test_busy_bucket_outlives_its_timeout(self):
+        # a client asking twice as fast as 3 per 3s, for well past the
+        # key's 30s timeout: once the burst is spent it never gets two
+        # in a row again
+        allowed = []
+        with mock.patch('time.time') as clock:
+            for step in range(100):
+                clock.return_value = now = 1000 + step / 2
+                allowed.append(not take('bucket', 3, 3, now=now))
+        # the burst, plus the tokens that came in while it was spent
+        self.assertEqual(allowed[:6], [True] * 5 + [False])
+        self.assertFalse(any(a and b for a, b in zip(allowed[5:], allowed[6:])))
+
+    def test_endpoint_class(self):
+        self.assertEqual(endpoint_class(FeedView, 'GET'), 'feed')
+        self.assertEqual(endpoint_class(AsyncFeedView, 'GET'), 'feed')
+        self.assertEqual(endpoint_class(SearchPostsView, 'GET'), 'search')
+        self.assertEqual(endpoint_class(PostListCreateView, 'GET'), 'read')
+        self.assertEqual(endpoint_class(PostListCreateView, 'HEAD'), 'read')
+        self.assertEqual(endpoint_class(PostListCreateView, 'POST'), 'write')
+
+    def test_429(self):
+        rates = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'search': '2/min'}}
+        client = APIClient()
+        client.force_authenticate(self.parent)
+        with override_settings(REST_FRAMEWORK=rates):
+            for _ in range(2):
+                self.assertEqual(client.get('/api/social/search/', {'q': 'e'}).status_code, 200)
+            response = client.get('/api/social/search/', {'q': 'e'})
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '30')
+            # other classes, and other users, have buckets of their own
+            self.assertEqual(client.get('/api/social/feed/').status_code, 200)
+            client.force_authenticate(self.therapist)
+            self.assertEqual(client.get('/api/social/search/', {'q': 'e'}).status_code, 200)
+
+
+@override_settings(SHED_MAX_IN_FLIGHT=4, SHED_MAX_QUEUE_MS=500)
+class LoadSheddingTests(TestCase):
+
+    def setUp(self):
+        self.middleware = LoadSheddingMiddleware(lambda request: HttpResponse('ok'))
+        self.factory = RequestFactory()
+
+    def status(self, method, path, in_flight=0, queued=None):
+        headers = {}
+        if queued is not None:
+            headers[REQUEST_START_HEADER] = f't={time.time() - queued:.3f}'
+        request = getattr(self.factory, method)(path, headers=headers)
+        self.middleware.in_flight = in_flight
+        response = self.middleware(request)
+        # shed or served, the request is counted out again
+        self.assertEqual(self.middleware.in_flight, in_flight)
+        return response.status_code, request.overload
+
+    def test_in_flight(self):
+        self.assertEqual(self.status('get', '/api/social/feed/', in_flight=3), (200, 0))
+        self.assertEqual(self.status('get', '/api/social/feed/', in_flight=4), (503, 1))
+        self.assertEqual(self.status('get', '/api/posts/', in_flight=4), (200, 1))
+        self.assertEqual(self.status('get', '/api/posts/', in_flight=8), (503, SEVERE))
+
+    def test_queue_time(self):
+        self.assertEqual(self.status('get', '/api/social/search/', queued=0.2), (200, 0))
+        self.assertEqual(self.status('get', '/api/social/search/', queued=0.7), (503, 1))
+        self.assertEqual(self.status('get', '/api/posts/', queued=0.7), (200, 1))
+        self.assertEqual(self.status('get', '/api/posts/', queued=1.5), (503, SEVERE))
+
+    def test_writes_and_logins_never_shed(self):
+        for method, path in [('post', '/api/posts/'), ('post', '/api/users/login/'),
+                             ('get', '/admin/')]:
+            self.assertEqual(self.status(method, path, in_flight=100, queued=5)[0], 200, path)
+
+    def test_retry_after(self):
+        response = self.middleware(self.factory.get('/api/social/feed/', headers={REQUEST_START_HEADER: 't=1'}))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(int(response['Retry-After']), range(settings.SHED_RETRY_AFTER, settings.SHED_RETRY_AFTER * 2 + 1))
+
+
+class QueryPlanTests(QueryPlanAssertions, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def test_feed(self):
+        # each followed author's posts come off post_author_created_idx
+        # in order, but merging several authors still needs a sort; it
+        # only ever sees followed authors' rows, never the whole table
+        self.assertViewIndexed(FeedView, self.parent, allow=(SORT,))
+
+    def test_feed_delta(self):
+        since = timezone.now() - timedelta(minutes=5)
+        authors = [self.therapist.pk, self.admin.pk]
+        self.assertIndexed(Post.objects.filter(author_id__in=authors, updated_at__gt=since), allow=(SORT,))
+
+    def test_stats(self):
+        start = timezone.localdate() - timedelta(days=29)
+        self.assertIndexed(AuthorDailyStats.objects.filter(author=self.therapist, day__gte=start))
+        self.assertIndexed(PostDailyStats.objects.filter(author=self.therapist, day__gte=start)
+                           .values('post_id').annotate(n=Sum('likes')).order_by('-n')[:10], allow=(SORT,))
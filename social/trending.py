@@ -0,0 +1,183 @@
+"""
+What's active right now: posts ranked by the likes and comments they
+got over the last TRENDING_WINDOW_SECONDS.
+
+    trending.record_like(post.pk)          # from LikePostView
+    trending.record_comment(post.pk)       # from CommentListCreateView
+    trending.top(20, therapists_only=True) # [(post_id, score), ...]
+
+Counting the Like and Comment tables per request would mean a grouped
+scan of the busiest tables, so activity is kept in time buckets
+instead, TRENDING_BUCKET_SECONDS wide:
+
+  * each process adds events to in-memory counters, which cost nothing
+    on the request path;
+  * every TRENDING_FLUSH_SECONDS those counters are compacted into
+    PostActivityBucket rows (one per post and bucket, incremented in
+    place), so all processes' activity ends up in one place;
+  * the ranking — the TRENDING_TOP_SIZE highest scores in the window,
+    picked with a heap, plus the same for therapists' posts — is built
+    from the buckets in the window and shared through the Django cache
+    for TRENDING_CACHE_SECONDS. top() only slices it.
+
+The window slides one bucket at a time. compact_trending prunes
+buckets that have left it. Events still in memory when a process
+exits are lost, at most TRENDING_FLUSH_SECONDS' worth.
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from posts.models import Post
+from users.models import User
+from .models import PostActivityBucket
+
+LIKE_WEIGHT = 1
+# a comment takes more effort than a like, and says more
+COMMENT_WEIGHT = 3
+
+TOP_CACHE_KEY = 'trending:top'
+
+
+def bucket_start(moment):
+    """Start of the bucket `moment` falls in."""
+    size = getattr(settings, 'TRENDING_BUCKET_SECONDS', 300)
+    seconds = int(moment.timestamp())
+    return datetime.fromtimestamp(seconds - seconds % size, tz=dt_timezone.utc)
+
+
+def window_start(moment):
+    """Start of the oldest bucket still inside the window ending at `moment`."""
+    size = getattr(settings, 'TRENDING_BUCKET_SECONDS', 300)
+    buckets = max(1, getattr(settings, 'TRENDING_WINDOW_SECONDS', 7200) // size)
+    return bucket_start(moment) - timedelta(seconds=size * (buckets - 1))
+
+
+class Trending:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (bucket_start, post_id) -> [likes, comments] not yet in the database
+        self._pending = defaultdict(lambda: [0, 0])
+        self._last_flush = time.monotonic()
+        # this process's copy of the cached ranking: (expires, lists)
+        self._top = None
+
+    def record_like(self, post_id, delta=1):
+        # delta=-1 for an unlike, so like/unlike spam nets out
+        self._record(post_id, delta, 0)
+
+    def record_comment(self, post_id, delta=1):
+        self._record(post_id, 0, delta)
+
+    def _record(self, post_id, likes, comments):
+        key = (bucket_start(timezone.now()), post_id)
+        with self._lock:
+            counts = self._pending[key]
+            counts[0] += likes
+            counts[1] += comments
+            due = time.monotonic() - self._last_flush >= getattr(settings, 'TRENDING_FLUSH_SECONDS', 10)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Add the in-memory counts to PostActivityBucket; returns rows touched."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: [0, 0])
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        # posts can be deleted between the event and the flush
+        live = set(Post.all_objects.filter(
+            pk__in={post_id for _, post_id in pending}
+        ).values_list('pk', flat=True))
+        touched = 0
+        with transaction.atomic():
+            for (start, post_id), (likes, comments) in pending.items():
+                if post_id in live and (likes or comments):
+                    self._add(post_id, start, likes, comments)
+                    touched += 1
+        return touched
+
+    def _add(self, post_id, start, likes, comments):
+        buckets = PostActivityBucket.objects.filter(post_id=post_id, bucket_start=start)
+        if buckets.update(likes=F('likes') + likes, comments=F('comments') + comments):
+            return
+        try:
+            with transaction.atomic():
+                PostActivityBucket.objects.create(post_id=post_id, bucket_start=start,
+                                                  likes=likes, comments=comments)
+        except IntegrityError:
+            # another process created the bucket first
+            buckets.update(likes=F('likes') + likes, comments=F('comments') + comments)
+
+    def top(self, k, therapists_only=False):
+        """The k hottest posts as [(post_id, score), ...], best first."""
+        lists = self._rankings()
+        return lists['therapists' if therapists_only else 'all'][:k]
+
+    def _rankings(self):
+        now = time.monotonic()
+        if self._top is not None and self._top[0] > now:
+            return self._top[1]
+        lists = cache.get(TOP_CACHE_KEY)
+        if lists is None:
+            lists = self.rank()
+        self._top = (now + getattr(settings, 'TRENDING_CACHE_SECONDS', 30), lists)
+        return lists
+
+    def rank(self):
+        """Rebuild the ranking from the buckets in the window and cache it."""
+        self.flush()
+        rows = (
+            PostActivityBucket.objects
+            .filter(bucket_start__gte=window_start(timezone.now()), post__deleted_at__isnull=True)
+            .values('post_id', 'post__author__role')
+            .annotate(likes=Sum('likes'), comments=Sum('comments'))
+            .order_by()
+        )
+        scored = [
+            (row['likes'] * LIKE_WEIGHT + row['comments'] * COMMENT_WEIGHT, row['post_id'],
+             row['post__author__role'] == User.THERAPIST)
+            for row in rows
+        ]
+        scored = [entry for entry in scored if entry[0] > 0]
+        size = getattr(settings, 'TRENDING_TOP_SIZE', 100)
+        # ties go to the newer post
+        lists = {
+            'all': [(post_id, score) for score, post_id, _ in heapq.nlargest(size, scored)],
+            'therapists': [(post_id, score) for score, post_id, therapist
+                           in heapq.nlargest(size, [e for e in scored if e[2]])],
+        }
+        cache.set(TOP_CACHE_KEY, lists, getattr(settings, 'TRENDING_CACHE_SECONDS', 30))
+        self._top = (time.monotonic() + getattr(settings, 'TRENDING_CACHE_SECONDS', 30), lists)
+        return lists
+
+    def compact(self):
+        """
+        Flush, drop the buckets that have slid out of the window and
+        refresh the cached ranking. Returns the number of pruned rows.
+        """
+        self.flush()
+        pruned, _ = PostActivityBucket.objects.filter(
+            bucket_start__lt=window_start(timezone.now())
+        ).delete()
+        self.rank()
+        return pruned
+
+    def clear(self):
+        """Forget this process's unflushed counts and ranking (tests)."""
+        with self._lock:
+            self._pending.clear()
+            self._top = None
+
+
+trending = Trending()
@@ -1,7 +1,9 @@
 from django.urls import path
+from my_village.async_views import read_view
 from . import views
 
 urlpatterns = [
-    path('feed/', views.FeedView.as_view(), name='feed'),
+    path('feed/', read_view(views.AsyncFeedView), name='feed'),
     path('search/', views.SearchPostsView.as_view(), name='search'),
+    path('trending/', views.TrendingPostsView.as_view(), name='trending'),
 ]
\ No newline at end of file
@@ -1,32 +1,110 @@
+from functools import cached_property
+
+from django.conf import settings
 from rest_framework import generics, permissions
 from rest_framework.response import Response
-from rest_framework.views import APIView
 from posts.models import Post
+from posts.payloads import CachedPostListMixin, posts_by_id
 from posts.serializers import PostSerializer
+from my_village.delta import DeltaSyncMixin
+from my_village.fastpath import FastListMixin
+from my_village.async_views import AsyncListView
+from users.exclusions import excluded_ids
+from users.models import Tombstone
+from users.purge import buried_since
+from .trending import trending
 
 
-class FeedView(generics.ListAPIView):
+class FeedView(DeltaSyncMixin, CachedPostListMixin, FastListMixin, generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # polled constantly: its own rate limit, and shed first under load
+    throttle_scope = 'feed'
 
     def get_queryset(self):
         # grab ids of everyone the current user follows
         # then filter posts to only those authors
         # ordering is handled by Post.Meta — newest first
-        followed_users = self.request.user.following.values_list('id', flat=True)
+        # deleted accounts drop out at once, before their posts are hidden
+        # muted and blocked authors are left out of that list, only for
+        # users who have any (users/exclusions.py)
+        followed_users = self.request.user.following.filter(
+            deleted_at__isnull=True
+        ).values_list('id', flat=True)
+        if self.excluded:
+            followed_users = followed_users.exclude(id__in=self.excluded)
         return Post.objects.filter(author_id__in=followed_users)
 
+    @cached_property
+    def excluded(self):
+        return excluded_ids(self.request.user)
+
     def get_serializer_context(self):
         return {'request': self.request}
 
+    # ?since= delta sync, see my_village/delta.py
+
+    @cached_property
+    def followed(self):
+        # {id: deleted_at} for everyone the user follows and hasn't muted
+        followed = dict(self.request.user.following.values_list('id', 'deleted_at'))
+        return {pk: deleted_at for pk, deleted_at in followed.items() if pk not in self.excluded}
+
+    def get_reset_marks(self):
+        # a follow or an unfollow changes which authors are in the feed
+        # at all: start over
+        return [('follow', self.request.user.pk)]
+
+    def get_delta_marks(self):
+        return [('post', pk) for pk in self.followed]
+
+    def get_delta(self, since):
+        # so does a followed account's deletion
+        if any(deleted_at is not None for deleted_at in self.followed.values()):
+            return None
+        authors = list(self.followed)
+        changed = Post.objects.filter(author_id__in=authors, updated_at__gt=since)
+        return changed, buried_since(Tombstone.POST, authors, since)
+
 
-class SearchPostsView(generics.ListAPIView):
+class AsyncFeedView(AsyncListView):
+    # served under ASGI, see my_village/async_views.py
+    sync_view = FeedView
+
+
+class SearchPostsView(FastListMixin, generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # a scan of every post, see my_village/throttling.py
+    throttle_scope = 'search'
 
     def get_queryset(self):
         keyword = self.request.query_params.get('q', '')
         if not keyword:
             return Post.objects.none()
         # icontains = case-insensitive search
-        return Post.objects.filter(content__icontains=keyword)
\ No newline at end of file
+        posts = Post.objects.filter(content__icontains=keyword)
+        excluded = excluded_ids(self.request.user)
+        if excluded:
+            posts = posts.exclude(author_id__in=excluded)
+        return posts
+
+
+class TrendingPostsView(generics.GenericAPIView):
+    # the hottest posts right now, from social/trending.py's counters
+    # ?limit=20 (up to TRENDING_TOP_SIZE)  ?therapists=1 for therapists' posts only
+    serializer_class = PostSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        limit = min(max(limit, 1), getattr(settings, 'TRENDING_TOP_SIZE', 100))
+        therapists_only = request.query_params.get('therapists') in ('1', 'true')
+        ids = [post_id for post_id, score in trending.top(limit, therapists_only)]
+        # the shared payloads the feed reads (posts/payloads.py), in the
+        # ranking's order
+        found = posts_by_id(ids, request, self.get_serializer_context())
+        return Response([found[pk] for pk in ids if pk in found])
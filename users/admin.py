@@ -1,3 +1,111 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
-# Register your models here.
+from my_village.admin import EstimatedCountPaginator, LargeTableAdmin
+from my_village.cache import touch
+from my_village.delta import bump
+from .directory import invalidate_directory
+from .exclusions import invalidate_exclusions
+from .models import User, ParentProfile, TherapistProfile, DeletionJob, Tombstone, Mute, Block
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_display = ['username', 'email', 'role', 'is_active', 'is_staff', 'date_joined', 'deleted_at']
+    list_filter = ['role', 'is_active', 'is_staff']
+    # the follow widget would render every user on the platform
+    raw_id_fields = ['following']
+    fieldsets = BaseUserAdmin.fieldsets + (
+        ('MyVillage', {'fields': ('role', 'bio', 'profile_picture', 'following', 'deleted_at')}),
+    )
+    add_fieldsets = BaseUserAdmin.add_fieldsets + (
+        ('MyVillage', {'fields': ('role',)}),
+    )
+
+
+@admin.register(ParentProfile)
+class ParentProfileAdmin(LargeTableAdmin):
+    list_display = ['user', 'number_of_children', 'children_age_range']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    search_fields = ['user__username']
+
+
+@admin.register(TherapistProfile)
+class TherapistProfileAdmin(LargeTableAdmin):
+    list_display = ['user', 'license_number', 'specialization', 'years_of_experience',
+                    'is_verified', 'accepting_clients']
+    list_filter = ['is_verified', 'accepting_clients']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    search_fields = ['user__username', 'license_number']
+    actions = ['verify_selected']
+
+    @admin.action(description='Verify selected therapists', permissions=['change'])
+    def verify_selected(self, request, queryset):
+        # one UPDATE for the whole selection; update() skips the
+        # post_save signal, so clear the directory and read caches here
+        unverified = queryset.filter(is_verified=False)
+        users = list(unverified.values_list('user_id', flat=True))
+        verified = unverified.update(is_verified=True)
+        invalidate_directory()
+        touch('user', users)
+        self.message_user(request, f'{verified} therapist(s) verified.')
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(LargeTableAdmin):
+    list_display = ['kind', 'object_id', 'requested_at', 'started_at', 'finished_at', 'progress']
+    list_filter = ['kind']
+    readonly_fields = ['progress', 'started_at', 'finished_at', 'heartbeat_at']
+
+
+@admin.register(Tombstone)
+class TombstoneAdmin(LargeTableAdmin):
+    list_display = ['stream', 'object_id', 'owner_id', 'deleted_at']
+    list_filter = ['stream']
+
+
+class ExclusionAdmin(LargeTableAdmin):
+    """Mutes and blocks edited here move both users' exclusion sets, as toggling them does."""
+    # the other side of the pair: 'muted' or 'blocked'
+    other = None
+
+    def changed(self, rows):
+        user_ids = {user_id for row in rows for user_id in (row.user_id, getattr(row, f'{self.other}_id'))}
+        invalidate_exclusions(user_ids)
+        bump('follow', user_ids)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # the users it was between before the edit
+            self.changed([type(obj).objects.get(pk=obj.pk)])
+        super().save_model(request, obj, form, change)
+        self.changed([obj])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.changed([obj])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset)
+        super().delete_queryset(request, queryset)
+        self.changed(rows)
+
+
+@admin.register(Mute)
+class MuteAdmin(ExclusionAdmin):
+    list_display = ['user', 'muted', 'created_at']
+    list_select_related = ['user', 'muted']
+    raw_id_fields = ['user', 'muted']
+    other = 'muted'
+
+
+@admin.register(Block)
+class BlockAdmin(ExclusionAdmin):
+    list_display = ['user', 'blocked', 'created_at']
+    list_select_related = ['user', 'blocked']
+    raw_id_fields = ['user', 'blocked']
+    other = 'blocked'
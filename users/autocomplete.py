@@ -0,0 +1,79 @@
+"""
+Username typeahead for /api/users/autocomplete/?q=.
+
+Every keystroke is a request, so each lookup has to be a short walk
+down an index, never a scan. User.search_key holds the casefolded
+username, and "starts with q" becomes a range on user_search_key_idx:
+
+  * Postgres: LIKE 'q%', which varchar_pattern_ops indexes serve in any
+    collation;
+  * SQLite: search_key >= 'q' AND search_key < 'q\\U0010ffff', since its
+    LIKE is case-insensitive and can't use a plain index. Keys are
+    compared as code points there, so that range is exactly the prefix.
+
+Suggestions come in three tiers, each a LIMITed query of its own: users
+the searcher follows (read off their follow list, so only those few
+rows are sorted), then verified therapists (user_role_search_idx
+narrows the range to therapists), then everyone else; alphabetical
+within a tier. Whether a suggestion is a verified therapist is read off
+its own row, whichever tier it came in.
+"""
+from django.db import connections
+from django.db.models import BooleanField, Case, Value, When
+
+from .models import User
+
+# past the last code point, so q + this sorts after every key starting with q
+_MAX_CHAR = '\U0010ffff'
+
+
+def normalize(query):
+    return (query or '').strip().lstrip('@').casefold()
+
+
+def prefix_filter(prefix, using='default'):
+    if connections[using].vendor == 'postgresql':
+        return {'search_key__startswith': prefix}
+    return {'search_key__gte': prefix, 'search_key__lt': prefix + _MAX_CHAR}
+
+
+def candidates(prefix):
+    return User.objects.filter(
+        **prefix_filter(prefix), is_active=True, deleted_at__isnull=True
+    ).annotate(verified=Case(
+        When(role=User.THERAPIST, therapist_profile__is_verified=True, then=Value(True)),
+        default=Value(False), output_field=BooleanField(),
+    )).order_by('search_key')
+
+
+def suggest(user, query, limit=10):
+    """
+    Up to `limit` users whose username starts with `query`, best first.
+    Each carries `.followed` and `.verified` for the response.
+    """
+    prefix = normalize(query)
+    if not prefix:
+        return []
+    fields = ['id', 'username', 'role', 'profile_picture', 'search_key']
+
+    followed = list(
+        candidates(prefix).filter(followers=user).only(*fields)[:limit]
+    ) if user.is_authenticated else []
+    therapists = list(
+        candidates(prefix).filter(
+            role=User.THERAPIST, therapist_profile__is_verified=True
+        ).only(*fields)[:limit]
+    )
+    others = list(candidates(prefix).only(*fields)[:limit + len(followed) + len(therapists) + 1])
+
+    followed_ids = {u.pk for u in followed}
+    results, seen = [], {user.pk}
+    for suggestion in followed + therapists + others:
+        if suggestion.pk in seen:
+            continue
+        seen.add(suggestion.pk)
+        suggestion.followed = suggestion.pk in followed_ids
+        results.append(suggestion)
+        if len(results) == limit:
+            break
+    return results
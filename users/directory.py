@@ -0,0 +1,49 @@
+"""
+Caching for the therapist directory (/api/users/therapists/).
+
+The directory's total — verified therapists, joined across two
+tables — is the same for everyone, so it's counted once and cached
+under the directory's current version. Anything that changes who is
+listed calls invalidate_directory(), which moves to a new version and
+leaves the old entries to expire: profile saves and deletes (signals.py),
+account deletion and the admin's bulk verify action.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+
+VERSION_KEY = 'therapists:version'
+
+
+def directory_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate_directory():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # nothing cached yet (or evicted), so nothing to invalidate
+        pass
+
+
+class DirectoryPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        key = f'therapists:count:{directory_version()}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, getattr(settings, 'THERAPIST_DIRECTORY_CACHE_SECONDS', 300))
+        return count
+
+
+class DirectoryPagination(PageNumberPagination):
+    django_paginator_class = DirectoryPaginator
@@ -0,0 +1,132 @@
+"""
+Mutes and blocks, and the exclusion set the read and fan-out paths use.
+
+A user's exclusion set is everyone whose posts and notifications they
+don't get: who they muted, who they blocked and who blocked them. It's
+read on every feed page and every notification sent to them, so it's
+computed once, with one query per table, and cached under the user's
+version key, the way directory.py caches the therapist count. Muting,
+blocking and undoing either move the version of both users, straight
+away and again on commit.
+
+The hot paths take it as a plain list of ids, and only when it isn't
+empty, so for most users (who never mute anyone) nothing changes:
+
+  * the feed leaves excluded authors out of the followed ids it
+    already reads (social/views.py);
+  * search excludes their posts by author id;
+  * notify() (notifications/fanout.py) drops notifications from them
+    before they're written, and a block deletes the ones already there.
+
+A block also removes the follows between the two users and keeps
+either from following the other again.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+
+from my_village.batch import memoized
+from my_village.delta import bump
+from notifications.models import Notification
+from .models import Block, Mute, Tombstone
+from .purge import bury
+
+
+def _version_key(user_id):
+    return f'exclusions:version:{user_id}'
+
+
+def _version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # not 1: a version key the cache dropped would start over at a
+        # version whose set may still be cached. Versions move by one
+        # per change, so they never catch up with the clock
+        seed = time.time_ns()
+        cache.add(_version_key(user_id), seed, None)
+        version = cache.get(_version_key(user_id), seed)
+    return version
+
+
+def excluded_ids(user):
+    """frozenset of the ids of users whose content `user` doesn't get."""
+    if not user.is_authenticated:
+        return frozenset()
+    # the feed and search both read it: once per /api/batch/
+    return memoized(('excluded', user.pk), lambda: _excluded_ids(user))
+
+
+def _excluded_ids(user):
+    key = f'exclusions:{user.pk}:{_version(user.pk)}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            list(Mute.objects.filter(user=user).values_list('muted_id', flat=True))
+            + list(Block.objects.filter(user=user).values_list('blocked_id', flat=True))
+            + list(Block.objects.filter(blocked=user).values_list('user_id', flat=True))
+        )
+        cache.set(key, ids, getattr(settings, 'EXCLUSIONS_CACHE_SECONDS', 3600))
+    return ids
+
+
+def invalidate_exclusions(user_ids):
+    """Make the users' exclusion sets be computed again."""
+    def move():
+        for user_id in user_ids:
+            try:
+                cache.incr(_version_key(user_id))
+            except ValueError:
+                # nothing cached for them
+                pass
+
+    move()
+    # a set computed from the old rows before the commit lands
+    if connection.in_atomic_block:
+        transaction.on_commit(move)
+
+
+def blocked_between(user, other):
+    """Whether either of the two has blocked the other."""
+    return Block.objects.filter(
+        Q(user=user, blocked=other) | Q(user=other, blocked=user)
+    ).exists()
+
+
+def toggle_mute(user, other):
+    """Mute `other`, or unmute them if they're muted; returns whether they're muted now."""
+    with transaction.atomic():
+        removed, _ = Mute.objects.filter(user=user, muted=other).delete()
+        if not removed:
+            Mute.objects.create(user=user, muted=other)
+        _changed(user, other)
+    return not removed
+
+
+def toggle_block(user, other):
+    """Block `other`, or unblock them if they're blocked; returns whether they're blocked now."""
+    with transaction.atomic():
+        removed, _ = Block.objects.filter(user=user, blocked=other).delete()
+        if not removed:
+            Block.objects.create(user=user, blocked=other)
+            # through the related managers, so the follow signals run
+            user.following.remove(other)
+            other.following.remove(user)
+            between = Notification.objects.filter(
+                Q(recipient=user, sender=other) | Q(recipient=other, sender=user)
+            )
+            gone = list(between.values_list('recipient_id', 'pk'))
+            between.delete()
+            # so delta sync tells their clients to drop them
+            bury(Tombstone.NOTIFICATION, gone)
+            bump('notification', [recipient_id for recipient_id, _ in gone])
+        _changed(user, other)
+    return not removed
+
+
+def _changed(user, other):
+    invalidate_exclusions([user.pk, other.pk])
+    # which authors are in a feed changed: delta-synced feeds start over
+    bump('follow', [user.pk, other.pk])
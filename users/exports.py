@@ -0,0 +1,182 @@
+"""
+Streaming data export, as NDJSON or CSV, optionally gzipped.
+
+Used by the export endpoints in users/views.py and by the export_data
+management command. Rows are read with values_list().iterator(), so
+only `chunk_size` rows are in memory at a time whatever the size of
+the export, and the bytes are produced lazily for StreamingHttpResponse
+(or a file).
+
+Datasets are written one after another in DATASETS order, each ordered
+by id. Every NDJSON record carries its dataset name in "type", so the
+last record a client received gives the cursor to resume from:
+"<type>:<id>" restarts right after that row. CSV holds a single
+dataset per export; its cursor is "<type>:<id>" all the same, and a
+resumed CSV leaves out the header row.
+"""
+import csv
+import io
+import zlib
+from collections import namedtuple
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from my_village.renderers import orjson
+from notifications.models import Notification
+from posts.models import Post, Comment, Like
+from .models import User
+
+# columns per dataset; `owner` is the lookup tying a row to the user
+# in per-user exports, `private` columns only go out in those
+Dataset = namedtuple('Dataset', 'model fields owner private', defaults=((),))
+
+DATASETS = {
+    'users': Dataset(User, ('id', 'username', 'role', 'bio', 'date_joined', 'is_active'), 'pk',
+                     private=('email',)),
+    'follows': Dataset(User.following.through, ('id', 'from_user_id', 'to_user_id'), 'from_user_id'),
+    'posts': Dataset(Post, ('id', 'author_id', 'content', 'media_url', 'created_at', 'updated_at'), 'author_id'),
+    'comments': Dataset(Comment, ('id', 'post_id', 'author_id', 'content', 'created_at'), 'author_id'),
+    'likes': Dataset(Like, ('id', 'post_id', 'user_id', 'created_at'), 'user_id'),
+    'notifications': Dataset(Notification, ('id', 'recipient_id', 'sender_id', 'notification_type',
+                                            'post_id', 'is_read', 'created_at'), 'recipient_id'),
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# flush to the client roughly this often
+BUFFER_BYTES = 64 * 1024
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_cursor(cursor, types):
+    """'<type>:<id>' -> (type, id); raises ExportError if malformed."""
+    name, sep, last_id = (cursor or '').partition(':')
+    if not sep or name not in types:
+        raise ExportError(f'Invalid cursor {cursor!r}.')
+    try:
+        return name, int(last_id)
+    except ValueError:
+        raise ExportError(f'Invalid cursor {cursor!r}.')
+
+
+def parse_types(value):
+    """Comma-separated dataset names (all of them when empty), in export order."""
+    if not value:
+        return list(DATASETS)
+    wanted = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = wanted - set(DATASETS)
+    if unknown:
+        raise ExportError(f"Unknown export type(s): {', '.join(sorted(unknown))}.")
+    return [name for name in DATASETS if name in wanted]
+
+
+class Export:
+    """
+    One export: which datasets, whose rows, where to start. Iterating
+    it yields the encoded (and compressed, with gzip=True) bytes.
+    """
+
+    def __init__(self, types=None, fmt='ndjson', user=None, cursor=None, chunk_size=2000, gzip=False):
+        if fmt not in FORMATS:
+            raise ExportError(f'Unknown format {fmt!r}.')
+        self.types = list(types or DATASETS)
+        if fmt == 'csv' and len(self.types) != 1:
+            raise ExportError('CSV exports hold one type at a time.')
+        self.fmt = fmt
+        self.user = user
+        self.chunk_size = chunk_size
+        self.gzip = gzip
+        self.start_type, self.start_after = parse_cursor(cursor, self.types) if cursor else (self.types[0], 0)
+
+    @property
+    def content_type(self):
+        return FORMATS[self.fmt]
+
+    @property
+    def filename(self):
+        # no .gz even when gzipped: the views send that as
+        # Content-Encoding, which clients undo before saving the file
+        name = 'export' if self.fmt == 'ndjson' else self.types[0]
+        return f'{name}.{self.fmt}'
+
+    def __iter__(self):
+        chunks = self.ndjson() if self.fmt == 'ndjson' else self.csv()
+        if not self.gzip:
+            yield from chunks
+            return
+        # wbits=31: gzip container, so `gunzip` and browsers read it
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def rows(self, name):
+        dataset = DATASETS[name]
+        fields = dataset.fields + (dataset.private if self.user is not None else ())
+        queryset = dataset.model._default_manager.all()
+        if self.user is not None:
+            queryset = queryset.filter(**{dataset.owner: self.user.pk})
+        if name == self.start_type:
+            queryset = queryset.filter(id__gt=self.start_after)
+        rows = queryset.order_by('id').values_list(*fields).iterator(chunk_size=self.chunk_size)
+        return fields, rows
+
+    def datasets(self):
+        return self.types[self.types.index(self.start_type):]
+
+    def ndjson(self):
+        dumps = _json_dumps()
+        buffer = []
+        size = 0
+        for name in self.datasets():
+            fields, rows = self.rows(name)
+            for row in rows:
+                line = dumps({'type': name, **dict(zip(fields, row))})
+                buffer.append(line)
+                size += len(line)
+                if size >= BUFFER_BYTES:
+                    yield b''.join(buffer)
+                    buffer.clear()
+                    size = 0
+        if buffer:
+            yield b''.join(buffer)
+
+    def csv(self):
+        fields, rows = self.rows(self.types[0])
+        text = io.StringIO()
+        writer = csv.writer(text)
+        if not self.start_after:
+            # a resumed CSV continues the file that already has one
+            writer.writerow(fields)
+        for row in rows:
+            writer.writerow(row)
+            if text.tell() >= BUFFER_BYTES:
+                yield text.getvalue().encode()
+                text.seek(0)
+                text.truncate()
+        if text.tell():
+            yield text.getvalue().encode()
+
+
+def _json_dumps():
+    """A row dict -> one NDJSON line, as bytes."""
+    if orjson is not None:
+        default = JSONEncoder().default
+        option = orjson.OPT_APPEND_NEWLINE | orjson.OPT_UTC_Z
+
+        def dumps(obj):
+            return orjson.dumps(obj, default=default, option=option)
+        return dumps
+
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(obj):
+        return (encoder.encode(obj) + '\n').encode()
+    return dumps
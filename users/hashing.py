@@ -0,0 +1,141 @@
+"""
+Password hashing off the request threads, and the hasher profiles.
+
+A login is one deliberately slow hash, hundreds of milliseconds of CPU
+with PBKDF2's default iterations. Run on the request thread, a burst
+of logins takes every worker and every core, and the feed waits behind
+them. So the hashes behind logins (PooledModelBackend, in backends.py)
+run in a pool of PASSWORD_HASHING_WORKERS threads per process instead:
+
+  * at most that many hashes run at once, so the other cores are left
+    to the requests; hashlib and argon2 let go of the GIL while they
+    hash, so the threads do run side by side;
+  * at most PASSWORD_HASHING_MAX_WAITING more wait for a thread. A
+    login past that is turned away straight away rather than holding
+    its worker in the queue: HashingBusy, which LoadSheddingMiddleware
+    answers 503 with Retry-After, whichever view called authenticate();
+  * PASSWORD_HASHING_WORKERS = 0 hashes on the request thread, as
+    Django does.
+
+Which hashers are used is a profile, PASSWORD_HASHER_PROFILE in
+settings.py: 'pbkdf2' (the default) or 'argon2', which needs
+argon2-cffi (pip install "django[argon2]"). Both hashers here take
+their cost from settings, and a password stored with another hasher or
+cost is hashed again, in the pool, the next time its owner logs in.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from my_village.shedding import Overloaded
+
+
+class HashingBusy(Overloaded):
+    """Every hashing thread is taken and the queue is full."""
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 with PASSWORD_PBKDF2_ITERATIONS rounds."""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id with the costs in PASSWORD_ARGON2. Django's default asks
+    for 100 MiB and 8 lanes per hash; the pool already hashes one login
+    per thread, so one lane and less memory go further.
+    """
+
+    def _cost(self, name):
+        return getattr(settings, 'PASSWORD_ARGON2', {}).get(name, getattr(Argon2PasswordHasher, name))
+
+    @property
+    def time_cost(self):
+        return self._cost('time_cost')
+
+    @property
+    def memory_cost(self):
+        return self._cost('memory_cost')
+
+    @property
+    def parallelism(self):
+        return self._cost('parallelism')
+
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def _workers():
+    return getattr(settings, 'PASSWORD_HASHING_WORKERS', 0)
+
+
+def _get_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            workers = _workers()
+            _pool = ThreadPoolExecutor(workers, thread_name_prefix='password-hashing')
+            _slots = threading.BoundedSemaphore(workers + getattr(settings, 'PASSWORD_HASHING_MAX_WAITING', 64))
+        return _pool, _slots
+
+
+@receiver(setting_changed)
+def _reset_pool(setting, **kwargs):
+    # the next hash starts a pool of the new size
+    global _pool, _slots
+    if setting in ('PASSWORD_HASHING_WORKERS', 'PASSWORD_HASHING_MAX_WAITING'):
+        with _pool_lock:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = _slots = None
+
+
+def run(func, *args):
+    """func(*args) in the hashing pool; raises HashingBusy when it's full."""
+    if not _workers():
+        return func(*args)
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = pool.submit(func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+
+def _verify(raw_password, encoded):
+    # Django's check_password calls the setter when the password is
+    # right but stored with another hasher or cost
+    outdated = []
+    correct = hashers.check_password(raw_password, encoded, setter=outdated.append)
+    return correct, hashers.make_password(raw_password) if outdated else None
+
+
+def check_password(user, raw_password):
+    """
+    user.check_password() with the hashing in the pool. A password
+    stored the old way is stored again the current way.
+    """
+    correct, rehashed = run(_verify, raw_password, user.password)
+    if rehashed is not None:
+        user.password = rehashed
+        user.save(update_fields=['password'])
+    return correct
+
+
+def make_password(raw_password):
+    """make_password() in the pool."""
+    return run(hashers.make_password, raw_password)
@@ -0,0 +1,65 @@
+"""
+Write a data export to a file (or stdout) without going through HTTP.
+
+    python manage.py export_data --output platform.ndjson.gz --gzip
+    python manage.py export_data --user jane --type posts --format csv
+    python manage.py export_data --output rest.ndjson --cursor posts:81234
+
+Same NDJSON/CSV as the export endpoints (see users/exports.py), and the
+same constant memory use. An interrupted run resumes with --cursor
+set to "<type>:<id>" of the last complete line in the output.
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.exports import FORMATS, Export, ExportError, parse_types
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Stream an NDJSON or CSV export of platform (or one user\'s) data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='export only this username\'s data')
+        parser.add_argument('--type', help='comma-separated datasets (default: all)')
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+        parser.add_argument('--cursor', help='resume after "<type>:<id>"')
+        parser.add_argument('--output', help='file to write (default: stdout)')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}.")
+        try:
+            export = Export(
+                types=parse_types(options['type']),
+                fmt=options['format'],
+                user=user,
+                cursor=options['cursor'],
+                chunk_size=options['chunk_size'],
+                gzip=options['gzip'],
+            )
+        except ExportError as exc:
+            raise CommandError(str(exc))
+
+        # resuming appends to the partial file from the interrupted run
+        mode = 'ab' if options['cursor'] else 'wb'
+        out = open(options['output'], mode) if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in export:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+        if options['output']:
+            self.stderr.write(f"wrote {written} bytes to {options['output']}")
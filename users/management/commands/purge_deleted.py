@@ -0,0 +1,59 @@
+"""
+Purge soft-deleted accounts and posts in small chunks.
+
+    python manage.py purge_deleted                 # run what's queued, exit
+    python manage.py purge_deleted --loop          # keep polling for jobs
+    python manage.py purge_deleted --status        # show the queue
+
+See users/purge.py for the order things are removed in. Run it from
+cron or as a long-lived worker; several copies can run side by side.
+It also prunes delta-sync tombstones older than DELTA_SYNC_MAX_AGE.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.models import DeletionJob
+from users.purge import Purger, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Remove soft-deleted users and posts, and everything that hangs off them, in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='keep running, polling for new jobs')
+        parser.add_argument('--interval', type=float, default=30.0,
+                            help='seconds between polls with --loop (default: 30)')
+        parser.add_argument('--chunk-size', type=int, help='rows per chunk (default: PURGE_CHUNK_SIZE)')
+        parser.add_argument('--pause', type=float, help='seconds between chunks (default: PURGE_CHUNK_PAUSE)')
+        parser.add_argument('--status', action='store_true', help='list unfinished jobs and exit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            return self.status()
+
+        self.verbosity = options['verbosity']
+        purger = Purger(options['chunk_size'], options['pause'], on_chunk=self.report)
+        while True:
+            done = purger.run_pending()
+            if done:
+                self.stdout.write(f'{done} job(s) finished')
+            pruned = prune_tombstones()
+            if pruned and self.verbosity > 1:
+                self.stdout.write(f'{pruned} old tombstone(s) pruned')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+
+    def report(self, job, step, count):
+        if self.verbosity > 1:
+            self.stdout.write(f'{job}: {step} +{count} ({job.progress[step]} so far)')
+
+    def status(self):
+        jobs = DeletionJob.objects.filter(finished_at__isnull=True)
+        for job in jobs:
+            state = f'running since {job.started_at:%Y-%m-%d %H:%M:%S}' if job.started_at else 'queued'
+            progress = ', '.join(f'{step} {count}' for step, count in job.progress.items()) or 'nothing yet'
+            self.stdout.write(f'{job.kind} {job.object_id}: {state}; {progress}')
+        if not jobs:
+            self.stdout.write('no deletions pending')
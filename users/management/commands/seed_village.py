@@ -0,0 +1,354 @@
+"""
+Fill the database with realistic, reproducible load-test data.
+
+    python manage.py seed_village --users 10000
+    python manage.py seed_village --users 1000000 --batch-size 20000
+
+Popularity follows a power law: a few accounts (mostly therapists) get
+most of the followers, likes and comments, the way a real community
+does. The same --seed always produces the same data, so benchmark runs
+on different machines or commits see identical tables.
+
+Everything goes in with bulk_create, which skips save() and signals —
+so profiles, notifications and timestamps are built here explicitly.
+"""
+import itertools
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import localdate
+
+from notifications.models import Notification
+from posts.models import Post, Comment, Like
+from posts.tags import rebuild_index
+from posts.threads import top_level_path
+from social.models import FollowEvent
+from users.models import User, ParentProfile, TherapistProfile
+
+SEED_USERNAME_PREFIX = 'seed-'
+# every seeded account shares this password so benchmarks can log in
+SEED_PASSWORD = 'village-seed-password'
+
+SPECIALIZATIONS = [
+    'Child Anxiety', 'ADHD', 'Autism Spectrum', 'Speech and Language',
+    'Sleep', 'Behavioural Therapy', 'Family Therapy', 'Occupational Therapy',
+]
+AGE_RANGES = ['0-2 years', '2-4 years', '4-8 years', '8-12 years', '12-18 years']
+WORDS = (
+    'sleep routine toddler school anxiety meltdown screen time autism '
+    'speech therapy bedtime siblings tantrum reading diet calm support '
+    'advice question update progress week tips help thanks village '
+    'sensory play focus homework friends morning evening weekend'
+).split()
+# the first of these in a post is written as a #hashtag
+TOPICS = {'sleep', 'autism', 'anxiety', 'speech', 'tantrum', 'sensory', 'homework', 'siblings'}
+
+
+def hashtag(words):
+    for i, word in enumerate(words):
+        if word in TOPICS:
+            words[i] = f'#{word}'
+            break
+    return ' '.join(words)
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    bulk_create still runs pre_save(), so auto_now/auto_now_add would
+    stamp every row with the same "now". Switch them off while seeding
+    so the generated created_at spread survives.
+    """
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def zipf_cum_weights(n, alpha, rng, boost=None):
+    """
+    Cumulative power-law weights over n items in shuffled rank order,
+    for random.choices(). boost[i] multiplies item i's weight.
+    """
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    total = 0.0
+    cum = array('d')
+    for i, rank in enumerate(ranks):
+        weight = rank ** -alpha
+        if boost is not None:
+            weight *= boost[i]
+        total += weight
+        cum.append(total)
+    return cum
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Generate reproducible load-test data (users, follows, posts, comments, likes, notifications).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--therapist-ratio', type=float, default=0.1)
+        parser.add_argument('--verified-ratio', type=float, default=0.7,
+                            help='share of therapists that are verified')
+        parser.add_argument('--follows-per-user', type=float, default=20,
+                            help='mean out-degree of the follow graph')
+        parser.add_argument('--posts-per-user', type=float, default=5)
+        parser.add_argument('--comments-per-post', type=float, default=3)
+        parser.add_argument('--likes-per-post', type=float, default=8)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='power-law exponent for popularity')
+        parser.add_argument('--no-notifications', action='store_true')
+        parser.add_argument('--start', default='2026-01-01',
+                            help='first day of generated activity (UTC)')
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true',
+                            help='delete previously seeded users (and everything they own) first')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('--users must be at least 2.')
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.start = datetime.fromisoformat(options['start']).replace(tzinfo=timezone.utc)
+        self.span = options['days'] * 86400
+
+        if options['flush']:
+            self.step('flush', self.flush)
+        elif User.objects.filter(username__startswith=SEED_USERNAME_PREFIX).exists():
+            raise CommandError('Seeded users already exist; pass --flush to replace them.')
+
+        with explicit_timestamps(Post, Comment, Like, Notification, FollowEvent):
+            self.step('users', self.create_users)
+            self.step('follows', self.create_follows)
+            self.step('posts', self.create_posts)
+            self.step('comments', self.create_comments)
+            self.step('likes', self.create_likes)
+        self.step('tags', rebuild_index)
+
+    def step(self, name, func):
+        started = time.perf_counter()
+        count = func()
+        elapsed = time.perf_counter() - started
+        suffix = f' ({count} rows)' if count is not None else ''
+        self.stdout.write(f'{name}: {elapsed:.1f}s{suffix}')
+
+    def flush(self):
+        deleted, _ = User.objects.filter(username__startswith=SEED_USERNAME_PREFIX).delete()
+        return deleted
+
+    def timestamp(self, earliest=0.0):
+        offset = earliest + self.rng.random() * max(self.span - earliest, 1)
+        return self.start + timedelta(seconds=offset)
+
+    def create_users(self):
+        rng = self.rng
+        n = self.options['users']
+        password = make_password(SEED_PASSWORD)
+        self.user_ids = array('q')
+        is_therapist = []
+        for batch in batched(range(n), self.batch_size):
+            users = []
+            for i in batch:
+                therapist = rng.random() < self.options['therapist_ratio']
+                is_therapist.append(therapist)
+                username = f'{SEED_USERNAME_PREFIX}{i:07d}'
+                users.append(User(
+                    username=username,
+                    # bulk_create skips User.save(), which sets this
+                    search_key=username.casefold(),
+                    email=f'{username}@example.com',
+                    password=password,
+                    role=User.THERAPIST if therapist else User.PARENT,
+                    bio=' '.join(rng.choices(WORDS, k=rng.randint(0, 12))) or None,
+                    date_joined=self.timestamp(),
+                ))
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                parents, therapists = [], []
+                for user in users:
+                    if user.role == User.THERAPIST:
+                        therapists.append(TherapistProfile(
+                            user_id=user.pk,
+                            license_number=f'LIC-{user.pk:07d}',
+                            specialization=', '.join(rng.sample(SPECIALIZATIONS, rng.randint(1, 3))),
+                            years_of_experience=rng.randint(1, 30),
+                            is_verified=rng.random() < self.options['verified_ratio'],
+                            accepting_clients=rng.random() < 0.8,
+                        ))
+                    else:
+                        parents.append(ParentProfile(
+                            user_id=user.pk,
+                            number_of_children=rng.randint(1, 4),
+                            children_age_range=rng.choice(AGE_RANGES),
+                            concerns=' '.join(rng.choices(WORDS, k=rng.randint(2, 8))),
+                        ))
+                ParentProfile.objects.bulk_create(parents)
+                TherapistProfile.objects.bulk_create(therapists)
+            self.user_ids.extend(user.pk for user in users)
+
+        # therapists attract more followers and engagement than parents
+        boost = [3.0 if therapist else 1.0 for therapist in is_therapist]
+        self.popularity = zipf_cum_weights(n, self.options['alpha'], rng, boost)
+        # how active each account is at posting, commenting and liking
+        self.activity = zipf_cum_weights(n, self.options['alpha'] * 0.8, rng)
+        return n
+
+    def create_follows(self):
+        rng = self.rng
+        Follow = User.following.through
+        mean = self.options['follows_per_user']
+        max_out = min(len(self.user_ids) - 1, 5000)
+        self.follow_pairs = 0
+        created = 0
+
+        def pairs():
+            for follower in self.user_ids:
+                # pareto(2) has mean 2, so halve it to hit the requested mean
+                degree = min(int(rng.paretovariate(2.0) * mean / 2), max_out)
+                targets = set(rng.choices(self.user_ids, cum_weights=self.popularity, k=degree))
+                targets.discard(follower)
+                for target in targets:
+                    yield follower, target
+
+        for batch in batched(pairs(), self.batch_size):
+            with transaction.atomic():
+                Follow.objects.bulk_create(
+                    [Follow(from_user_id=a, to_user_id=b) for a, b in batch],
+                    ignore_conflicts=True,
+                )
+                moments = [self.timestamp() for _ in batch]
+                FollowEvent.objects.bulk_create(
+                    [FollowEvent(follower_id=a, followed_id=b, day=localdate(moment), created_at=moment)
+                     for (a, b), moment in zip(batch, moments)],
+                    ignore_conflicts=True,
+                )
+                self.notify(
+                    Notification(recipient_id=b, sender_id=a, notification_type=Notification.FOLLOW,
+                                 created_at=moment, updated_at=moment)
+                    for (a, b), moment in zip(batch, moments)
+                )
+            created += len(batch)
+        return created
+
+    def create_posts(self):
+        rng = self.rng
+        total = int(len(self.user_ids) * self.options['posts_per_user'])
+        self.post_ids = array('q')
+        self.post_authors = array('q')
+        self.post_times = array('d')
+
+        def posts():
+            authors = rng.choices(self.user_ids, cum_weights=self.activity, k=total)
+            for author in authors:
+                created = self.timestamp()
+                yield Post(
+                    author_id=author,
+                    content=hashtag(rng.choices(WORDS, k=rng.randint(5, 60))),
+                    media_url=f'https://cdn.example.com/{rng.getrandbits(48):x}.jpg' if rng.random() < 0.1 else None,
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        for batch in batched(posts(), self.batch_size):
+            with transaction.atomic():
+                Post.objects.bulk_create(batch)
+            for post in batch:
+                self.post_ids.append(post.pk)
+                self.post_authors.append(post.author_id)
+                self.post_times.append((post.created_at - self.start).total_seconds())
+
+        # a post is as popular as its author
+        index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        total_weight = 0.0
+        self.post_popularity = array('d')
+        for author in self.post_authors:
+            i = index[author]
+            weight = self.popularity[i] - (self.popularity[i - 1] if i else 0.0)
+            total_weight += weight
+            self.post_popularity.append(total_weight)
+        return total
+
+    def pick_engagement(self, per_post):
+        """Yield (post index, actor id) pairs weighted by post and actor popularity."""
+        rng = self.rng
+        total = int(len(self.post_ids) * per_post)
+        for batch in batched(range(total), self.batch_size):
+            posts = rng.choices(range(len(self.post_ids)), cum_weights=self.post_popularity, k=len(batch))
+            actors = rng.choices(self.user_ids, cum_weights=self.activity, k=len(batch))
+            yield from zip(posts, actors)
+
+    def create_comments(self):
+        rng = self.rng
+        created = 0
+        for batch in batched(self.pick_engagement(self.options['comments_per_post']), self.batch_size):
+            comments = [
+                Comment(
+                    post_id=self.post_ids[p],
+                    author_id=actor,
+                    content=' '.join(rng.choices(WORDS, k=rng.randint(3, 30))),
+                    created_at=self.timestamp(self.post_times[p]),
+                )
+                for p, actor in batch
+            ]
+            with transaction.atomic():
+                Comment.objects.bulk_create(comments)
+                Comment.objects.filter(pk__in=[c.pk for c in comments]).update(path=top_level_path())
+                self.notify(
+                    Notification(recipient_id=self.post_authors[p], sender_id=comment.author_id,
+                                 notification_type=Notification.COMMENT, post_id=comment.post_id,
+                                 created_at=comment.created_at, updated_at=comment.created_at)
+                    for (p, _), comment in zip(batch, comments)
+                    if self.post_authors[p] != comment.author_id
+                )
+            created += len(comments)
+        return created
+
+    def create_likes(self):
+        created = 0
+        for batch in batched(self.pick_engagement(self.options['likes_per_post']), self.batch_size):
+            # (user, post) is unique, so drop repeats before inserting
+            unique = {(actor, p): None for p, actor in batch}
+            likes = [
+                Like(user_id=actor, post_id=self.post_ids[p], created_at=self.timestamp(self.post_times[p]))
+                for actor, p in unique
+            ]
+            with transaction.atomic():
+                Like.objects.bulk_create(likes, ignore_conflicts=True)
+                self.notify(
+                    Notification(recipient_id=self.post_authors[p], sender_id=actor,
+                                 notification_type=Notification.LIKE, post_id=self.post_ids[p],
+                                 created_at=like.created_at, updated_at=like.created_at)
+                    for (actor, p), like in zip(unique, likes)
+                    if self.post_authors[p] != actor
+                )
+            created += len(likes)
+        return created
+
+    def notify(self, notifications):
+        if self.options['no_notifications']:
+            return
+        Notification.objects.bulk_create(notifications, batch_size=self.batch_size)
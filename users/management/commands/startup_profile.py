@@ -0,0 +1,111 @@
+"""
+Where a worker's cold start goes.
+
+    python manage.py startup_profile                  # WSGI worker
+    python manage.py startup_profile --entry asgi     # with the async views
+    python manage.py startup_profile --by package --limit 10
+    python manage.py startup_profile --json
+
+Boots a fresh interpreter the way a worker does (django.setup(), the
+middleware chain, then each my_village/warmup.py step) under
+python -X importtime, and reports how long each phase took and which
+imports the time went to: per module (cumulative, so a package
+includes what it imports) or summed per top-level package. This
+process has everything imported already, hence the new interpreter.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# run in the fresh interpreter; prints [(phase, seconds)] as JSON
+BOOT = '''
+import json, sys, time
+start = time.perf_counter()
+phases = []
+def timed(name, fn):
+    began = time.perf_counter()
+    result = fn()
+    phases.append((name, time.perf_counter() - began))
+    return result
+import django
+timed('django.setup()', django.setup)
+if sys.argv[1] == 'asgi':
+    from django.core.asgi import get_asgi_application as get_application
+else:
+    from django.core.wsgi import get_wsgi_application as get_application
+timed('load middleware', get_application)
+from my_village.warmup import warm_up
+phases += [('warm-up: ' + name, seconds) for name, seconds in warm_up()]
+phases.append(('total', time.perf_counter() - start))
+print(json.dumps(phases))
+'''
+
+
+def parse_importtime(stderr):
+    """[(module, self µs, cumulative µs)] from python -X importtime output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((module.strip(), int(own), int(cumulative)))
+    return imports
+
+
+class Command(BaseCommand):
+    help = 'Report the import and initialization time of a freshly booted worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry', choices=['wsgi', 'asgi'], default='wsgi',
+                            help='which application to boot (default: wsgi)')
+        parser.add_argument('--by', choices=['module', 'package'], default='module',
+                            help='list imports per module or per top-level package')
+        parser.add_argument('--limit', type=int, default=20, help='imports to list (default: 20)')
+        parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        if options['entry'] == 'asgi':
+            # as asgi.py does
+            env.setdefault('MY_VILLAGE_ASYNC_VIEWS', '1')
+        child = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT, options['entry']],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        if child.returncode:
+            raise CommandError(f'the worker failed to boot:\n{child.stderr[-2000:]}')
+        phases = json.loads(child.stdout.strip().splitlines()[-1])
+        imports = parse_importtime(child.stderr)
+
+        if options['by'] == 'package':
+            totals = defaultdict(int)
+            for module, own, cumulative in imports:
+                totals[module.split('.')[0]] += own
+            ranked = sorted(((name, total) for name, total in totals.items()), key=lambda r: -r[1])
+        else:
+            ranked = sorted(((module, cumulative) for module, own, cumulative in imports), key=lambda r: -r[1])
+        ranked = ranked[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'entry': options['entry'],
+                'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in phases},
+                'imports_ms': sum(own for _, own, _ in imports) / 1000,
+                'slowest_imports_ms': {name: us / 1000 for name, us in ranked},
+            }, indent=2))
+            return
+
+        self.stdout.write(f'Boot phases ({options["entry"]}):')
+        for name, seconds in phases:
+            self.stdout.write(f'  {seconds * 1000:9.1f} ms  {name}')
+        self.stdout.write(f'\n{len(imports)} modules imported, '
+                          f'{sum(own for _, own, _ in imports) / 1000:.1f} ms in total')
+        label = 'self time, per package' if options['by'] == 'package' else 'cumulative'
+        self.stdout.write(f'Slowest imports ({label}):')
+        for name, us in ranked:
+            self.stdout.write(f'  {us / 1000:9.1f} ms  {name}')
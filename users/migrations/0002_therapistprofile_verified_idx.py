@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='therapistprofile',
+            index=models.Index(fields=['is_verified'], name='therapist_verified_idx'),
+        ),
+    ]
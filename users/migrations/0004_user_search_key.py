@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+def fill_search_keys(apps, schema_editor):
+    # casefold() in Python rather than LOWER() in SQL, so existing rows
+    # get exactly what User.save() writes
+    User = apps.get_model('users', 'User')
+    last_id = 0
+    while True:
+        users = list(User.objects.filter(pk__gt=last_id).order_by('pk').only('pk', 'username')[:2000])
+        if not users:
+            break
+        for user in users:
+            user.search_key = user.username.casefold()
+        User.objects.bulk_update(users, ['search_key'])
+        last_id = users[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_user_deleted_at_deletionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='search_key',
+            field=models.CharField(default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['search_key'], name='user_search_key_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'search_key'], name='user_role_search_idx', opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']),
+        ),
+    ]
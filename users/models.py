@@ -23,10 +23,33 @@ class User(AbstractUser):
         related_name='followers',
         blank=True
     )
+    # set (with is_active=False) when the account is deleted;
+    # users/purge.py removes it and everything it owns later
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    # casefolded username for /api/users/autocomplete/ — a prefix of it
+    # is one range of user_search_key_idx (users/autocomplete.py)
+    search_key = models.CharField(max_length=150, default='', editable=False)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # varchar_pattern_ops lets Postgres use these for LIKE 'q%'
+            # whatever the database collation; other backends ignore it
+            models.Index(fields=['search_key'], name='user_search_key_idx',
+                         opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['role', 'search_key'], name='user_role_search_idx',
+                         opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return f"{self.username} ({self.role})"
 
+    def save(self, *args, **kwargs):
+        self.search_key = self.username.casefold()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'username' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_key'}
+        super().save(*args, **kwargs)
+
     @property
     def is_parent(self):
         return self.role == self.PARENT
@@ -62,5 +85,108 @@ class TherapistProfile(models.Model):
     is_verified = models.BooleanField(default=False)
     accepting_clients = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # the therapist directory only lists verified therapists
+            models.Index(fields=['is_verified'], name='therapist_verified_idx'),
+        ]
+
+    def __str__(self):
+        return f"Therapist Profile: {self.user.username}"
+
+
+class Mute(models.Model):
+    """
+    `user` doesn't want to see `muted`'s posts in their feed and search,
+    or get notified about them. Muted users aren't told.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mutes')
+    muted = models.ForeignKey(User, on_delete=models.CASCADE, related_name='muted_by')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'muted'], name='mute_user_muted_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} muted {self.muted_id}"
+
+
+class Block(models.Model):
+    """
+    A mute that goes both ways: neither side sees the other's posts or
+    notifications, and they can't follow each other (see users/exclusions.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blocks')
+    blocked = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blocked_by')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'blocked'], name='block_user_blocked_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} blocked {self.blocked_id}"
+
+
+class DeletionJob(models.Model):
+    """
+    A soft-deleted user or post waiting for purge_deleted to remove it
+    and its dependents in small chunks (see users/purge.py).
+    `progress` counts the rows handled so far, per step.
+    """
+    USER = 'user'
+    POST = 'post'
+    KIND_CHOICES = [
+        (USER, 'User'),
+        (POST, 'Post'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # bumped after every chunk; a job whose worker stopped bumping it
+    # can be claimed again (chunks are safe to redo)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    progress = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['requested_at']
+
+    def __str__(self):
+        state = 'done' if self.finished_at else 'pending'
+        return f"delete {self.kind} {self.object_id} ({state})"
+
+
+class Tombstone(models.Model):
+    """
+    Something that was deleted, kept for DELTA_SYNC_MAX_AGE so ?since=
+    delta sync can tell clients to drop it (see my_village/delta.py).
+    `owner_id` is whose list it was in: a post's author, a
+    notification's recipient.
+    """
+    POST = 'post'
+    NOTIFICATION = 'notification'
+    STREAM_CHOICES = [
+        (POST, 'Post'),
+        (NOTIFICATION, 'Notification'),
+    ]
+
+    stream = models.CharField(max_length=20, choices=STREAM_CHOICES)
+    owner_id = models.PositiveBigIntegerField()
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stream', 'owner_id', 'deleted_at'], name='tombstone_owner_idx'),
+            # pruning
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
     def __str__(self):
-        return f"Therapist Profile: {self.user.username}"
\ No newline at end of file
+        return f"deleted {self.stream} {self.object_id}"
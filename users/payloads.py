@@ -0,0 +1,33 @@
+"""
+Cached profile payloads for /api/users/profile/<username>/.
+
+A profile reads the same for everyone, so UserSerializer's output is
+built once and shared through the read cache (my_village/cache.py). It
+goes stale when the user or their parent/therapist profile is saved,
+and when they follow, unfollow or are (un)followed, for the counts
+(users/signals.py).
+
+Keys carry the scheme and host the payload was built for, since the
+profile picture's URL in it is absolute.
+"""
+from my_village.batch import memoized
+from my_village.cache import SharedRequest, cached
+from .models import User
+from .serializers import UserSerializer
+
+
+def profile_payload(username, request):
+    """The live user's profile as anyone sees it, or None if there's no such user."""
+
+    def build():
+        # the same memo entry as get_user_or_404() in views.py
+        try:
+            user = memoized(('user', username), lambda: User.objects.get(
+                username=username, deleted_at__isnull=True
+            ))
+        except User.DoesNotExist:
+            return None
+        data = UserSerializer(user, context={'request': SharedRequest(request)}).data
+        return data, [('user', user.pk), ('follows', user.pk)]
+
+    return cached(f'profile:{username}:{request.build_absolute_uri("/")}', build)
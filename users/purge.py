@@ -0,0 +1,233 @@
+"""
+Soft delete now, purge later.
+
+Deleting a post or an account with on_delete=CASCADE removes every
+comment, like and notification hanging off it in one transaction,
+which for a popular post or a prolific user means seconds of locks on
+the busiest tables. Instead:
+
+  * schedule_post_deletion() / schedule_user_deletion() only stamp
+    deleted_at (and deactivate the account), which hides the object
+    from the API right away, and queue a DeletionJob;
+  * the purge_deleted command runs the jobs: each step deletes rows in
+    chunks of PURGE_CHUNK_SIZE, one short transaction per chunk, with a
+    PURGE_CHUNK_PAUSE sleep in between so other writers get the locks.
+
+Steps are ordered so what users see is fixed first: an account's
+follow edges go before anything else (follower counts), then its posts
+are hidden, then its likes and comments on other people's posts
+(like/comment counts), and only then the bulk of its own content.
+
+Every chunk sends chunk_purged inside its transaction, with the model
+and the deleted rows' ids, foreign keys and created_at, for anything
+that keeps its own counters or timelines to adjust them.
+
+Hidden posts and purged notifications leave a Tombstone behind for
+DELTA_SYNC_MAX_AGE, which is how ?since= delta sync tells clients to
+drop them (see my_village/delta.py); purge_deleted prunes old ones.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from my_village.cache import touch
+from my_village.delta import bump
+from notifications.models import Notification
+from posts.models import Post, Comment, Like
+from posts.tags import untag_posts
+from social.models import AuthorDailyStats, FeedFilter, FollowEvent, PostDailyStats
+from .directory import invalidate_directory
+from .models import User, ParentProfile, TherapistProfile, DeletionJob, Tombstone, Mute, Block
+
+# sender=model, rows=[{'id': ..., '<fk>_id': ..., 'created_at': ...}], job
+chunk_purged = Signal()
+
+Follow = User.following.through
+
+
+def schedule_post_deletion(post):
+    """Hide the post now; its comments, likes and notifications go later."""
+    with transaction.atomic():
+        post.deleted_at = timezone.now()
+        post.save(update_fields=['deleted_at', 'updated_at'])
+        untag_posts([post.pk])
+        bury(Tombstone.POST, [(post.author_id, post.pk)])
+        return DeletionJob.objects.create(kind=DeletionJob.POST, object_id=post.pk)
+
+
+def schedule_user_deletion(user):
+    """Log the account out for good and hide it; its data goes later."""
+    with transaction.atomic():
+        user.is_active = False
+        user.deleted_at = timezone.now()
+        user.save(update_fields=['is_active', 'deleted_at'])
+        if user.role == User.THERAPIST:
+            invalidate_directory()
+        # followers' feeds lose this account's posts
+        bump('post', [user.pk])
+        return DeletionJob.objects.create(kind=DeletionJob.USER, object_id=user.pk)
+
+
+def bury(stream, rows):
+    """Leave tombstones for deleted (owner_id, object_id) pairs."""
+    now = timezone.now()
+    Tombstone.objects.bulk_create([
+        Tombstone(stream=stream, owner_id=owner_id, object_id=object_id, deleted_at=now)
+        for owner_id, object_id in rows
+    ])
+
+
+def buried_since(stream, owner_ids, since):
+    """Ids of the owners' objects deleted after `since`."""
+    return list(Tombstone.objects.filter(
+        stream=stream, owner_id__in=owner_ids, deleted_at__gt=since
+    ).values_list('object_id', flat=True))
+
+
+def prune_tombstones():
+    """Drop tombstones no cursor can ask about any more; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'DELTA_SYNC_MAX_AGE', 7 * 86400))
+    pruned, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return pruned
+
+
+def post_steps(post_id):
+    """(name, queryset) pairs that purge a post, in order."""
+    return [
+        ('notifications', Notification.objects.filter(post_id=post_id)),
+        ('likes', Like.objects.filter(post_id=post_id)),
+        ('comments', Comment.objects.filter(post_id=post_id)),
+        ('stats', PostDailyStats.objects.filter(post_id=post_id)),
+        ('posts', Post.all_objects.filter(pk=post_id)),
+    ]
+
+
+def user_steps(user_id):
+    """(name, queryset) pairs that purge an account, in order."""
+    own_posts = Post.all_objects.filter(author_id=user_id).values('pk')
+    return [
+        ('follows', Follow.objects.filter(Q(from_user_id=user_id) | Q(to_user_id=user_id))),
+        ('mutes', Mute.objects.filter(Q(user_id=user_id) | Q(muted_id=user_id))),
+        ('blocks', Block.objects.filter(Q(user_id=user_id) | Q(blocked_id=user_id))),
+        ('hidden_posts', Post.objects.filter(author_id=user_id)),
+        ('likes', Like.objects.filter(user_id=user_id)),
+        ('comments', Comment.objects.filter(author_id=user_id)),
+        # one step per column, so each chunk query can use that column's index
+        ('notifications', Notification.objects.filter(recipient_id=user_id)),
+        ('notifications', Notification.objects.filter(sender_id=user_id)),
+        ('notifications', Notification.objects.filter(post_id__in=own_posts)),
+        ('post_likes', Like.objects.filter(post_id__in=own_posts)),
+        ('post_comments', Comment.objects.filter(post_id__in=own_posts)),
+        ('stats', PostDailyStats.objects.filter(author_id=user_id)),
+        ('stats', AuthorDailyStats.objects.filter(author_id=user_id)),
+        ('stats', FollowEvent.objects.filter(follower_id=user_id)),
+        ('stats', FollowEvent.objects.filter(followed_id=user_id)),
+        ('posts', Post.all_objects.filter(author_id=user_id)),
+        ('profiles', ParentProfile.objects.filter(user_id=user_id)),
+        ('profiles', TherapistProfile.objects.filter(user_id=user_id)),
+        ('feed_filter', FeedFilter.objects.filter(user_id=user_id)),
+        ('users', User.objects.filter(pk=user_id)),
+    ]
+
+
+def pending_jobs():
+    """Unfinished jobs nobody is working on, oldest first."""
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'PURGE_JOB_TIMEOUT', 600))
+    return DeletionJob.objects.filter(finished_at__isnull=True).filter(
+        Q(heartbeat_at__isnull=True) | Q(heartbeat_at__lt=stale)
+    )
+
+
+class Purger:
+    """
+    Runs DeletionJobs. Several purge_deleted processes can run at once:
+    a job is claimed with a conditional UPDATE, so only one of them
+    works on it, and a job whose worker died is picked up again once
+    its heartbeat is PURGE_JOB_TIMEOUT old.
+    """
+
+    def __init__(self, chunk_size=None, pause=None, on_chunk=None):
+        self.chunk_size = chunk_size or getattr(settings, 'PURGE_CHUNK_SIZE', 500)
+        self.pause = getattr(settings, 'PURGE_CHUNK_PAUSE', 0.05) if pause is None else pause
+        # called with (job, step, count) after every chunk, for progress output
+        self.on_chunk = on_chunk
+
+    def run_pending(self, limit=None):
+        """Run claimable jobs until there are none left (or `limit` ran)."""
+        done = 0
+        while limit is None or done < limit:
+            job = next((job for job in pending_jobs()[:10] if self.claim(job)), None)
+            if job is None:
+                break
+            self.run(job)
+            done += 1
+        return done
+
+    def claim(self, job):
+        now = timezone.now()
+        claimed = DeletionJob.objects.filter(
+            pk=job.pk, finished_at__isnull=True, heartbeat_at=job.heartbeat_at,
+        ).update(heartbeat_at=now, started_at=job.started_at or now)
+        if claimed:
+            job.heartbeat_at = now
+            job.started_at = job.started_at or now
+        return bool(claimed)
+
+    def run(self, job):
+        steps = user_steps(job.object_id) if job.kind == DeletionJob.USER else post_steps(job.object_id)
+        for name, queryset in steps:
+            if name == 'hidden_posts':
+                self.hide_posts(job, queryset)
+            else:
+                self.purge(job, name, queryset)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['finished_at'])
+
+    def chunks(self, queryset):
+        """Primary keys of the next chunk, until the queryset is empty."""
+        while True:
+            pks = list(queryset.order_by().values_list('pk', flat=True)[:self.chunk_size])
+            if not pks:
+                return
+            yield pks
+            if len(pks) == self.chunk_size and self.pause:
+                time.sleep(self.pause)
+
+    def purge(self, job, name, queryset):
+        model = queryset.model
+        fields = [model._meta.pk.attname] + [
+            field.attname for field in model._meta.concrete_fields
+            if field.is_relation or field.name == 'created_at'
+        ]
+        for pks in self.chunks(queryset):
+            with transaction.atomic():
+                rows = model._base_manager.filter(pk__in=pks)
+                deleted = list(rows.values(*fields))
+                # delete() still cascades to anything a step above missed
+                rows.delete()
+                chunk_purged.send(sender=model, rows=deleted, job=job)
+                self.progress(job, name, len(deleted))
+
+    def hide_posts(self, job, queryset):
+        # posts leave search, timelines and lists before they're purged
+        now = timezone.now()
+        for pks in self.chunks(queryset):
+            with transaction.atomic():
+                hidden = Post.all_objects.filter(pk__in=pks).update(deleted_at=now, updated_at=now)
+                untag_posts(pks)
+                bury(Tombstone.POST, [(job.object_id, pk) for pk in pks])
+                bump('post', [job.object_id])
+                touch('post', pks)
+                self.progress(job, 'hidden_posts', hidden)
+
+    def progress(self, job, name, count):
+        job.progress[name] = job.progress.get(name, 0) + count
+        job.heartbeat_at = timezone.now()
+        DeletionJob.objects.filter(pk=job.pk).update(progress=job.progress, heartbeat_at=job.heartbeat_at)
+        if self.on_chunk is not None:
+            self.on_chunk(job, name, count)
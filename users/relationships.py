@@ -0,0 +1,63 @@
+"""
+Follow buttons for lists of users.
+
+relationships(user, ids) answers "do I follow them, do they follow
+me" for a whole batch of users with two queries on the follow table,
+one per direction (its unique (from_user, to_user) index and its
+to_user index), however many users there are.
+
+RelationshipMixin adds the answers to every row of a user list page as
+is_following and follows_you, after the page is serialized, so it works
+the same on the regular and the fast path. /api/users/relationships/
+serves them for any ids the client already holds, e.g. search results
+or post authors.
+"""
+from my_village.fieldsets import requested_fieldset
+from .models import User
+
+Follow = User.following.through
+
+FIELDS = ('is_following', 'follows_you')
+
+# most ids /api/users/relationships/?ids= takes at once
+MAX_IDS = 100
+
+
+def relationships(user, ids):
+    """{id: {'is_following': bool, 'follows_you': bool}} for each of the ids."""
+    ids = list(dict.fromkeys(ids))
+    following = followers = set()
+    if user.is_authenticated and ids:
+        following = set(Follow.objects.filter(
+            from_user=user, to_user_id__in=ids
+        ).values_list('to_user_id', flat=True))
+        followers = set(Follow.objects.filter(
+            to_user=user, from_user_id__in=ids
+        ).values_list('from_user_id', flat=True))
+    return {pk: {'is_following': pk in following, 'follows_you': pk in followers} for pk in ids}
+
+
+class RelationshipMixin:
+    """
+    ListAPIView mixin for lists of users: adds is_following and
+    follows_you to each row. With ?fields=, only the ones asked for,
+    and only on rows that include their id.
+    """
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        fields = FIELDS
+        fieldset = requested_fieldset(request)
+        if fieldset is not None:
+            fields = [name for name in FIELDS if name in fieldset[0]]
+        rows = response.data
+        if isinstance(rows, dict):
+            rows = rows.get('results', [])
+        rows = [row for row in rows if 'id' in row]
+        if fields and rows:
+            found = relationships(request.user, [row['id'] for row in rows])
+            for row in rows:
+                for name in fields:
+                    row[name] = found[row['id']][name]
+        return response
+
@@ -1,9 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from my_village.cache import touch
+from my_village.fastpath import count_related
+from my_village.fieldsets import SparseFieldsetMixin
 from .models import User, ParentProfile, TherapistProfile
 
 
-class ParentProfileSerializer(serializers.ModelSerializer):
+class ParentProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     ModelSerializer automatically generates fields from the model.
     """
@@ -12,7 +15,7 @@ class ParentProfileSerializer(serializers.ModelSerializer):
         fields = ['number_of_children', 'children_age_range', 'concerns']
 
 
-class TherapistProfileSerializer(serializers.ModelSerializer):
+class TherapistProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = TherapistProfile
         fields = [
@@ -27,12 +30,15 @@ class TherapistProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['is_verified']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     This is the READ serializer — used when returning user data
     in responses. It is never used for creating or updating users.
     Separating read and write serializers keeps each one focused
     and prevents accidentally exposing write logic in read responses.
+
+    Supports ?fields= / ?expand= (see my_village/fieldsets.py), so list
+    clients can skip the profiles and follower counts they don't show.
     """
     parent_profile = ParentProfileSerializer(read_only=True)
     therapist_profile = TherapistProfileSerializer(read_only=True)
@@ -40,6 +46,13 @@ class UserSerializer(serializers.ModelSerializer):
     followers_count = serializers.SerializerMethodField()
     following_count = serializers.SerializerMethodField()
 
+    # SQL versions of the method fields for the values() fast path
+    # used by list views (my_village/fastpath.py)
+    fast_fields = {
+        'followers_count': count_related(User.following.through, 'to_user'),
+        'following_count': count_related(User.following.through, 'from_user'),
+    }
+
     class Meta:
         model = User
         fields = [
@@ -62,6 +75,17 @@ class UserSerializer(serializers.ModelSerializer):
         return obj.following.count()
 
 
+class UserSuggestionSerializer(serializers.ModelSerializer):
+    # the few fields a typeahead row shows; followed/verified are set
+    # on each user by users/autocomplete.py
+    followed = serializers.BooleanField(read_only=True)
+    verified = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'role', 'profile_picture', 'followed', 'verified']
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     """
     This is the WRITE serializer — only used for registration.
@@ -170,4 +194,8 @@ class UpdateUserSerializer(serializers.ModelSerializer):
         if therapist_data and instance.is_therapist:
             TherapistProfile.objects.filter(user=instance).update(**therapist_data)
 
+        if parent_data or therapist_data:
+            # update() skips the signals that make cached profiles stale
+            touch('user', [instance.pk])
+
         return instance
\ No newline at end of file
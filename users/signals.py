@@ -1,12 +1,58 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
+from my_village.cache import touch
+from my_village.delta import bump
+from .directory import invalidate_directory
 from .models import User, ParentProfile, TherapistProfile
+from .purge import Follow, chunk_purged
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
+    # cached profiles and the posts that show this user as author
+    touch('user', [instance.pk])
     if created:
         if instance.role == User.PARENT:
             ParentProfile.objects.create(user=instance)
         elif instance.role == User.THERAPIST:
-            TherapistProfile.objects.create(user=instance)
\ No newline at end of file
+            TherapistProfile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=TherapistProfile)
+@receiver(post_delete, sender=TherapistProfile)
+def therapist_changed(sender, instance, **kwargs):
+    # verification or a removed profile changes who the directory lists
+    invalidate_directory()
+
+
+@receiver(post_save, sender=ParentProfile)
+@receiver(post_delete, sender=ParentProfile)
+@receiver(post_save, sender=TherapistProfile)
+@receiver(post_delete, sender=TherapistProfile)
+def profile_changed(sender, instance, **kwargs):
+    touch('user', [instance.user_id])
+
+
+@receiver(m2m_changed, sender=Follow)
+def follows_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # whoever followed or unfollowed has a different feed now
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump('follow', [instance.pk])
+    elif pk_set is not None:
+        bump('follow', pk_set)
+    else:
+        bump('follow', Follow.objects.filter(to_user=instance).values_list('from_user_id', flat=True))
+    # and both sides' follower counts moved
+    others = pk_set
+    if others is None:
+        column = 'from_user_id' if reverse else 'to_user_id'
+        others = Follow.objects.filter(**{'to_user' if reverse else 'from_user': instance}).values_list(column, flat=True)
+    touch('follows', [instance.pk, *others])
+
+
+@receiver(chunk_purged, sender=Follow)
+def follows_purged(sender, rows, job, **kwargs):
+    bump('follow', [row['from_user_id'] for row in rows])
+    touch('follows', [row[column] for row in rows for column in ('from_user_id', 'to_user_id')])
@@ -1,3 +1,717 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+import time
+import threading
+from datetime import timedelta
+from importlib.util import find_spec
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from my_village.admin import EstimatedCountPaginator
+from my_village.batch import BatchView
+from my_village.fastpath import _plans
+from my_village.metrics import registry
+from my_village.profiling import PROFILE_HEADER, ProfilingMiddleware, make_profile_token
+from my_village.query_plans import QueryPlanAssertions
+from my_village.warmup import view_classes, warm_up
+from notifications.models import Notification
+from posts.models import Post, Comment, Like
+from posts.tests import make_village
+from . import hashing
+from .autocomplete import candidates
+from .exclusions import _excluded_ids, excluded_ids, toggle_mute
+from .management.commands.startup_profile import parse_importtime
+from .models import User, Block, DeletionJob, Mute, TherapistProfile, Tombstone
+from .purge import Purger, schedule_user_deletion
+from .relationships import Follow
+from .serializers import UserSerializer
+from .views import AsyncUserProfileView, TherapistListView
+
+
+def ndjson(response):
+    body = b''.join(response.streaming_content)
+    if response.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+
+    def test_my_data(self):
+        response = self.client.get('/api/users/me/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = ndjson(response)
+        types = [r['type'] for r in records]
+        self.assertEqual(types, ['users', 'follows', 'follows', 'posts', 'comments', 'likes'])
+        self.assertEqual(records[0]['username'], 'jane')
+        self.assertIn('email', records[0])
+        self.assertTrue(all(r.get('author_id', self.parent.pk) == self.parent.pk for r in records))
+
+    def test_resume_from_cursor(self):
+        records = ndjson(self.client.get('/api/users/me/export/'))
+        cursor = f"{records[1]['type']}:{records[1]['id']}"
+        rest = ndjson(self.client.get('/api/users/me/export/', {'cursor': cursor}))
+        self.assertEqual(rest, records[2:])
+
+    def test_gzip_and_csv(self):
+        response = self.client.get('/api/users/me/export/', {'type': 'posts,likes'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        # what the client saves is the decoded body, so no .gz
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="export.ndjson"')
+        self.assertEqual([r['type'] for r in ndjson(response)], ['posts', 'likes'])
+
+        response = self.client.get('/api/users/me/export/', {'type': 'posts', 'output': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,author_id,content,media_url,created_at,updated_at')
+        self.assertEqual(len(lines), 2)
+
+    def test_bad_parameters(self):
+        for params in ({'type': 'passwords'}, {'cursor': 'posts:x'}, {'output': 'csv'}):
+            self.assertEqual(self.client.get('/api/users/me/export/', params).status_code, 400, params)
+
+    def test_platform_export_is_staff_only(self):
+        self.assertEqual(self.client.get('/api/users/export/').status_code, 403)
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        self.client.force_authenticate(staff)
+        records = ndjson(self.client.get('/api/users/export/', {'type': 'users'}))
+        self.assertEqual(len(records), User.objects.count())
+        self.assertNotIn('email', records[0])
+
+
+class BatchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        Notification.objects.create(recipient=cls.parent, sender=cls.therapist,
+                                     notification_type=Notification.FOLLOW)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.parent).access_token}')
+
+    def batch(self, *requests):
+        response = self.client.post('/api/batch/', {'requests': list(requests)}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['responses']
+
+    def test_app_launch(self):
+        paths = ['/api/users/profile/jane/', '/api/social/feed/', '/api/notifications/',
+                 '/api/users/jane/following/']
+        responses = self.batch(*[{'method': 'GET', 'path': path} for path in paths])
+        for path, sub in zip(paths, responses):
+            single = self.client.get(path)
+            self.assertEqual(sub['status'], single.status_code, path)
+            self.assertEqual(sub['body'], single.json(), path)
+            self.assertEqual(sub['headers']['Content-Type'], 'application/json')
+
+    def test_batch_user_is_not_looked_up_again(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.batch({'path': '/api/users/profile/jane/'}, {'path': '/api/users/jane/following/'},
+                       {'path': '/api/users/dr_smith/followers/'}, {'path': '/api/users/profile/dr_smith/'})
+        lookups = [q['sql'] for q in queries if '"username" =' in q['sql']]
+        self.assertEqual(len(lookups), 1, lookups)
+
+    def test_exclusions_are_read_once(self):
+        exclusions = mock.patch('users.exclusions._excluded_ids', wraps=_excluded_ids)
+        with exclusions as read:
+            self.batch({'path': '/api/social/feed/'}, {'path': '/api/social/search/?q=e'},
+                       {'path': '/api/social/feed/?page=2'})
+        self.assertEqual(read.call_count, 1)
+        # a write in between (the mute) reads them again
+        with exclusions as read:
+            responses = self.batch({'path': '/api/social/feed/'},
+                                   {'method': 'POST', 'path': '/api/users/mute/admin/'},
+                                   {'path': '/api/social/feed/'})
+        self.assertEqual(read.call_count, 2)
+        self.assertEqual({post['author']['username'] for post in responses[2]['body']['results']}, {'dr_smith'})
+
+    def test_writes_are_barriers(self):
+        responses = self.batch(
+            {'path': '/api/notifications/'},
+            {'method': 'POST', 'path': '/api/notifications/read-all/'},
+            {'path': '/api/notifications/'},
+            {'method': 'PATCH', 'path': '/api/users/profile/jane/', 'body': {'bio': 'Mum of three'}},
+            {'path': '/api/users/profile/jane/'},
+        )
+        self.assertFalse(responses[0]['body']['results'][0]['is_read'])
+        self.assertTrue(responses[2]['body']['results'][0]['is_read'])
+        self.assertEqual(responses[4]['body']['bio'], 'Mum of three')
+
+    def test_bad_sub_requests(self):
+        responses = self.batch(
+            {'path': '/admin/'}, {'path': '/api/nope/'}, {'method': 'TRACE', 'path': '/api/posts/'},
+            {'method': 'POST', 'path': '/api/batch/', 'body': {'requests': []}},
+            {'path': '/api/users/profile/nobody/'},
+        )
+        self.assertEqual([r['status'] for r in responses], [400, 404, 405, 400, 404])
+
+    def test_limits(self):
+        self.assertEqual(self.client.post('/api/batch/', {'requests': []}, format='json').status_code, 400)
+        with self.settings(BATCH_MAX_REQUESTS=2):
+            response = self.client.post('/api/batch/', {'requests': [{'path': '/api/posts/'}] * 3}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.client.credentials()
+        self.assertEqual(self.client.post('/api/batch/', {'requests': [{'path': '/api/posts/'}]},
+                                          format='json').status_code, 401)
+
+
+class ConcurrentBatchTests(TransactionTestCase):
+    # committed data, so the worker threads' connections can see it
+
+    def test_reads_run_concurrently(self):
+        parent, therapist, admin = make_village()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(parent).access_token}')
+        paths = ['/api/users/profile/jane/', '/api/social/feed/', '/api/posts/', '/api/users/jane/following/']
+        threads = set()
+        original = BatchView.call
+
+        def call(view, request, spec):
+            threads.add(threading.get_ident())
+            return original(view, request, spec)
+
+        with mock.patch.object(BatchView, 'call', call):
+            response = client.post('/api/batch/', {'requests': [{'path': p} for p in paths]}, format='json')
+        self.assertGreater(len(threads), 1)
+        for path, sub in zip(paths, response.json()['responses']):
+            self.assertEqual(sub['body'], client.get(path).json(), path)
+
+
+class AccountDeletionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.therapist).access_token}')
+
+    def test_delete_account(self):
+        Notification.objects.create(recipient=self.parent, sender=self.therapist,
+                                    notification_type=Notification.FOLLOW)
+        self.assertEqual(self.client.delete('/api/users/profile/dr_smith/').status_code, 204)
+
+        # gone from the API straight away, token included
+        self.assertEqual(self.client.get('/api/users/profile/jane/').status_code, 401)
+        reader = APIClient()
+        reader.force_authenticate(self.parent)
+        self.assertEqual(reader.get('/api/users/profile/dr_smith/').status_code, 404)
+        self.assertEqual(reader.get('/api/users/therapists/').json()['count'], 0)
+        self.assertEqual(reader.get('/api/users/jane/following/').json()['count'], 1)
+        self.assertEqual(reader.get('/api/social/feed/').json()['count'], 1)
+
+        out = StringIO()
+        call_command('purge_deleted', '--status', stdout=out)
+        self.assertIn(f'user {self.therapist.pk}: queued', out.getvalue())
+        call_command('purge_deleted', '--chunk-size', '1', '--pause', '0', stdout=out)
+        self.assertIn('1 job(s) finished', out.getvalue())
+
+        self.assertFalse(User.objects.filter(pk=self.therapist.pk).exists())
+        self.assertFalse(Post.all_objects.filter(author_id=self.therapist.pk).exists())
+        self.assertFalse(Comment.objects.filter(author_id=self.therapist.pk).exists())
+        self.assertFalse(Like.objects.filter(post__author_id=self.therapist.pk).exists())
+        self.assertFalse(Notification.objects.filter(sender_id=self.therapist.pk).exists())
+        self.assertEqual(Post.objects.count(), 2)
+        progress = DeletionJob.objects.get().progress
+        self.assertEqual(progress['follows'], 2)
+        self.assertEqual(progress['hidden_posts'], 1)
+        self.assertEqual(progress['users'], 1)
+
+    def test_only_your_own_account(self):
+        self.assertEqual(self.client.delete('/api/users/profile/jane/').status_code, 403)
+        self.assertIsNone(User.objects.get(pk=self.parent.pk).deleted_at)
+
+    def test_abandoned_job_is_taken_over(self):
+        job = schedule_user_deletion(self.admin)
+        purger = Purger(pause=0)
+        self.assertTrue(purger.claim(job))
+        # a second worker can't have it while the first one is alive
+        self.assertEqual(Purger(pause=0).run_pending(), 0)
+        DeletionJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(Purger(pause=0).run_pending(), 1)
+        self.assertFalse(User.objects.filter(pk=self.admin.pk).exists())
+
+
+class WarmUpTests(TestCase):
+
+    def test_warm_up(self):
+        _plans.clear()
+        steps = [name for name, seconds in warm_up()]
+        self.assertEqual(steps, ['urls', 'models', 'serializers', 'translations', 'jwt', 'connections'])
+        self.assertIn(UserSerializer, _plans)
+        # the serializers of the views behind async routes too
+        self.assertIn(AsyncUserProfileView.sync_view, view_classes())
+
+    def test_parse_importtime(self):
+        stderr = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |     orjson\n'
+            'import time:      2040 |       2160 |   my_village.renderers\n'
+            'some other warning\n'
+        )
+        self.assertEqual(parse_importtime(stderr), [('orjson', 120, 120), ('my_village.renderers', 2040, 2160)])
+
+
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+
+    def test_per_view_counters(self):
+        for _ in range(2):
+            response = self.client.get('/api/users/therapists/')
+        self.assertEqual(self.client.get('/api/posts/999999/').status_code, 404)
+
+        stats = registry._stats[('therapists', 'GET')]
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(stats.statuses, {200: 2})
+        self.assertEqual(sum(stats.buckets), 2)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(stats.query_duration, 0)
+        self.assertGreater(stats.render_duration, 0)
+        self.assertLessEqual(stats.render_duration, stats.duration)
+        self.assertEqual(stats.response_bytes, 2 * len(response.content))
+        self.assertEqual(registry._stats[('post-detail', 'GET')].statuses, {404: 1})
+
+    def test_prometheus_text(self):
+        registry.observe('feed', 'GET', 200, 0.02, queries=3, query_duration=0.004,
+                         render_duration=0.001, response_bytes=512)
+        registry.observe('feed', 'GET', 429, 7.0)
+        registry.observe('we"ird', 'POST', 201, 0.001)
+        lines = registry.render().splitlines()
+        labels = 'view="feed",method="GET"'
+        for line in [
+            '# TYPE myvillage_request_duration_seconds histogram',
+            f'myvillage_request_duration_seconds_bucket{{{labels},le="0.01"}} 0',
+            f'myvillage_request_duration_seconds_bucket{{{labels},le="0.025"}} 1',
+            f'myvillage_request_duration_seconds_bucket{{{labels},le="5.0"}} 1',
+            f'myvillage_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+            f'myvillage_request_duration_seconds_count{{{labels}}} 2',
+            f'myvillage_requests_total{{{labels},status="200"}} 1',
+            f'myvillage_requests_total{{{labels},status="429"}} 1',
+            f'myvillage_db_queries_total{{{labels}}} 3',
+            f'myvillage_response_bytes_total{{{labels}}} 512',
+            'myvillage_requests_total{view="we\\"ird",method="POST",status="201"} 1',
+        ]:
+            self.assertIn(line, lines)
+
+    def test_token(self):
+        self.client.force_authenticate(None)
+        with self.settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(METRICS_TOKEN='', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with self.settings(METRICS_TOKEN='s3cret', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            bad = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer nope')
+            self.assertEqual(bad.status_code, 401)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'myvillage_requests_total', response.content)
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = Path(tmp.name)
+
+    def middleware(self, **overrides):
+        options = {'PROFILE_DIR': self.directory, 'PROFILE_SAMPLE_RATE': 0.0,
+                   'PROFILE_HEADER_ENABLED': True, 'PROFILE_MAX_FILES': 50, **overrides}
+        with self.settings(**options):
+            return ProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+    def profiled(self, middleware, **headers):
+        before = set(self.directory.glob('*.pstats'))
+        middleware(RequestFactory().get('/api/social/feed/', headers=headers))
+        return len(set(self.directory.glob('*.pstats')) - before)
+
+    def test_off_without_a_trigger(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            self.middleware(PROFILE_HEADER_ENABLED=False)
+
+    def test_signed_header(self):
+        middleware = self.middleware()
+        token = make_profile_token()
+        self.assertEqual(self.profiled(middleware), 0)
+        self.assertEqual(self.profiled(middleware, **{PROFILE_HEADER: token}), 1)
+        info = json.loads(next(self.directory.glob('*.json')).read_text())
+        self.assertEqual((info['method'], info['path'], info['status']), ('GET', '/api/social/feed/', 200))
+
+        tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        self.assertEqual(self.profiled(middleware, **{PROFILE_HEADER: tampered}), 0)
+        with mock.patch('time.time', return_value=time.time() - 7200):
+            expired = make_profile_token()
+        with self.settings(PROFILE_TOKEN_MAX_AGE=3600):
+            self.assertEqual(self.profiled(middleware, **{PROFILE_HEADER: expired}), 0)
+        # a signed header means nothing while the header trigger is off
+        sampled_only = self.middleware(PROFILE_HEADER_ENABLED=False, PROFILE_SAMPLE_RATE=0.001)
+        with mock.patch('my_village.profiling.random.random', return_value=0.5):
+            self.assertEqual(self.profiled(sampled_only, **{PROFILE_HEADER: token}), 0)
+
+    def test_sample_rate(self):
+        middleware = self.middleware(PROFILE_HEADER_ENABLED=False, PROFILE_SAMPLE_RATE=0.25)
+        with mock.patch('my_village.profiling.random.random', return_value=0.5):
+            self.assertEqual(self.profiled(middleware), 0)
+        with mock.patch('my_village.profiling.random.random', return_value=0.1):
+            self.assertEqual(self.profiled(middleware), 1)
+
+    def test_ring_keeps_the_newest(self):
+        for stem in ['20260101-000000.000-1-a', '20260101-000001.000-1-b', '20260101-000002.000-1-c']:
+            (self.directory / f'{stem}.pstats').touch()
+            (self.directory / f'{stem}.json').touch()
+        self.middleware(PROFILE_MAX_FILES=2).prune()
+        self.assertEqual(sorted(path.name for path in self.directory.iterdir()), [
+            '20260101-000001.000-1-b.json', '20260101-000001.000-1-b.pstats',
+            '20260101-000002.000-1-c.json', '20260101-000002.000-1-c.pstats',
+        ])
+        self.middleware(PROFILE_MAX_FILES=0).prune()
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+
+class AdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        cls.staff = User.objects.create_superuser('root', 'root@example.com', 'x')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def test_changelists_query_count_is_flat(self):
+        pages = ['users/user', 'users/parentprofile', 'users/therapistprofile', 'users/deletionjob',
+                 'users/tombstone', 'posts/post', 'posts/comment', 'posts/like', 'posts/tag', 'posts/posttag',
+                 'notifications/notification', 'social/feedfilter', 'social/postactivitybucket',
+                 'social/authordailystats', 'social/postdailystats', 'users/mute', 'users/block']
+        for page in pages:
+            url = f'/admin/{page}/'
+            with CaptureQueriesContext(connection) as few:
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+            make_village_rows(self.parent, self.therapist)
+            with CaptureQueriesContext(connection) as more:
+                self.client.get(url)
+            self.assertEqual(len(more), len(few), url)
+
+    def test_bulk_verify(self):
+        other = User.objects.create_user(username='dr_new', password='x', role=User.THERAPIST)
+        api = APIClient()
+        api.force_authenticate(self.parent)
+        self.assertEqual(api.get('/api/users/therapists/').json()['count'], 1)
+
+        profiles = TherapistProfile.objects.filter(user__in=[self.therapist, other])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/admin/users/therapistprofile/', {
+                'action': 'verify_selected', '_selected_action': [p.pk for p in profiles],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(sum(q['sql'].startswith('UPDATE') for q in queries), 1)
+        # the cached directory count moved on with the verification
+        self.assertEqual(api.get('/api/users/therapists/').json()['count'], 2)
+
+    def test_mute_admin_moves_the_exclusions(self):
+        toggle_mute(self.parent, self.admin)
+        self.assertEqual(excluded_ids(self.parent), {self.admin.pk})
+        mute = Mute.objects.get()
+        response = self.client.post(f'/admin/users/mute/{mute.pk}/change/', {
+            'user': self.parent.pk, 'muted': self.therapist.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(excluded_ids(self.parent), {self.therapist.pk})
+        response = self.client.post('/admin/users/mute/', {
+            'action': 'delete_selected', '_selected_action': [mute.pk], 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(excluded_ids(self.parent), frozenset())
+
+    def test_directory_count_is_cached(self):
+        api = APIClient()
+        api.force_authenticate(self.parent)
+        api.get('/api/users/therapists/')
+        with CaptureQueriesContext(connection) as queries:
+            api.get('/api/users/therapists/')
+        # (the serializer still counts each therapist's followers)
+        self.assertFalse(any('"__count"' in q['sql'] and 'is_verified' in q['sql'] for q in queries))
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=2)
+    def test_estimated_count_paginator(self):
+        self.assertEqual(EstimatedCountPaginator(User.objects.order_by('pk'), 10).count, 2)
+        self.assertEqual(EstimatedCountPaginator(User.objects.filter(username='jane').order_by('pk'), 10).count, 1)
+
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent, cls.therapist, cls.admin = make_village()
+        # dr_smith is verified and dr_jones isn't; jane follows dr_who only
+        for name in ['Dr_Adams', 'dr_jones', 'dr_who', 'drew']:
+            User.objects.create_user(username=name, password='x', role=User.THERAPIST)
+        cls.parent.following.set([User.objects.get(username='dr_who')])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+
+    def names(self, q, **params):
+        response = self.client.get('/api/users/autocomplete/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['username'] for row in response.json()]
+
+    def test_ranking(self):
+        response = self.client.get('/api/users/autocomplete/', {'q': 'dr'})
+        rows = response.json()
+        self.assertEqual([row['username'] for row in rows],
+                         ['dr_who', 'dr_smith', 'Dr_Adams', 'dr_jones', 'drew'])
+        self.assertTrue(rows[0]['followed'])
+        self.assertTrue(rows[1]['verified'])
+        self.assertFalse(rows[2]['followed'] or rows[2]['verified'])
+        self.assertEqual(self.names('dr', limit=2), ['dr_who', 'dr_smith'])
+
+    def test_verified_past_the_limit(self):
+        # dr_who is followed and verified, but sorts after dr_smith, so
+        # the verified tier cut at limit=1 doesn't reach them
+        TherapistProfile.objects.filter(user__username='dr_who').update(is_verified=True)
+        rows = self.client.get('/api/users/autocomplete/', {'q': 'dr', 'limit': 1}).json()
+        self.assertEqual([(row['username'], row['followed'], row['verified']) for row in rows],
+                         [('dr_who', True, True)])
+        rows = self.client.get('/api/users/autocomplete/', {'q': 'dr'}).json()
+        self.assertEqual([row['username'] for row in rows if row['verified']], ['dr_who', 'dr_smith'])
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.names('@DR_A'), ['Dr_Adams'])
+        self.assertEqual(self.names('dr_'), ['dr_who', 'dr_smith', 'Dr_Adams', 'dr_jones'])
+        self.assertEqual(self.names('dre'), ['drew'])
+        self.assertEqual(self.names(''), [])
+        self.assertEqual(self.names('zz'), [])
+
+    def test_hidden_users(self):
+        # yourself, deactivated and deleted accounts never come up
+        self.assertEqual(self.names('jan'), [])
+        User.objects.filter(username='drew').update(is_active=False)
+        schedule_user_deletion(User.objects.get(username='dr_jones'))
+        self.assertEqual(self.names('dr'), ['dr_who', 'dr_smith', 'Dr_Adams'])
+
+    def test_search_key_follows_renames(self):
+        user = User.objects.get(username='drew')
+        user.username = 'Andrew'
+        user.save(update_fields=['username'])
+        self.assertEqual(User.objects.get(pk=user.pk).search_key, 'andrew')
+        self.assertEqual(self.names('AND'), ['Andrew'])
+
+
+class RelationshipTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # jane follows dr_smith and admin; dr_smith follows jane back
+        cls.parent, cls.therapist, cls.admin = make_village()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.parent)
+
+    def rows(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['username']: (row.get('is_following'), row.get('follows_you'))
+                for row in response.json()['results']}
+
+    def test_user_lists(self):
+        for fast in (False, True):
+            with self.subTest(fast=fast), self.settings(FAST_LIST_SERIALIZATION=fast):
+                self.assertEqual(self.rows('/api/users/jane/following/'),
+                                 {'dr_smith': (True, True), 'admin': (True, False)})
+                self.assertEqual(self.rows('/api/users/dr_smith/followers/'), {'jane': (False, False)})
+                self.assertEqual(self.rows('/api/users/therapists/'), {'dr_smith': (True, True)})
+                self.assertEqual(self.rows('/api/users/jane/following/', fields='id,username,follows_you'),
+                                 {'dr_smith': (None, True), 'admin': (None, False)})
+
+    def test_queries_per_page_are_flat(self):
+        def relationship_queries(path):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(path)
+            return len([q for q in queries if q['sql'].startswith('SELECT "users_user_following"')])
+        self.assertEqual(relationship_queries('/api/users/dr_smith/followers/'), 2)
+        for n in range(5):
+            User.objects.create_user(username=f'fan{n}', password='x').following.add(self.therapist)
+        self.assertEqual(relationship_queries('/api/users/dr_smith/followers/'), 2)
+
+    def test_relationships_endpoint(self):
+        ids = [self.therapist.pk, self.admin.pk, self.parent.pk, 999999, self.therapist.pk]
+        response = self.client.get('/api/users/relationships/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.json(), [
+            {'id': self.therapist.pk, 'is_following': True, 'follows_you': True},
+            {'id': self.admin.pk, 'is_following': True, 'follows_you': False},
+            {'id': self.parent.pk, 'is_following': False, 'follows_you': False},
+            {'id': 999999, 'is_following': False, 'follows_you': False},
+        ])
+        for ids in ['', 'a,b', ','.join(['1'] * 101)]:
+            response = self.client.get('/api/users/relationships/', {'ids': ids})
+            self.assertEqual(response.status_code, 400, ids)
+            self.assertIn('error', response.json())
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/users/relationships/', {'ids': '1'}).status_code, 401)
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000, PASSWORD_HASHING_WORKERS=2)
+class LoginTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='jane', password='s3cret-pass')
+
+    def login(self, password='s3cret-pass', username='jane'):
+        return self.client.post('/api/users/login/', {'username': username, 'password': password}, format='json')
+
+    def test_hashes_in_the_pool(self):
+        threads = []
+        verify = hashing._verify
+
+        def spy(*args):
+            threads.append(threading.current_thread().name)
+            return verify(*args)
+
+        with mock.patch('users.hashing._verify', side_effect=spy):
+            response = self.login()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(set(response.json()), {'access', 'refresh'})
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('password-hashing'))
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(self.login(username='nobody').status_code, 401)
+
+    def test_inline_without_workers(self):
+        with self.settings(PASSWORD_HASHING_WORKERS=0):
+            self.assertEqual(self.login().status_code, 200)
+            self.assertEqual(self.login('wrong').status_code, 401)
+
+    def test_old_hashes_are_upgraded_on_login(self):
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=500):
+            self.user.set_password('s3cret-pass')
+            self.user.save()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$500$'))
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$500$'))
+
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+        # and off a hasher that's only kept for checking
+        with self.settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']):
+            self.user.set_password('s3cret-pass')
+            self.user.save()
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_MAX_WAITING=0)
+    def test_full_pool_turns_logins_away(self):
+        pool, slots = hashing._get_pool()
+        slots.acquire()
+        try:
+            response = self.login()
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertIn('error', response.json())
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_MAX_WAITING=0)
+    def test_full_pool_turns_admin_logins_away(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        pool, slots = hashing._get_pool()
+        slots.acquire()
+        try:
+            response = self.client.post('/admin/login/', {'username': 'jane', 'password': 's3cret-pass'})
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    @skipUnless(find_spec('argon2'), 'argon2-cffi is not installed')
+    def test_argon2_profile(self):
+        profile = ['users.hashing.TunedArgon2PasswordHasher', 'users.hashing.TunedPBKDF2PasswordHasher']
+        with self.settings(PASSWORD_HASHERS=profile,
+                           PASSWORD_ARGON2={'time_cost': 1, 'memory_cost': 1024, 'parallelism': 1}):
+            self.assertEqual(self.login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('argon2$argon2id$v=19$m=1024,t=1,p=1$'))
+            self.assertEqual(self.login().status_code, 200)
+
+
+def make_village_rows(parent, therapist):
+    # one more of everything a changelist might show
+    from posts.models import Tag, PostTag
+    from social.models import AuthorDailyStats, FeedFilter, PostActivityBucket, PostDailyStats
+    post = Post.objects.create(author=therapist, content='more')
+    Comment.objects.create(author=parent, post=post, content='more')
+    Like.objects.create(user=parent, post=post)
+    tag, _ = Tag.objects.get_or_create(name=f'tag{post.pk}')
+    PostTag.objects.create(tag=tag, post=post, created_at=post.created_at)
+    Notification.objects.create(recipient=therapist, sender=parent, notification_type=Notification.LIKE, post=post)
+    PostActivityBucket.objects.create(post=post, bucket_start=post.created_at)
+    AuthorDailyStats.objects.create(author=therapist, day=post.created_at.date() - timedelta(days=post.pk))
+    PostDailyStats.objects.create(post=post, author=therapist, day=post.created_at.date())
+    user = User.objects.create_user(username=f'extra{post.pk}', password='x', role=User.THERAPIST)
+    FeedFilter.objects.create(user=user)
+    Mute.objects.create(user=user, muted=parent)
+    Block.objects.create(user=user, blocked=therapist)
+    DeletionJob.objects.create(kind=DeletionJob.POST, object_id=post.pk)
+    Tombstone.objects.create(stream=Tombstone.POST, owner_id=therapist.pk, object_id=post.pk, deleted_at=post.created_at)
+
+
+class QueryPlanTests(QueryPlanAssertions, TestCase):
+
+    def test_therapist_directory(self):
+        parent, therapist, admin = make_village()
+        self.assertViewIndexed(TherapistListView, parent)
+
+    def test_relationships(self):
+        parent, therapist, admin = make_village()
+        self.assertIndexed(Follow.objects.filter(from_user=parent, to_user_id__in=[therapist.pk, admin.pk]))
+        self.assertIndexed(Follow.objects.filter(to_user=parent, from_user_id__in=[therapist.pk, admin.pk]))
+
+    def test_autocomplete(self):
+        parent, therapist, admin = make_village()
+        self.assertIndexed(candidates('dr')[:10])
+        self.assertIndexed(candidates('dr').filter(
+            role=User.THERAPIST, therapist_profile__is_verified=True)[:10])
+        # read from the searcher's follow list, so only that is sorted
+        self.assertIndexed(candidates('dr').filter(followers=parent)[:10], allow=['sort'])
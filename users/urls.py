@@ -1,17 +1,27 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
+from my_village.async_views import read_view
 from . import views
 
 urlpatterns = [
     path('register/', views.RegisterView.as_view(), name='register'),
     # login returns access + refresh tokens
     # refresh swaps an old refresh token for a new access token
-    path('login/', TokenObtainPairView.as_view(), name='login'),
+    path('login/', views.LoginView.as_view(), name='login'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
-    path('profile/<str:username>/', views.UserProfileView.as_view(), name='profile'),
+    path('profile/<str:username>/', read_view(views.AsyncUserProfileView), name='profile'),
     path('follow/<str:username>/', views.FollowUserView.as_view(), name='follow'),
+    path('mute/<str:username>/', views.MuteUserView.as_view(), name='mute'),
+    path('block/<str:username>/', views.BlockUserView.as_view(), name='block'),
     path('therapists/', views.TherapistListView.as_view(), name='therapists'),
+    path('autocomplete/', views.UserAutocompleteView.as_view(), name='autocomplete'),
+    path('relationships/', views.RelationshipsView.as_view(), name='relationships'),
+    path('me/export/', views.MyDataExportView.as_view(), name='export-my-data'),
+    path('me/stats/', views.MyStatsView.as_view(), name='my-stats'),
+    path('me/muted/', views.MutedUsersView.as_view(), name='muted'),
+    path('me/blocked/', views.BlockedUsersView.as_view(), name='blocked'),
+    path('export/', views.PlatformExportView.as_view(), name='export-platform'),
     path('<str:username>/followers/', views.UserFollowersView.as_view(), name='followers'),
     path('<str:username>/following/', views.UserFollowingView.as_view(), name='following'),
 ]
\ No newline at end of file
@@ -2,14 +2,39 @@ from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from .autocomplete import suggest
+from .directory import DirectoryPagination
+from .exclusions import blocked_between, toggle_block, toggle_mute
+from .exports import Export, ExportError, parse_types
 from .models import User, TherapistProfile
+from .payloads import profile_payload
+from .purge import schedule_user_deletion
+from .relationships import MAX_IDS, RelationshipMixin, relationships
 from .serializers import (
     RegisterSerializer,
     UserSerializer,
-    UpdateUserSerializer
+    UpdateUserSerializer,
+    UserSuggestionSerializer
 )
-from notifications.models import Notification
+from notifications.fanout import notify
+from social.stats import MAX_DAYS, author_stats, record_follow
+from my_village.batch import memoized
+from my_village.fastpath import FastListMixin
+from my_village.async_views import AsyncDetailView
+from my_village.cache import read_cache_enabled
+from my_village.params import parse_ids
+
+
+def get_user_or_404(username):
+    # inside /api/batch/ each username is only looked up once per batch
+    # deleted accounts are gone as far as the API is concerned
+    return memoized(('user', username), lambda: get_object_or_404(
+        User, username=username, deleted_at__isnull=True
+    ))
 
 
 class RegisterView(generics.CreateAPIView):
@@ -35,13 +60,20 @@ class RegisterView(generics.CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
-class UserProfileView(generics.RetrieveUpdateAPIView):
+class LoginView(TokenObtainPairView):
+    """
+    The password is checked in the hashing pool (users/hashing.py). When
+    that's full, the login is turned away with a 503 instead of queued.
+    """
+
+
+class UserProfileView(generics.RetrieveUpdateDestroyAPIView):
     # anyone logged in can view a profile
-    # but you can only edit your own
+    # but you can only edit (or delete) your own
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     lookup_field = 'username'
-    queryset = User.objects.all()
+    queryset = User.objects.filter(deleted_at__isnull=True)
 
     def get_serializer_class(self):
         # swap to the update serializer on PATCH/PUT requests
@@ -49,6 +81,24 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
             return UpdateUserSerializer
         return UserSerializer
 
+    def get_object(self):
+        user = get_user_or_404(self.kwargs['username'])
+        self.check_object_permissions(self.request, user)
+        return user
+
+    def retrieve(self, request, *args, **kwargs):
+        data = self.cached_read()
+        if data is None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(data)
+
+    def cached_read(self):
+        # profiles read the same for everyone: served from the read
+        # cache, see users/payloads.py
+        if not read_cache_enabled(self.request):
+            return None
+        return profile_payload(self.kwargs['username'], self.request)
+
     def update(self, request, *args, **kwargs):
         if self.get_object() != request.user:
             return Response(
@@ -57,12 +107,29 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
             )
         return super().update(request, *args, **kwargs)
 
+    def destroy(self, request, *args, **kwargs):
+        if self.get_object() != request.user:
+            return Response(
+                {"error": "You can only delete your own account."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        # the account disappears now, its posts and the rest are
+        # removed in the background by purge_deleted
+        schedule_user_deletion(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AsyncUserProfileView(AsyncDetailView):
+    # served under ASGI; profiles are public like the sync view
+    sync_view = UserProfileView
+    allow_anonymous = True
+
 
 class FollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, username):
-        target = get_object_or_404(User, username=username)
+        target = get_user_or_404(username)
 
         if target == request.user:
             return Response(
@@ -74,47 +141,196 @@ class FollowUserView(APIView):
             # already following — so unfollow
             request.user.following.remove(target)
             return Response({"status": "unfollowed", "user": username})
+        elif blocked_between(request.user, target):
+            return Response(
+                {"error": "You can't follow this user."},
+                status=status.HTTP_403_FORBIDDEN
+            )
         else:
             request.user.following.add(target)
+            record_follow(request.user, target)
 
             # notify the person who just got followed
-            Notification.objects.create(
-                recipient=target,
-                sender=request.user,
-                notification_type='follow'
-            )
+            notify(target, request.user, 'follow')
 
             return Response({"status": "followed", "user": username})
 
 
-class TherapistListView(generics.ListAPIView):
+class MuteUserView(APIView):
+    # toggles, like follow: their posts leave your feed and search,
+    # and they can't notify you; they aren't told
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, username):
+        target = get_user_or_404(username)
+        if target == request.user:
+            return Response(
+                {"error": "You can't mute yourself."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        muted = toggle_mute(request.user, target)
+        return Response({"status": "muted" if muted else "unmuted", "user": username})
+
+
+class BlockUserView(APIView):
+    # toggles; a block works both ways and unfollows you from each other
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, username):
+        target = get_user_or_404(username)
+        if target == request.user:
+            return Response(
+                {"error": "You can't block yourself."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        blocked = toggle_block(request.user, target)
+        return Response({"status": "blocked" if blocked else "unblocked", "user": username})
+
+
+class MutedUsersView(FastListMixin, generics.ListAPIView):
+    # who you've muted, most recent first
+    serializer_class = UserSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return User.objects.filter(
+            muted_by__user=self.request.user, deleted_at__isnull=True
+        ).order_by('-muted_by__created_at')
+
+
+class BlockedUsersView(FastListMixin, generics.ListAPIView):
+    # who you've blocked, most recent first
+    serializer_class = UserSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return User.objects.filter(
+            blocked_by__user=self.request.user, deleted_at__isnull=True
+        ).order_by('-blocked_by__created_at')
+
+
+class TherapistListView(RelationshipMixin, FastListMixin, generics.ListAPIView):
     # parents use this to discover therapists
     # we only surface verified ones — unverified shouldn't appear
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # the total is cached until a therapist is (un)verified or leaves
+    pagination_class = DirectoryPagination
 
     def get_queryset(self):
+        # start from the verified profiles so the is_verified index
+        # drives the query rather than a scan of every user
+        verified = TherapistProfile.objects.filter(is_verified=True)
         return User.objects.filter(
             role=User.THERAPIST,
-            therapist_profile__is_verified=True
+            therapist_profile__in=verified,
+            deleted_at__isnull=True
         )
 
 
-class UserFollowersView(generics.ListAPIView):
+class RelationshipsView(APIView):
+    # follow button state for a batch of users: ?ids=3,7,12 (max 100)
+    # answered with two queries on the follow table, whatever the batch
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            ids = parse_ids(request.query_params.get('ids'), MAX_IDS)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        found = relationships(request.user, ids)
+        return Response([{'id': pk, **found[pk]} for pk in found])
+
+
+class UserAutocompleteView(APIView):
+    # type-as-you-go user search: ?q=ja&limit=10 (max 20)
+    # people you follow first, then verified therapists, then everyone
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 20)
+        except ValueError:
+            limit = 10
+        users = suggest(request.user, request.query_params.get('q', ''), limit)
+        serializer = UserSuggestionSerializer(users, many=True, context={'request': request})
+        return Response(serializer.data)
+
+
+class UserFollowersView(RelationshipMixin, FastListMixin, generics.ListAPIView):
     # returns everyone following a given user
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs['username'])
-        return user.followers.all()
+        user = get_user_or_404(self.kwargs['username'])
+        return user.followers.filter(deleted_at__isnull=True)
 
 
-class UserFollowingView(generics.ListAPIView):
+class UserFollowingView(RelationshipMixin, FastListMixin, generics.ListAPIView):
     # returns everyone a given user follows
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs['username'])
-        return user.following.all()
\ No newline at end of file
+        user = get_user_or_404(self.kwargs['username'])
+        return user.following.filter(deleted_at__isnull=True)
+
+
+class ExportView(APIView):
+    # streams the export row by row — never builds it in memory
+    # ?type=posts,comments  ?output=ndjson|csv  ?cursor=posts:123
+    # (not ?format=, DRF reserves that for picking a renderer)
+    # gzipped on the fly when the client accepts gzip
+    throttle_scope = 'export'
+
+    def get(self, request):
+        params = request.query_params
+        gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+        try:
+            export = Export(
+                types=parse_types(params.get('type')),
+                fmt=params.get('output', 'ndjson'),
+                user=self.get_export_user(request),
+                cursor=params.get('cursor'),
+                gzip=gzip,
+            )
+        except ExportError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(export, content_type=export.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{export.filename}"'
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def get_export_user(self, request):
+        return request.user
+
+
+class MyDataExportView(ExportView):
+    # everything the logged-in user has created, plus their account
+    permission_classes = [permissions.IsAuthenticated]
+
+
+class MyStatsView(APIView):
+    # likes, comments and new followers per day: ?days=30 (max 365)
+    # read from the daily rollups only, see social/stats.py
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = 30
+        days = min(max(days, 1), MAX_DAYS)
+        return Response(author_stats(request.user, days))
+
+
+class PlatformExportView(ExportView):
+    # whole-platform dump for analytics — staff only, no emails
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_export_user(self, request):
+        return None